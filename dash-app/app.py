@@ -9,15 +9,28 @@ Vivien van Dongen
 Modify this script to suit color preferences & various directory setups.
 """
 import os
+import threading
 import dash
 import plotly.graph_objects as go
 import plotly.io as pio
 
+import static_bundle
+from response_cache import ResponseCache
+from stale_requests import StaleRequests
+from metrics import CallbackMetrics
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__)) # absolute path to parent directory, aka dashboard_app
-INPUT_DIR = os.path.join(BASE_DIR, 'output-data/')  # data stored from model.py
+INPUT_DIR = os.environ.get("DATA_DIR", os.path.join(BASE_DIR, 'output-data/'))  # data stored from model.py, DATA_DIR to use another copy
 TITLE = "Searching for the Essentials"
 COLOR_PALETTE_CATEGORICAL = ["#419d78", "#13262f", "#de6449", "#eac435", "#6d9dc5", "#a74482", "#f5e5fc"]
 COLOR_PALETTE_GRADIENT = ["#73cfaa", "#0f6b46"]
+FIGURE_CACHE_MB = int(os.environ.get("FIGURE_CACHE_MB", 64))  # memory cap for cached figures, per cache
+WARM_FIGURE_CACHE = os.environ.get("WARM_FIGURE_CACHE", "0") == "1"  # prebuild every figure when warming up
+CLIENTSIDE_SCRUBBING = os.environ.get("CLIENTSIDE_SCRUBBING", "0") == "1"  # draw the food map in the browser
+RESPONSE_CACHE_MB = int(os.environ.get("RESPONSE_CACHE_MB", 64))  # memory cap for cached callback responses
+DATA_VERSION_CHECK_SECONDS = float(os.environ.get("DATA_VERSION_CHECK_SECONDS", 5))  # how often workers look for newly published data
+SLOW_CALLBACK_MS = int(os.environ.get("SLOW_CALLBACK_MS", 1000))  # log callbacks slower than this
+WARM_UP = os.environ.get("WARM_UP", "background")  # when pages load their data: background, preload or lazy, see pages.py
 
 ###########################
 # Creating and Setting our Base Theme
@@ -26,60 +39,75 @@ config = {'displaylogo': False, 'scrollZoom': False, 'displayModeBar': False}
 base_font = dict(family='Work Sans, Roboto, Helvetica, HelveticaNeue, Open Sans, sans-serif', size=15, color="#111111")
 base_colorway = COLOR_PALETTE_CATEGORICAL  # from config.ini, pulled in above
 
-base_theme_fig = go.Figure(
-    layout={
-        'font': base_font,
-        'colorway': base_colorway,
-        'xaxis': {'tickfont': {'color': '#707070'}},
-        'yaxis': {'tickfont': {'color': '#707070'}},
-    }
-)
-
-# Uncomment if in Draft Mode
-# base_theme_fig.layout.annotations = [
-#    dict(
-#        name="draft watermark",
-#        text="DRAFT",
-#        textangle=-30,
-#        opacity=0.1,
-#        font=dict(color="black", size=100),
-#        xref="paper",
-#        yref="paper",
-#        x=0.5,
-#        y=0.5,
-#        showarrow=False,
-#    )
-#]
-
-base_theme_fig.update_layout(
-    xaxis_tickfont_size=14,
-    template="plotly_white",
-    title={
-        'y': .3,
-        'x': 0.5,
-        'xanchor': 'left',
-        'yanchor': 'top'
-    },
-    paper_bgcolor='rgba(0,0,0,0)',
-    plot_bgcolor='rgba(0,0,0,0)',
-    margin=dict(t=20, l=20, r=20, b=20, pad=20)
-)
-
-# Axis Titles & Labels to Dark Gray
-base_theme_fig.update_yaxes(color="#505050")
-base_theme_fig.update_xaxes(color="#505050")
-
-# Setting our Theme to Default
-templated_base_theme = pio.to_templated(base_theme_fig)
-pio.templates['base_theme'] = templated_base_theme.layout.template
-pio.templates.default = "base_theme"
+_theme_lock = threading.Lock()
+
+
+def use_base_theme():
+    """
+    Build our theme & make it plotly's default, once. Pages call it before making their figures,
+    building the first figure takes plotly a while, so it's kept out of the import.
+    """
+    with _theme_lock:
+        if pio.templates.default == "base_theme":
+            return
+        base_theme_fig = go.Figure(
+            layout={
+                'font': base_font,
+                'colorway': base_colorway,
+                'xaxis': {'tickfont': {'color': '#707070'}},
+                'yaxis': {'tickfont': {'color': '#707070'}},
+            }
+        )
+
+        # Uncomment if in Draft Mode
+        # base_theme_fig.layout.annotations = [
+        #    dict(
+        #        name="draft watermark",
+        #        text="DRAFT",
+        #        textangle=-30,
+        #        opacity=0.1,
+        #        font=dict(color="black", size=100),
+        #        xref="paper",
+        #        yref="paper",
+        #        x=0.5,
+        #        y=0.5,
+        #        showarrow=False,
+        #    )
+        #]
+
+        base_theme_fig.update_layout(
+            xaxis_tickfont_size=14,
+            template="plotly_white",
+            title={
+                'y': .3,
+                'x': 0.5,
+                'xanchor': 'left',
+                'yanchor': 'top'
+            },
+            paper_bgcolor='rgba(0,0,0,0)',
+            plot_bgcolor='rgba(0,0,0,0)',
+            margin=dict(t=20, l=20, r=20, b=20, pad=20)
+        )
+
+        # Axis Titles & Labels to Dark Gray
+        base_theme_fig.update_yaxes(color="#505050")
+        base_theme_fig.update_xaxes(color="#505050")
+
+        # Setting our Theme to Default
+        templated_base_theme = pio.to_templated(base_theme_fig)
+        pio.templates['base_theme'] = templated_base_theme.layout.template
+        pio.templates.default = "base_theme"
+
 
 ###########################
 # BASE DASH APP FLASK SETUP
 ###########################
-external_scripts = ['https://ajax.googleapis.com/ajax/libs/jquery/3.5.1/jquery.min.js'] # jquery is used for URL / Navigation highlight
 external_stylesheets = ['https://codepen.io/chriddyp/pen/bWLwgP.css']
-app = dash.Dash(__name__, external_scripts=external_scripts)
+app = dash.Dash(__name__)
+static_bundle.init_app(app.server)  # fonts, icon sprite & nav script, see static_bundle.py
+response_cache = ResponseCache(RESPONSE_CACHE_MB * 1024 * 1024)  # pages add their callbacks, index.py switches it on
+stale_requests = StaleRequests()  # skips superseded slider requests, pages add their callbacks
+metrics = CallbackMetrics(SLOW_CALLBACK_MS)  # callback timings on /metrics, see metrics.py
 app.config.suppress_callback_exceptions = True  # see https://community.plotly.com/t/dcc-tabs-filling-tabs-with-dynamic-content-how-to-organize-the-callbacks/6377
 #server = app.server  # necessary for WSGI server
 
@@ -87,6 +115,16 @@ app.config.suppress_callback_exceptions = True  # see https://community.plotly.c
 # LAYOUT
 ###########################
 app.title = TITLE
+# Self-hosted fonts once fetched into the bundle, otherwise Google Fonts as before
+if static_bundle.url('fonts.css'):
+    font_links = f'<link href="{static_bundle.url("fonts.css")}" rel="stylesheet">'
+else:
+    # loaded without holding up the first paint, the text shows in the fallback fonts until they're in
+    font_links = '<link rel="preconnect" href="https://fonts.gstatic.com">' + ''.join(
+        f'<link href="{stylesheet}" rel="stylesheet" media="print" onload="this.media=\'all\'">'
+        f'<noscript><link href="{stylesheet}" rel="stylesheet"></noscript>'
+        for stylesheet in static_bundle.FONT_STYLESHEETS)
+
 app.index_string = '''
 <!DOCTYPE html>
 <html>
@@ -95,11 +133,7 @@ app.index_string = '''
         <title>{%title%}</title>
         {%favicon%}
         {%css%}
-        <link rel="preconnect" href="https://fonts.gstatic.com">
-        <link href="https://fonts.googleapis.com/css?family=Roboto:300,400,700,900|Roboto+Mono|Economica:300,400,700&display=swap" rel="stylesheet">
-        <link href="https://fonts.googleapis.com/css?family=Monoton&display=swap" rel="stylesheet">
-        <link href="https://fonts.googleapis.com/css?family=Playfair+Display:300,400,700,900&display=swap" rel="stylesheet">
-        <link href="https://fonts.googleapis.com/css2?family=Work+Sans:ital,wght@0,100;0,300;0,900;1,100&display=swap" rel="stylesheet">
+        ''' + font_links + '''
         <meta name="viewport" content="width=device-width, initial-scale=1, shrink-to-fit=yes">
     </head>
     <body>
@@ -108,6 +142,7 @@ app.index_string = '''
             {%config%}
             {%scripts%}
             {%renderer%}
+            <script src="''' + static_bundle.url('navigation.js') + '''" defer></script>
         </footer>
     </body>
 </html>
@@ -7,183 +7,268 @@ Vivien van Dongen
 
 """
 
-import os
+import functools
+import itertools
+import logging
 import pandas as pd
+from types import SimpleNamespace
 
 import dash_core_components as dcc
 import dash_html_components as html
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State, ClientsideFunction
+from dash.exceptions import PreventUpdate
 import plotly.express as px
 
-from app import app, INPUT_DIR
+from app import app, response_cache, metrics, use_base_theme, FIGURE_CACHE_MB
+import datastore
+from figure_cache import FigureCache
+import pages
 
 try:
     ###########################
     # READ IN DATA
     ###########################
-    parse_dates = ['date']  # need the correct format
-    trends_df = pd.read_csv(INPUT_DIR + 'google-trends-difference-terms-ordered.csv', parse_dates=parse_dates)
-    trends_df = trends_df[trends_df.score_difference.notna()]
-    trends_df["score_difference"] = trends_df["score_difference"].astype("int")
-    trends_df["orig_score_diff"] = trends_df["score_difference"]
-    trends_df['date_str'] = trends_df['date'].astype(str)
-
-    # World Health Organization Covid Data
-    who_trends_df = pd.read_csv(INPUT_DIR + 'data_who_clean.csv', )
-    who_trends_df["date"] = pd.to_datetime(who_trends_df.Date_reported, format="%d/%m/%Y")
-
-    # Start in January when WHO COVID data is starting
-    trends_df = trends_df[trends_df["date"] >= who_trends_df["date"].min()]
+    # Countries with data, from the registry in output-data/countries.csv
+    # (the WHO data & the trends' dates are read when the page is first used, see load())
+    country_options, selected_countries = datastore.country_options()
 
 
     ###########################
     # PREP
     ###########################
-    display_terms = {'baking': 'baking',
-                     'bananabread': 'banana bread',
-                     'beans': 'beans',
-                     'coffee': 'coffee',
-                     'cooking': 'cooking',
-                     'facemask': 'face mask',
-                     'grocerydelivery': 'grocery delivery',
-                     'hand-sanitizer': 'hand sanitizer',
-                     'pasta': 'pasta',
-                     'restaurant': 'restaurant',
-                     'rice': 'rice',
-                     'spices': 'spices',
-                     'takeaway': 'takeaway',
-                     'to-go': 'to go',
-                     'toiletpaper': 'toilet paper'
-                     }
-
-    trends_df["display_term"] = trends_df.term.map(display_terms)
-    trends_df["renamed_term"] = trends_df["display_term"]
-
-
-    if os.name == 'nt':
-        ICON_DIR = os.getcwd() + '\\dash-app\\assets\\icons\\'  # for windows users
-    else:
-        ICON_DIR = './assets/icons/'
-
-    icons = []
-    for name in os.listdir(ICON_DIR):
-        if name.endswith(".svg"):
-            icons.append(ICON_DIR + name)
-
-
-    who_linefig = px.line(who_trends_df,
-         x="date",
-         y="Nom_new_cases", 
-         color="Country",
-         line_shape="spline",
-         hover_name="Country",
-         labels={"Nom_new_cases":"COVID-19 Cases per 100.000 Inhabitants",
-                    "date":""},
-    )
-
-    who_linefig.update_layout(
-        legend=dict(
-            yanchor="top",
-            y=0.99,
-            xanchor="left",
-            x=0.01
+    # POLAR FRAMES
+    # One date of the polar chart is built at a time, when the slider asks for it
+    polar_cache = FigureCache(FIGURE_CACHE_MB * 1024 * 1024)
+    metrics.register_cache("polar", polar_cache)
+
+    def build_polar_slider(polar_dates):
+        return dcc.Slider(
+            id='polar-date-slider',
+            min=0,
+            max=len(polar_dates) - 1,
+            value=0,
+            marks={i: pd.to_datetime(date).strftime('%d/%m/%y') for i, date in enumerate(polar_dates)},
+            included=False,
+            updatemode='mouseup'
+        )
+
+    def build_who_linefig(who_trends_df):
+        who_linefig = px.line(who_trends_df,
+             x="date",
+             y="Nom_new_cases", 
+             color="Country",
+             line_shape="spline",
+             hover_name="Country",
+             labels={"Nom_new_cases":"COVID-19 Cases per 100.000 Inhabitants",
+                        "date":""},
         )
-    )
+
+        who_linefig.update_layout(
+            legend=dict(
+                yanchor="top",
+                y=0.99,
+                xanchor="left",
+                x=0.01
+            )
+        )
+        return who_linefig
 
     ###########################
     # LAYOUT TO BE USED IN INDEX.PY
     ###########################
-    layout = html.Div(
-        className="viz-card viz-card--country centered flex-one",
-        children=[
-            html.H4("Select a Country",
-                    className="viz-card__header viz-card__header--timeseries"),
-            html.Div(
-                # Because of a bug in the dash system, need a wrapper div
-                className="viz-card__controller viz-card__controller--template",
-                children=[
-                    dcc.Dropdown(
-                        id='country-dropdown',
-                        options=[
-                            {'label': 'Germany', 'value': 'ger'},
-                            {'label': 'The United Kingdom', 'value': 'uk'},
-                            {'label': 'The Netherlands', 'value': 'nl'}
-                        ],
-                        value=['ger', 'uk', 'nl'],
-                        multi=True,
-                        clearable=False,
-                        searchable=False
-                    )
-                ]
-            ),
-            html.H4(id="polar-title"),
-            html.Div(
-                className="row flex",
-                children=[
-                    dcc.Graph(
-                        id="polar-chart",
-                        className="centered flex-one"
-                    ),
-                    dcc.Graph(id="joy-graph",
-                              className='viz-card__graph viz-card__graph--timeseries flex-one')
-                ]
-            ),
-            html.H4("COVID-19 Infection Rate"),
-            html.Div(
-                className="viz-card__header viz-card__header--timeseries",
-                # className="viz-card flex-one",
-                children=[
-                    dcc.Graph(
-                        figure=who_linefig
-                    )
-                ]
-            )
-        ]
-    )
+    def build_layout(polar_slider, who_linefig):
+        return html.Div(
+            className="viz-card viz-card--country centered flex-one",
+            children=[
+                html.H4("Select a Country",
+                        className="viz-card__header viz-card__header--timeseries"),
+                html.Div(
+                    # Because of a bug in the dash system, need a wrapper div
+                    className="viz-card__controller viz-card__controller--template",
+                    children=[
+                        dcc.Dropdown(
+                            id='country-dropdown',
+                            options=country_options,
+                            value=selected_countries,
+                            multi=True,
+                            clearable=False,
+                            searchable=False
+                        )
+                    ]
+                ),
+                html.H4(id="polar-title"),
+                html.Div(
+                    className="row flex",
+                    children=[
+                        html.Div(
+                            className="centered flex-one",
+                            children=[
+                                dcc.Graph(id="polar-chart"),
+                                html.Div(
+                                    className="row",
+                                    children=[
+                                        html.Button("\u25B6", id="polar-play", className="nav__link"),
+                                        html.Div(className="flex-one", children=[polar_slider]),
+                                    ]
+                                ),
+                                dcc.Interval(id="polar-interval", interval=500, disabled=True),
+                            ]
+                        ),
+                        dcc.Graph(id="joy-graph",
+                                  className='viz-card__graph viz-card__graph--timeseries flex-one')
+                    ]
+                ),
+                html.H4("COVID-19 Infection Rate"),
+                html.Div(
+                    className="viz-card__header viz-card__header--timeseries",
+                    # className="viz-card flex-one",
+                    children=[
+                        dcc.Graph(
+                            figure=who_linefig
+                        )
+                    ]
+                )
+            ]
+        )
+
+    ###########################
+    # LOADING, ON FIRST USE
+    ###########################
+    def prepare():
+        """Read the WHO data & the trends' dates & build the page's layout, see pages.py."""
+        use_base_theme()
+        # World Health Organization Covid Data
+        who_trends_df = datastore.who()
+
+        # Start in January when WHO COVID data is starting
+        start_date = who_trends_df["date"].min()
+        polar_dates = [date.strftime('%Y-%m-%d') for date in datastore.trend_dates() if date >= start_date]
+        return SimpleNamespace(
+            start_date=start_date,
+            polar_dates=polar_dates,
+            layout=build_layout(build_polar_slider(polar_dates), build_who_linefig(who_trends_df)),
+        )
+
+    load = pages.lazy(prepare)
+
+    def reload():
+        """Forget the loaded page & its figures, see pages.reload."""
+        load.reset()
+        polar_series.cache_clear()
+        polar_cache.clear()
+
+    def warm():
+        """Load the page & the trends of the countries it opens with."""
+        load()
+        for country in selected_countries:
+            datastore.country_sums(country)
+
+    def snapshot_values(max_countries=3, **options):
+        """
+        Every value the inputs of this page's callbacks can take, for snapshot_site.py.
+
+        The dropdown keeps countries in the order they're picked, so that's every ordering
+        of up to max_countries countries.
+        """
+        countries = [option['value'] for option in country_options]
+        selections = [list(selection) for size in range(1, min(max_countries, len(countries)) + 1)
+                      for selection in itertools.permutations(countries, size)]
+        return {
+            ("country-dropdown", "value"): selections,
+            ("polar-date-slider", "value"): list(range(len(load().polar_dates))),
+        }
 
     ###########################
     # CALLBACK FUNCTIONS, IF ANY
     ###########################
     @app.callback(
         [Output('polar-title', 'children'),
-         Output('polar-chart', 'figure'),
          Output('joy-graph', 'figure')],
         [Input("country-dropdown", 'value')])
+    @metrics.timed
     def map_clicked(selected_country):
-        # H3 Header
-        abbr_dict = {
-            'ger': 'Germany',
-            'uk': 'the United Kingdom',
-            'nl': 'the Netherlands',
-        }
-
+        if not selected_country:
+            raise PreventUpdate  # the dropdown was emptied, keep showing the last selection
         if type(selected_country) != list: # want a standard input format regardless of number items selected by user
             selected_country = [selected_country]
 
-        # Filter By Selected Country
-        selected_country_df = trends_df[trends_df['country'].isin(selected_country)]
-        selected_country_df['display_country'] = selected_country_df['country'].map(abbr_dict)
-        
+        # Mean over the selected countries, added up from their precomputed sums & counts
+        with metrics.phase("filter"):
+            selected_country_df_agg = datastore.get_country_means(selected_country, start=load().start_date)
+            selected_country_df_agg = selected_country_df_agg.rename(columns={"score_difference": "orig_score_diff"})
+
         # Polar Header
-        polar_header = f"Comparative Search Trends for {' & '.join([abbr_dict[x] for x in selected_country])}"
+        polar_header = f"Comparative Search Trends for {' & '.join([datastore.COUNTRY_NAMES[x] for x in selected_country])}"
+
+        # Facet Plot
+        with metrics.phase("figure"):
+            facet_fig = build_facet_figure(selected_country_df_agg)
+
+        return polar_header, facet_fig
+
+    def build_facet_figure(selected_country_df_agg):
+        """Line per term of the selected countries' mean score differences."""
+        facet_fig = px.line(selected_country_df_agg,
+                            x='date', y='orig_score_diff',
+                            hover_data={
+                                "display_term": True,
+                                "date": True,
+                                "orig_score_diff": True,
+                            },
+                            facet_col='display_term',
+                            facet_col_wrap=3)
+        facet_fig.for_each_annotation(lambda a: a.update(text=a.text.split("=")[-1]))
+        facet_fig.update_yaxes(title=None, showticklabels=False)
+        facet_fig.update_xaxes(title=None)
+        facet_fig.update_traces(
+            hovertemplate="<b>%{customdata[0]}</b><br>%{x}<br>Score Difference from Previous Year: %{y:0f}<extra></extra>",
+            line_color = "#a0a0a0"
+        )
+        # print("plotly express hovertemplate:", facet_fig.data[0].hovertemplate)
+        return facet_fig
+
+    response_cache.cache_callback([Output('polar-title', 'children'), Output('joy-graph', 'figure')])
+
+    @functools.lru_cache(maxsize=32)
+    def polar_series(countries):
+        """
+        The rows of a sorted tuple of countries by date_str, & the radius range over all of them.
+
+        Read once per selection, so stepping through the dates only looks up their rows.
+        """
+        country_df = datastore.get_country_series(list(countries), start=load().start_date)
+        score_range = [country_df["score_difference"].min(), country_df["score_difference"].max()]
+        return dict(tuple(country_df.groupby("date_str"))), country_df.iloc[0:0], score_range
+
+    def build_polar_frame(selected_country, date_selected):
+        """Polar chart of the selected countries on a single date."""
+        # Keep the radius fixed across dates, over the selected countries' scores
+        with metrics.phase("filter"):
+            frames, empty_frame, score_range = polar_series(tuple(sorted(selected_country)))
+            frame_df = frames.get(date_selected, empty_frame)
 
         # Make Polar Chart
+        with metrics.phase("figure"):
+            return style_polar_frame(frame_df, score_range)
+
+    def style_polar_frame(frame_df, score_range):
+        """Polar chart of one date's rows, with a fixed radius range."""
         polar_fig = px.line_polar(
-            selected_country_df,
+            frame_df,
             r="score_difference",
-            theta="renamed_term",
+            theta="display_term",
             color="display_country",
-            category_orders={'country': ['ger', 'nl', 'uk']},
+            category_orders={'display_country': [datastore.COUNTRY_NAMES[x] for x in datastore.available_countries()]},
             line_close=True,
             line_shape="spline",
-            range_r=[min(trends_df["orig_score_diff"]), max(trends_df["orig_score_diff"])],
+            range_r=score_range,
             render_mode="auto",
-            animation_frame="date_str",
+            hover_data={"date_str": True},
             width=600,
             height=600,
             labels={"date_str": "Date ",
                     "country": "Country ",
-                    "renamed_term": "Term ",
+                    "display_term": "Term ",
                     "score_difference": 'Search term popularity value'},
         )
         polar_fig.update_layout(
@@ -196,36 +281,41 @@ try:
                         y=-0.15
                         )
         )
+        return polar_fig
 
-        # Facet Plot
-        selected_country_df_agg = selected_country_df.groupby(["date", "display_term"], as_index=False).mean()
-        selected_country_df["orig_score_diff"] = selected_country_df["orig_score_diff"].astype(float)
-        facet_fig = px.line(selected_country_df_agg,
-                            x='date', y='orig_score_diff',
-                            hover_data={
-                                "display_term": True,
-                                "date": True,
-                                "orig_score_diff": True,
-                            },
-                            facet_col='display_term',
-                            facet_col_wrap=3)
-        facet_fig.for_each_annotation(lambda a: a.update(text=a.text.split("=")[-1]))
-        facet_fig.update_yaxes(title=None, showticklabels=False)
-        facet_fig.update_xaxes(title=None)
-        facet_fig.update_traces(
-            hovertemplate="<b>%{customdata[0]}</b><br>%{x}<br>Score Difference from Previous Year: %{y:0f}<extra></extra>",
-            line_color = "#a0a0a0"
-        )
-        # print("plotly express hovertemplate:", facet_fig.data[0].hovertemplate)
+    @app.callback(
+        Output('polar-chart', 'figure'),
+        [Input("country-dropdown", 'value'),
+         Input("polar-date-slider", 'value')])
+    @metrics.timed
+    def update_polar_frame(selected_country, slider_choice):
+        if not selected_country:
+            raise PreventUpdate
+        if type(selected_country) != list:
+            selected_country = [selected_country]
+        date_selected = load().polar_dates[slider_choice]
+        return polar_cache.get_or_build((tuple(sorted(selected_country)), date_selected),
+                                        lambda: build_polar_frame(selected_country, date_selected))
 
-        return polar_header, polar_fig, facet_fig
+    response_cache.cache_callback(Output('polar-chart', 'figure'))
 
+    # Play button stepping through the polar slider, see assets/country_map.js
+    app.clientside_callback(
+        ClientsideFunction(namespace="country_map", function_name="play_polar"),
+        [Output("polar-interval", "disabled"),
+         Output("polar-date-slider", "value"),
+         Output("polar-play", "children")],
+        [Input("polar-play", "n_clicks"),
+         Input("polar-interval", "n_intervals")],
+        [State("polar-interval", "disabled"),
+         State("polar-date-slider", "value"),
+         State("polar-date-slider", "max")])
 
-except Exception as e:
-    layout = html.H3(f"Problem loading {os.path.basename(__file__)}, please check console for details.")
-    # TO DO: Update with logging.
-    print(e)
+except Exception:
+    # pages.import_all imports the pages at startup, so a broken page stops the app there
+    logging.getLogger(__name__).exception("Problem loading %s", __name__)
+    raise
 
 if __name__ == '__main__':
-    app.layout = layout
+    app.layout = load().layout
     app.run_server(debug=True)
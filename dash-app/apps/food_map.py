@@ -6,235 +6,129 @@ Nele Peshel
 Vivien van Dongen
 """
 
-import os
+import logging
 import pandas as pd
 pd.options.mode.chained_assignment = None  # default='warn'
 import numpy as np
-import re
+import json
+from types import SimpleNamespace
 
-import dash
 import dash_core_components as dcc
 import dash_html_components as html
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State, ClientsideFunction, ALL
 import plotly.express as px
+from plotly.utils import PlotlyJSONEncoder
 
-from app import app, INPUT_DIR
+from app import app, response_cache, stale_requests, metrics, use_base_theme, FIGURE_CACHE_MB, WARM_FIGURE_CACHE, CLIENTSIDE_SCRUBBING
+import datastore
+from figure_cache import FigureCache
+import pages
+import static_bundle
 
 try:
     ###########################
     # READ IN DATA
     ###########################
-    parse_dates = ['date']  # need the correct format
-    trends_df = pd.read_csv(INPUT_DIR + 'google-trends-difference.csv', parse_dates=parse_dates)
-    trends_df = trends_df[trends_df.score_difference.notna()]
-    trends_df["score_difference"] = trends_df["score_difference"].astype("int")
-    trends_df["original_score_difference"] = trends_df["score_difference"]
-    trends_df['date_str'] = trends_df['date'].astype(str)
-    trends_df = trends_df.sort_values(by="date_str", axis=0)
-
-    display_terms = {'baking': 'baking',
-                     'bananabread': 'banana bread',
-                     'beans': 'beans',
-                     'coffee': 'coffee',
-                     'cooking': 'cooking',
-                     'facemask': 'face mask',
-                     'grocerydelivery': 'grocery delivery',
-                     'hand-sanitizer': 'hand sanitizer',
-                     'pasta': 'pasta',
-                     'restaurant': 'restaurant',
-                     'rice': 'rice',
-                     'spices': 'spices',
-                     'takeaway': 'takeaway',
-                     'to-go': 'to go',
-                     'toiletpaper': 'toilet paper'
-                     }
-
-    trends_df["display_term"] = trends_df.term.map(display_terms)
-
-    # World Health Organization Covid Data
-    who_trends_df = pd.read_csv(INPUT_DIR + 'data_who_clean.csv', )
-    who_trends_df["date"] = pd.to_datetime(who_trends_df.Date_reported, format="%d/%m/%Y")
-
-    abbr_dict = {
-        'ger': 'Germany',
-        'uk': 'the United Kingdom',
-        'nl': 'the Netherlands',
-    }
-    trends_df['display_country'] = trends_df['country'].map(abbr_dict)
+    # Only the catalog & registry here, the trends are read when the page is first used, see load()
+    display_terms = datastore.DISPLAY_TERMS
+    map_countries = datastore.available_countries()
 
     ###########################
     # PREP
     ###########################
 
-    # MAPPING
-    # Adding iso_alpha and iso_num to df to use it as location for creating the map
-    def add_location(data):
-        for index, row in data.iterrows():
-            if row['country'] == "ger":
-                data.at[index, 'iso_num'] = 276
-                data.at[index, 'iso_alpha'] = "DEU"
-            elif row['country'] == "nl":
-                data.at[index, 'iso_num'] = 533
-                data.at[index, 'iso_alpha'] = "NLD"
-            elif row['country'] == "uk":
-                data.at[index, 'iso_num'] = 826
-                data.at[index, 'iso_alpha'] = "GBR"
-        return data
-
-    trends_df = add_location(trends_df)
-
     # Transform score_difference into absolute values and create additional column "score_diff_positive"
     # To distinguish and use different colors for positive and negative score differences
     def transform_data(data):
-        data['date_str'] = data['date'].astype(str)
-        for index, row in data.iterrows():
-            if row['score_difference'] >= 0:
-                data.at[index, 'score_diff_positive'] = "positive"
-            else:
-                data.at[index, 'score_diff_positive'] = "negative"
-            data.at[index, 'score_difference'] = abs(data.at[index, 'score_difference'])
+        data['score_diff_positive'] = np.where(data['score_difference'] >= 0, "positive", "negative")
+        data['score_difference'] = data['score_difference'].abs()
         return data
 
-    ## GENERATE ICONS
-    if os.name == 'nt':
-        ICON_DIR = os.getcwd() + '\\dash-app\\assets\\icons\\'  # for windows users
-    else:
-        ICON_DIR = './assets/icons/'
-
-    icons = []
-    for name in os.listdir(ICON_DIR):
-        if name.endswith(".svg"):
-            if "toiletpaper" in name:
-                icons.insert(0, ICON_DIR + name)  # ensure that toilet paper is always first
-            else:
-                icons.append(ICON_DIR + name)
-
-
-    icon_ids = []
-    icons = np.array(icons).reshape((3, -1))
-    icon_layout = []
-
-    for row in icons:
-        row_children = []
-        for icon in row:
-            name_stripped = re.sub(r'\d+', '', icon.split('/')[-1][:-4]) # extract the main product name from the path, removing numbers and .svg
-            button = html.Button(
-                id=f"{name_stripped}-button",
-                className="nav__link striped-bg-dark",
-                children=
-                    html.Img(
-                        src=icon,
-                        className="icon",
-                        alt=name_stripped
-                    )
+    # WHO LINE FIG
+    # Built once, the browser only moves its vertical line when the slider changes
+    def build_who_figure(who_trends_df):
+        who_fig = px.line(who_trends_df,
+                          x="date",
+                          y="Nom_new_cases",
+                          color="Country",
+                          hover_name="Country",
+                          line_shape="spline",
+                          labels={"Nom_new_cases": "COVID-19 Cases per 100.000 Inhabitants",
+                                  "date": ""},
+                          )
+        who_fig.update_xaxes(title_text=None)
+        who_fig.update_layout(
+            legend=dict(
+                yanchor="top",
+                y=0.99,
+                xanchor="left",
+                x=0.01
             )
-            row_children.append(button)
-            icon_ids.append(f"{name_stripped}-button")
-
-        row_layout = html.Div(
-            className="row centered",
-            children=row_children
         )
-        icon_layout.append(row_layout)
+        return who_fig
+
+    ## TERM PICKER
+    # One button per term in the catalog (output-data/terms.csv), with a pattern-matching id
+    # so a single callback covers them all, however many terms there are
+    def term_button(term):
+        return html.Button(
+            id={"type": "term-button", "term": term},
+            className="nav__link striped-bg-dark",
+            children=
+                html.Img(
+                    src=static_bundle.icon_url(term, datastore.TERMS.at[term, 'icon'], app.get_asset_url),
+                    className="icon",
+                    alt=term
+                )
+        )
+
+    default_term = next(iter(display_terms))  # first in the catalog, toilet paper
 
 
     # SLIDER
     # transform every unique date to a number & only get days that have matching WHO Covid data
-    slider_dict = {i: x for i, x in enumerate(trends_df[trends_df["date"].isin(who_trends_df["date"])]["date"].sort_values().unique())}
+    def build_slider(slider_dict):
+        return dcc.Slider(
+            id='map-date-slider',
+            min=min(slider_dict.keys()),
+            max=max(slider_dict.keys()),
+            value=min(slider_dict.keys()),
+            marks={key: pd.to_datetime(str(value)).strftime('%d/%m/%y') for key, value in slider_dict.items()},
+            included=False,
+            updatemode='drag'
+        )
 
-    slider = dcc.Slider(
-        id='map-date-slider',
-        min=min(slider_dict.keys()),
-        max=max(slider_dict.keys()),
-        value=min(slider_dict.keys()),
-        marks={key: pd.to_datetime(str(value)).strftime('%d/%m/%y') for key, value in slider_dict.items()},
-        included=False,
-        updatemode='drag'
-    )
 
+    # MAP
+    map_view = datastore.map_view(map_countries)  # fit the map to the registered countries' extents
 
-    ###########################
-    # LAYOUT TO BE USED IN INDEX.PY
-    ###########################
-    layout = html.Div(
-        className="viz-card flex-one",
-        children=[
-            dcc.Store(id="icon_store"),
-            dcc.Store(id="slider_store"),
-
-            html.H4("Select a Search Term",
-                    className="viz-card__header viz-card__header--timeseries"),
-
-            *icon_layout, # all 15 icons laid out in three rows
-
-            html.H4(id="food_map_header",
-                    className="viz-card__header viz-card__header--timeseries"
-                    ),
-            html.Div(
-                className="row mobile-interaction-disabled",
-                children=[
-                    dcc.Graph(id="test_map",
-                              className='viz-card__graph viz-card__graph--timeseries flex-three'
-                              ),
-                    dcc.Graph(id="who_fig",
-                              className='viz-card__graph flex-two'
-                              )
-                ]
-            ),
-            html.Div(
-                children=[
-                    slider
-                ]
-            )
-        ]
-    )
-    ###########################
-    # CALLBACK FUNCTIONS, IF ANY
-    ###########################
-    # Time Series and Record Types
-
-    ## Create the callbacks in a loop
-    callback_inputs = [Input(x, 'n_clicks') for x in icon_ids]
-    callback_inputs.append(Input('my-slider', 'value'))
-
-    # Get which icon has been clicked and update the store
-    @app.callback(
-          Output("icon_store", "data"),
-        [Input(x, 'n_clicks') for x in icon_ids])
-    def update_output_div(*icon_ids):
-        ctx = dash.callback_context
-        if not ctx.triggered:
-            button_id = 'toiletpaper-button'
-        else:
-            button_id = ctx.triggered[0]['prop_id'].split('.')[0]
+    def food_map_header(search_term):
+        return f"Search Trend Popularity for {display_terms[search_term].capitalize()} and COVID-19 Infection Rate for {datastore.join_country_names(map_countries)}"
 
-        search_term = button_id[:-7]
-        return search_term
+    color_discrete_map = {"positive": "dodgerblue", "negative": "darkred"}
 
-    # Update another store with the value of the slider
-    @app.callback(
-            Output("slider_store", "data"),
-            [Input("map-date-slider", "value")])
-    def update_from_date_slider(slider_choice):
-        date_selected = slider_dict[slider_choice]
-        date_selected = pd.to_datetime(str(date_selected)).strftime('%Y-%m-%d') # match the date_str format from transformed_Df
-        return date_selected
-
-    @app.callback(
-        [Output("test_map", "figure"),
-         Output("food_map_header", "children"),
-         Output("who_fig", "figure")],
-        [Input("icon_store", "data"),
-         Input("slider_store", "data")])
-    def update_from_store(search_term, date_selected):
+    def build_map_figure(search_term, date_selected):
+        """Scatter & background choropleth map of a search term on a date."""
+        stale_requests.check()  # the slider has moved on already, see stale_requests.py
+        page = load()
         ### Prep
         # Limit to selected term and date
-        filtered_data = trends_df[(trends_df.term == search_term) & (trends_df.date_str == date_selected)]
-        transformed_data = transform_data(filtered_data)
-        transformed_data["choropleth"] = "grey"
+        with metrics.phase("filter"):
+            transformed_data = page.snapshot_index.get((search_term, date_selected), page.empty_snapshot)
 
         ### Map
-        color_discrete_map = {"positive":"dodgerblue", "negative": "darkred"}
+        with metrics.phase("figure"):
+            return style_map_figure(transformed_data)
+
+    def style_map_figure(transformed_data):
+        """The map of the snapshot rows of one term & date, as a figure dict: the bubbles over the grey background."""
+        map_fig = style_map_scatter(transformed_data).to_plotly_json()
+        map_fig["data"] = list(map_fig["data"]) + [style_map_background(transformed_data).data[0].to_plotly_json()]
+        return map_fig
+
+    map_hovertemplate = "<b>%{customdata[0]}</b><br>Date: %{customdata[1]}<br>Country: %{customdata[2]}<br>Score Difference: %{customdata[3]}<extra></extra>"
+
+    def style_map_scatter(transformed_data):
         map_fig = px.scatter_geo(
             transformed_data,
             locations="iso_alpha",
@@ -262,6 +156,34 @@ try:
             }
         )
 
+        map_fig.update_layout(
+            geo_scope="europe",
+            legend_title_text='Search Term Popularity Compared to Previous Year',
+            legend=dict(
+                yanchor="top",
+                y=0.99,
+                xanchor="left",
+                x=0.01
+            ),
+            margin=dict(l=0, r=0, t=0, b=0),
+        )
+
+
+        map_fig.update_geos(
+            **map_view,  # center & projection_scale, see datastore.map_view
+            showland=False,
+            showocean=True,
+            oceancolor="#eee",  # try with "#fffff" for white background
+            countrycolor="#aaa" # outline of countries
+        )
+
+        map_fig.update_traces(
+            hovertemplate=map_hovertemplate,
+            # print("plotly express hovertemplate:", disposed_lifecycle_fig.data[0].hovertemplate)
+        )
+        return map_fig
+
+    def style_map_background(transformed_data):
         map_fig_choropleth = px.choropleth(
                             transformed_data,
                                 locations="iso_alpha",
@@ -281,77 +203,212 @@ try:
                             )
 
 
-        # Add background color to map & ensure it doesn't show up in legend
-        map_fig_choropleth.update_traces(name='background_color', showlegend=True)
-        map_fig.add_trace(map_fig_choropleth.data[0])
+        # Background color for the map, which doesn't show up in legend
+        map_fig_choropleth.update_traces(name='background_color', showlegend=False, hovertemplate=map_hovertemplate)
+        return map_fig_choropleth
+
+    # Serve the map's geometry ourselves once pipeline/geometry.py has built it, otherwise plotly gets it from its CDN
+    map_config = {"topojsonURL": static_bundle.url("topojson")} if static_bundle.url("topojson") else {}
+
+    # Every map prebuilt with WARM_FIGURE_CACHE, before gunicorn forks. Without it the response cache
+    # answers repeated (term, date) requests already, so the maps aren't kept a second time here
+    map_cache = FigureCache(FIGURE_CACHE_MB * 1024 * 1024)
+    metrics.register_cache("map", map_cache)
+
+    # CLIENTSIDE SCRUBBING
+    # Everything the browser needs to draw the map for any term & slider date,
+    # so that dragging the slider doesn't reach the server, see assets/food_map.js
+    def build_scrub_data(trends_df, snapshot_index, slider_dates):
+        countries = list(trends_df["country"].cat.categories)
+        sample_fig = style_map_figure(snapshot_index.get((default_term, slider_dates[0]), next(iter(snapshot_index.values()))))
+        scrub_data = {
+            "dates": slider_dates,
+            "countries": [{"code": country,
+                           "iso": datastore.COUNTRY_ISO.at[country, "iso_alpha"],
+                           "name": datastore.COUNTRY_NAMES[country]} for country in countries],
+            "colors": color_discrete_map,
+            "size_max": 50,
+            "hovertemplate": sample_fig["data"][0]["hovertemplate"],
+            "layout": json.loads(json.dumps(sample_fig["layout"], cls=PlotlyJSONEncoder)),
+            "terms": {},
+        }
+        for term, term_df in trends_df.groupby("term", observed=True):
+            values = term_df.pivot(index="date_str", columns="country", values="score_difference")
+            values = values.reindex(index=slider_dates, columns=countries).astype(object)
+            scrub_data["terms"][term] = {
+                "display_term": display_terms[term],
+                "header": food_map_header(term),
+                "values": values.where(values.notna(), None).values.tolist(),
+            }
+        return scrub_data
+
 
-        map_fig.for_each_trace(
-            lambda trace: trace.update(showlegend=False) if trace.name == "background_color" else (),
+    ###########################
+    # LAYOUT TO BE USED IN INDEX.PY
+    ###########################
+    def build_layout(who_fig, slider, scrub_store):
+        return html.Div(
+            className="viz-card flex-one",
+            children=[
+                dcc.Store(id="icon_store", data=default_term),
+                dcc.Store(id="slider_store"),
+                scrub_store,
+
+                html.H4("Select a Search Term",
+                        className="viz-card__header viz-card__header--timeseries"),
+
+                html.Div(
+                    className="row centered",
+                    children=[term_button(term) for term in display_terms]
+                ),
+
+                html.H4(id="food_map_header",
+                        className="viz-card__header viz-card__header--timeseries"
+                        ),
+                html.Div(
+                    className="row mobile-interaction-disabled",
+                    children=[
+                        dcc.Graph(id="test_map",
+                                  config=map_config,
+                                  className='viz-card__graph viz-card__graph--timeseries flex-three'
+                                  ),
+                        dcc.Graph(id="who_fig",
+                                  figure=who_fig,
+                                  className='viz-card__graph flex-two'
+                                  )
+                    ]
+                ),
+                html.Div(
+                    children=[
+                        slider
+                    ]
+                )
+            ]
         )
 
-        map_fig.update_layout(
-            geo_scope="europe",
-            legend_title_text='Search Term Popularity Compared to Previous Year',
-            legend=dict(
-                yanchor="top",
-                y=0.99,
-                xanchor="left",
-                x=0.01
-            ),
-            margin=dict(l=0, r=0, t=0, b=0),
+    ###########################
+    # LOADING, ON FIRST USE
+    ###########################
+    def prepare():
+        """Read the trends & build the figures & layout the page needs, see pages.py."""
+        use_base_theme()
+        trends_df = datastore.trends()
+
+        # World Health Organization Covid Data
+        who_trends_df = datastore.who()
+
+        # SNAPSHOT INDEX
+        # Every (term, date) the map can show, located (iso_alpha is used as location for creating the map)
+        # & transformed once up front so the callback only has to look up its ready to plot rows
+        plot_df = transform_data(datastore.add_country_metadata(trends_df))
+        plot_df["choropleth"] = "grey"
+        snapshot_index = dict(tuple(plot_df.groupby(["term", "date_str"], observed=True)))
+
+        slider_dict = {i: x for i, x in enumerate(trends_df[trends_df["date"].isin(who_trends_df["date"])]["date"].sort_values().unique())}
+        slider_dates = [pd.to_datetime(str(date)).strftime('%Y-%m-%d') for date in slider_dict.values()]
+
+        scrub_data = build_scrub_data(trends_df, snapshot_index, slider_dates) if CLIENTSIDE_SCRUBBING else None
+        return SimpleNamespace(
+            snapshot_index=snapshot_index,
+            empty_snapshot=plot_df.iloc[0:0],
+            slider_dict=slider_dict,
+            slider_dates=slider_dates,
+            layout=build_layout(build_who_figure(who_trends_df), build_slider(slider_dict),
+                                dcc.Store(id="scrub_store", data=scrub_data)),
         )
 
+    load = pages.lazy(prepare)
 
-        map_fig.update_geos(
-            projection_scale=4,  # set value; default = 1 (Europe scale)
-            # set map extent
-            center_lon=4.895168,  # set coordinates of Amsterdam as center of map
-            center_lat=52.370216,
-            # fitbounds= "locations"
-            showland=False,
-            showocean=True,
-            oceancolor="#eee",  # try with "#fffff" for white background
-            countrycolor="#aaa" # outline of countries
-        )
+    def reload():
+        """Forget the loaded page & its figures, see pages.reload."""
+        load.reset()
+        map_cache.clear()
 
-        map_fig.update_traces(
-            hovertemplate="<b>%{customdata[0]}</b><br>Date: %{customdata[1]}<br>Country: %{customdata[2]}<br>Score Difference: %{customdata[3]}<extra></extra>",
-            # print("plotly express hovertemplate:", disposed_lifecycle_fig.data[0].hovertemplate)
-        )
+    def warm():
+        """Load the page & with WARM_FIGURE_CACHE prebuild every map figure."""
+        page = load()
+        if WARM_FIGURE_CACHE:
+            map_cache.warm([(term, date) for term in display_terms for date in page.slider_dates], build_map_figure)
 
-        ### Header
-        header = f"Search Trend Popularity for {display_terms[search_term].capitalize()} and COVID-19 Infection Rate for Germany, the Netherlands, and the UK"
+    def snapshot_values(**options):
+        """Every value the inputs of this page's callbacks can take, for snapshot_site.py."""
+        page = load()
+        return {
+            ("map-date-slider", "value"): list(page.slider_dict),
+            ("icon_store", "data"): list(display_terms),
+            ("slider_store", "data"): list(page.slider_dates),
+        }
 
-        ### WHO Bar Graph
-        date_selected_datetime = pd.to_datetime(date_selected)
 
-        # WHO Line Fig with Vertical Line
-        who_fig = px.line(who_trends_df,
-                              x="date",
-                              y="Nom_new_cases",
-                              color="Country",
-                              hover_name="Country",
-                              line_shape="spline",
-                              labels={"Nom_new_cases": "COVID-19 Cases per 100.000 Inhabitants",
-                                      "date": ""},
-                              )
-        who_fig.add_vline(x=date_selected_datetime, line_color="#a0a0a0", line_dash="dash")
-        who_fig.update_xaxes(title_text=None)
-        who_fig.update_layout(
-            legend=dict(
-                yanchor="top",
-                y=0.99,
-                xanchor="left",
-                x=0.01
-            )
-        )
-        return map_fig, header, who_fig
+    ###########################
+    # CALLBACK FUNCTIONS, IF ANY
+    ###########################
+    # Time Series and Record Types
+
+    # Put the clicked term in icon_store. The browser reads it off the triggered button's id,
+    # so clicks never reach the server with every button's n_clicks, see assets/food_map.js
+    app.clientside_callback(
+        ClientsideFunction(namespace="food_map", function_name="select_term"),
+        Output("icon_store", "data"),
+        [Input({"type": "term-button", "term": ALL}, "n_clicks")])
 
-except Exception as e:
-    layout = html.H3(f"Problem loading {os.path.basename(__file__)}, please check console for details.")
-    # TO DO: Update with logging.
-    print(e)
+    # Update another store with the value of the slider
+    def update_from_date_slider(slider_choice):
+        date_selected = load().slider_dict[slider_choice]
+        date_selected = pd.to_datetime(str(date_selected)).strftime('%Y-%m-%d') # match the date_str format from transformed_Df
+        return date_selected
+
+    def update_from_store(search_term, date_selected):
+        ### Map
+        if WARM_FIGURE_CACHE:
+            map_fig = map_cache.get_or_build((search_term, date_selected),
+                                             lambda: build_map_figure(search_term, date_selected))
+        else:
+            map_fig = build_map_figure(search_term, date_selected)
+
+        ### Header
+        header = food_map_header(search_term)
+
+        return map_fig, header
+
+    if CLIENTSIDE_SCRUBBING:
+        # The browser turns slider positions into dates & draws the map from scrub_store
+        app.clientside_callback(
+            ClientsideFunction(namespace="food_map", function_name="slider_to_date"),
+            Output("slider_store", "data"),
+            [Input("map-date-slider", "value")],
+            [State("scrub_store", "data")])
+        app.clientside_callback(
+            ClientsideFunction(namespace="food_map", function_name="render_map"),
+            [Output("test_map", "figure"),
+             Output("food_map_header", "children")],
+            [Input("icon_store", "data"),
+             Input("slider_store", "data")],
+            [State("scrub_store", "data")])
+    else:
+        app.callback(
+            Output("slider_store", "data"),
+            [Input("map-date-slider", "value")])(metrics.timed(update_from_date_slider))
+        map_outputs = [Output("test_map", "figure"), Output("food_map_header", "children")]
+        app.callback(
+            map_outputs,
+            [Input("icon_store", "data"),
+             Input("slider_store", "data")])(metrics.timed(update_from_store))
+        response_cache.cache_callback(map_outputs)
+        stale_requests.drop_callback(map_outputs)
+
+    # Move the dashed date line on the WHO figure, see assets/food_map.js
+    app.clientside_callback(
+        ClientsideFunction(namespace="food_map", function_name="move_who_marker"),
+        Output("who_fig", "figure"),
+        [Input("slider_store", "data")],
+        [State("who_fig", "figure")])
+
+except Exception:
+    # pages.import_all imports the pages at startup, so a broken page stops the app there
+    logging.getLogger(__name__).exception("Problem loading %s", __name__)
+    raise
 
 if __name__ == '__main__':
-    app.layout = layout
+    app.layout = load().layout
     app.run_server(debug=True)
@@ -0,0 +1,25 @@
+// Clientside callbacks for apps/country_map.py
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    country_map: {
+        // Play / pause the polar chart: the button toggles the interval, each tick moves the slider one date on
+        play_polar: function(n_clicks, n_intervals, disabled, value, max) {
+            var no_update = window.dash_clientside.no_update;
+            var triggered = window.dash_clientside.callback_context.triggered.map(function(t) { return t.prop_id; });
+
+            if (triggered.indexOf("polar-play.n_clicks") !== -1) {
+                if (disabled) {
+                    // Start again from the beginning when already at the last date
+                    return [false, value >= max ? 0 : no_update, "■"];
+                }
+                return [true, no_update, "▶"];
+            }
+            if (triggered.indexOf("polar-interval.n_intervals") !== -1 && !disabled) {
+                if (value >= max) {
+                    return [true, no_update, "▶"];
+                }
+                return [no_update, value + 1, no_update];
+            }
+            return [no_update, no_update, no_update];
+        }
+    }
+});
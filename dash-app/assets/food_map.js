@@ -0,0 +1,109 @@
+// Clientside callbacks for apps/food_map.py
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    food_map: {
+        // The term of the clicked term picker button, from its pattern-matching id
+        select_term: function(n_clicks) {
+            var triggered = window.dash_clientside.callback_context.triggered;
+            if (!triggered.length || !triggered[0].value) {
+                return window.dash_clientside.no_update;  // initial call, icon_store keeps the default term
+            }
+            var prop_id = triggered[0].prop_id;
+            return JSON.parse(prop_id.slice(0, prop_id.lastIndexOf("."))).term;
+        },
+
+        // Redraw the dashed line marking the slider's date on the otherwise static WHO figure
+        move_who_marker: function(date_selected, figure) {
+            if (!date_selected || !figure) {
+                return window.dash_clientside.no_update;
+            }
+            var marker = {
+                type: "line",
+                xref: "x",
+                yref: "y domain",
+                x0: date_selected,
+                x1: date_selected,
+                y0: 0,
+                y1: 1,
+                line: {color: "#a0a0a0", dash: "dash"}
+            };
+            var layout = Object.assign({}, figure.layout, {shapes: [marker]});
+            return Object.assign({}, figure, {layout: layout});
+        },
+
+        // CLIENTSIDE_SCRUBBING only: slider position to YYYY-MM-DD, like update_from_date_slider
+        slider_to_date: function(slider_choice, scrub) {
+            if (!scrub || slider_choice === undefined || slider_choice === null) {
+                return window.dash_clientside.no_update;
+            }
+            return scrub.dates[slider_choice];
+        },
+
+        // CLIENTSIDE_SCRUBBING only: the same map & header update_from_store builds, from scrub_store
+        render_map: function(search_term, date_selected, scrub) {
+            var no_update = window.dash_clientside.no_update;
+            if (!scrub || !search_term || !date_selected || !(search_term in scrub.terms)) {
+                return [no_update, no_update];
+            }
+            var term = scrub.terms[search_term];
+            var values = term.values[scrub.dates.indexOf(date_selected)] || [];
+
+            // One scatter trace per sign, in order of first appearance like plotly express
+            var scatter = {};
+            var order = [];
+            var background = {
+                type: "choropleth",
+                geo: "geo",
+                name: "background_color",
+                showlegend: false,
+                showscale: false,
+                colorscale: [[0.0, "#CECECE"], [1.0, "#CECECE"]],
+                hovertemplate: scrub.hovertemplate,
+                customdata: [],
+                locations: [],
+                z: []
+            };
+            var max_size = 0;
+
+            scrub.countries.forEach(function(country, i) {
+                var value = values[i];
+                if (value === null || value === undefined) {
+                    return;
+                }
+                var sign = value >= 0 ? "positive" : "negative";
+                var size = Math.abs(value);
+                var customdata = [term.display_term, date_selected, country.name, size, sign, country.iso];
+                if (!(sign in scatter)) {
+                    order.push(sign);
+                    scatter[sign] = {
+                        type: "scattergeo",
+                        geo: "geo",
+                        mode: "markers",
+                        name: sign,
+                        legendgroup: sign,
+                        showlegend: true,
+                        hovertemplate: scrub.hovertemplate,
+                        customdata: [],
+                        hovertext: [],
+                        locations: [],
+                        marker: {color: scrub.colors[sign], size: [], sizemode: "area", symbol: "circle"}
+                    };
+                }
+                scatter[sign].customdata.push(customdata);
+                scatter[sign].hovertext.push(country.code);
+                scatter[sign].locations.push(country.iso);
+                scatter[sign].marker.size.push(size);
+                background.customdata.push(customdata);
+                background.locations.push(country.iso);
+                background.z.push(1);
+                max_size = Math.max(max_size, size);
+            });
+
+            var data = order.map(function(sign) {
+                scatter[sign].marker.sizeref = max_size / (scrub.size_max * scrub.size_max) || 1;
+                return scatter[sign];
+            });
+            data.push(background);
+            return [{data: data, layout: scrub.layout}, term.header];
+        }
+    }
+});
@@ -0,0 +1,20 @@
+// Numbers the callback requests of this tab, so a worker can skip the ones
+// it's been sent something newer for already, see stale_requests.py
+(function() {
+    var session = Math.random().toString(36).slice(2) + Date.now().toString(36);
+    var sequence = 0;
+    var fetch = window.fetch;
+
+    window.fetch = function(resource, init) {
+        var url = typeof resource === "string" ? resource : (resource && resource.url) || "";
+        if (url.indexOf("_dash-update-component") === -1) {
+            return fetch.apply(this, arguments);
+        }
+        init = Object.assign({}, init);
+        var headers = new Headers(init.headers || {});
+        headers.set("X-Dash-Session", session);
+        headers.set("X-Dash-Sequence", String(++sequence));
+        init.headers = headers;
+        return fetch.call(this, resource, init);
+    };
+})();
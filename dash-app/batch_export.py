@@ -0,0 +1,256 @@
+"""
+Batch Figure Export
+
+Esme Middaugh
+Nele Peshel
+Vivien van Dongen
+
+Renders every state of the dashboard's main figures to files, for the
+poster, screenshots & checking a data refresh without clicking through it:
+    - food: the food map of every term on every slider date (update_from_store)
+    - country: the search trend lines of every selection of countries (map_clicked)
+      & their polar chart on every polar slider date (update_polar_frame)
+
+Each state is written as the figure's JSON, readable with plotly.io.read_json,
+and, with kaleido installed (pip install kaleido), as PNG and/or SVG too.
+index.json lists every state with its inputs, header & files.
+
+The states are split over a pool of worker processes, forked once the data
+is loaded. A manifest keeps a hash of each state's inputs, the data version
+& the code drawing it, so a rerun only renders what's new or changed.
+
+Usage, from the dash-app directory:
+    python -m batch_export  # JSON of everything into export/
+    python -m batch_export --pages food --formats json png svg --processes 4
+    python -m batch_export --max-countries 2  # only selections of up to 2 countries
+    python -m batch_export --full  # ignore the manifest and render everything again
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+os.environ.setdefault("WARM_UP", "lazy")  # loaded below, before the workers fork
+
+import plotly.io as pio
+from plotly.utils import PlotlyJSONEncoder
+
+try:
+    import kaleido
+except ImportError:  # only needed for PNG & SVG
+    kaleido = None
+
+import datastore
+import pages
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))  # dash-app
+EXPORT_DIR = os.path.join(BASE_DIR, 'export')
+MANIFEST_FILE = 'manifest.json'
+INDEX_FILE = 'index.json'
+
+FORMATS = ['json', 'png', 'svg']
+IMAGE_SIZE = {'food': (1000, 700), 'country': (1000, 900), 'polar': (700, 700)}  # width, height in px, about as shown on the page
+FIGURES = {'food': ['food'], 'country': ['country', 'polar']}  # the figures of each page
+MODULES = {'food': os.path.join('apps', 'food_map.py'), 'country': os.path.join('apps', 'country_map.py')}  # the module drawing each page's figures
+
+
+###########################
+# STATES
+###########################
+def food_states():
+    """(name, inputs) of the food map for every term & slider date."""
+    from apps import food_map
+    dates = food_map.load().slider_dates
+    return [(f"food/{term}/{date}", [term, date]) for term in food_map.display_terms for date in dates]
+
+
+def selections(max_countries=None):
+    """Every selection of up to max_countries countries, in registry order."""
+    from apps import country_map
+    country_map.load()  # here, so the workers don't each load the page
+    countries = [option['value'] for option in country_map.country_options]
+    sizes = range(1, min(max_countries or len(countries), len(countries)) + 1)
+    return [list(selection) for size in sizes for selection in itertools.combinations(countries, size)]
+
+
+def country_states(max_countries=None):
+    """(name, inputs) of the trend lines for every selection of up to max_countries countries."""
+    return [(f"country/{'-'.join(selection)}", [selection]) for selection in selections(max_countries)]
+
+
+def polar_states(max_countries=None):
+    """(name, inputs) of the polar chart for every selection of up to max_countries countries on every polar date."""
+    from apps import country_map
+    dates = country_map.load().polar_dates
+    return [(f"polar/{'-'.join(selection)}/{date}", [selection, position])
+            for selection in selections(max_countries) for position, date in enumerate(dates)]
+
+
+def render(figure_name, inputs):
+    """(header, figure dict) of a state, from the same callback the dashboard calls, without Dash's request handling."""
+    header = None
+    if figure_name == 'food':
+        from apps import food_map
+        figure, header = food_map.update_from_store(*inputs)
+    elif figure_name == 'country':
+        from apps import country_map
+        header, figure = country_map.map_clicked.__wrapped__(*inputs)
+    else:
+        from apps import country_map
+        figure = country_map.update_polar_frame.__wrapped__(*inputs)
+    if not isinstance(figure, dict):
+        figure = figure.to_plotly_json()
+    return header, figure
+
+
+###########################
+# KEYS & MANIFEST
+###########################
+def code_version(module_path):
+    """Hash of the page module at module_path & the modules it draws with, so changing them renders everything again."""
+    digest = hashlib.sha256()
+    for path in [module_path, 'datastore.py', 'app.py', 'figure_cache.py']:
+        with open(os.path.join(BASE_DIR, path), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def state_key(figure, inputs, version, image_options):
+    """Hash of everything a state's files depend on."""
+    state = {'figure': figure, 'inputs': inputs, 'version': version, 'image': image_options}
+    return hashlib.sha256(json.dumps(state, sort_keys=True).encode()).hexdigest()
+
+
+def load_manifest(export_dir):
+    path = os.path.join(export_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, export_dir):
+    with open(os.path.join(export_dir, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+
+###########################
+# RENDERING
+###########################
+def export_state(export_dir, figure_name, name, inputs, formats, scale):
+    """Render one state into export_dir/name.<format> for every format, returning its index entry."""
+    header, figure = render(figure_name, inputs)
+    path = os.path.join(export_dir, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    files = []
+    for file_format in formats:
+        if file_format == 'json':
+            with open(path + '.json', 'w') as f:
+                json.dump(figure, f, cls=PlotlyJSONEncoder)
+        else:
+            width, height = IMAGE_SIZE[figure_name]
+            pio.write_image(figure, f"{path}.{file_format}", format=file_format, width=width, height=height,
+                            scale=scale, engine='kaleido')
+        files.append(f"{name}.{file_format}")
+    return {'figure': figure_name, 'inputs': inputs, 'header': header, 'files': files}
+
+
+def export_states(export_dir, figure_name, states, formats, scale):
+    """export_state for a chunk of states, so each task is worth sending to a worker."""
+    return [(name, export_state(export_dir, figure_name, name, inputs, formats, scale)) for name, inputs in states]
+
+
+def chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def export(export_dir=EXPORT_DIR, page_names=('food', 'country'), formats=('json',), processes=None,
+           max_countries=None, scale=1, full=False, chunk_size=8):
+    """Render every state of the given pages that's new or changed since the last export, returning a summary."""
+    os.makedirs(export_dir, exist_ok=True)
+    manifest = {} if full else load_manifest(export_dir)
+    index_path = os.path.join(export_dir, INDEX_FILE)
+    index = {}
+    if not full and os.path.exists(index_path):
+        with open(index_path) as f:
+            index = json.load(f)
+
+    # Load the data & pages once, the workers inherit them when they fork
+    pages.import_all()
+    datastore.load()
+    version = datastore.data_version()
+    list_states = {'food': food_states, 'country': lambda: country_states(max_countries),
+                   'polar': lambda: polar_states(max_countries)}
+    states = {(page, figure_name): list_states[figure_name]()
+              for page in page_names for figure_name in FIGURES[page]}
+
+    summary = {'rendered': [], 'unchanged': []}
+    pending = set()  # names of the states to render
+    tasks = []
+    for (page, figure_name), figure_states in states.items():
+        code = code_version(MODULES[page])
+        todo = []
+        for name, inputs in figure_states:
+            key = state_key(figure_name, inputs, [version, code], {'size': IMAGE_SIZE[figure_name], 'scale': scale})
+            exists = all(os.path.exists(os.path.join(export_dir, f"{name}.{file_format}")) for file_format in formats)
+            if manifest.get(name) == key and exists and name in index:
+                summary['unchanged'].append(name)
+                continue
+            manifest[name] = key
+            pending.add(name)
+            todo.append((name, inputs))
+        tasks += [(figure_name, chunk) for chunk in chunks(todo, chunk_size)]
+
+    def done(results):
+        for name, entry in results:
+            index[name] = entry
+            summary['rendered'].append(name)
+            pending.discard(name)
+
+    try:
+        if processes == 0:
+            for figure_name, chunk in tasks:
+                done(export_states(export_dir, figure_name, chunk, formats, scale))
+        elif tasks:
+            # fork, so the workers start with the data & pages already loaded
+            with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context("fork")) as pool:
+                futures = [pool.submit(export_states, export_dir, figure_name, chunk, formats, scale)
+                           for figure_name, chunk in tasks]
+                for future in futures:
+                    done(future.result())
+    finally:
+        # keep what's been rendered, a rerun picks up the rest
+        save_manifest({name: key for name, key in manifest.items() if name not in pending}, export_dir)
+        with open(index_path, 'w') as f:
+            json.dump(index, f, indent=2, sort_keys=True)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render every food map, trend line & polar chart state to JSON and images.")
+    parser.add_argument("--export-dir", default=EXPORT_DIR, help="folder to write the files into")
+    parser.add_argument("--pages", nargs="+", default=['food', 'country'], choices=['food', 'country'])
+    parser.add_argument("--formats", nargs="+", default=['json'], choices=FORMATS, help="png & svg need kaleido")
+    parser.add_argument("--processes", type=int, default=None, help="worker processes, all cores by default, 0 renders in this process")
+    parser.add_argument("--max-countries", type=int, default=None, help="only export selections of up to this many countries")
+    parser.add_argument("--scale", type=float, default=1, help="image resolution multiplier, e.g. 3 for print")
+    parser.add_argument("--full", action="store_true", help="ignore the manifest and render everything again")
+    args = parser.parse_args(argv)
+    if kaleido is None and set(args.formats) - {'json'}:
+        parser.error("PNG & SVG need kaleido, pip install kaleido, or export --formats json only")
+
+    start = time.perf_counter()
+    summary = export(args.export_dir, args.pages, args.formats, args.processes, args.max_countries,
+                     args.scale, args.full)
+    print(f"rendered: {len(summary['rendered'])}")
+    print(f"unchanged: {len(summary['unchanged'])}")
+    print(f"in {time.perf_counter() - start:.1f}s into {args.export_dir}")
+
+
+if __name__ == '__main__':
+    main()
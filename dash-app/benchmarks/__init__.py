@@ -0,0 +1,9 @@
+"""
+Benchmarks
+
+Esme Middaugh
+Nele Peshel
+Vivien van Dongen
+
+Offline timing scripts, run with python -m benchmarks.<name> from the dash-app directory.
+"""
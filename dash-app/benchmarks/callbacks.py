@@ -0,0 +1,150 @@
+"""
+Callback Benchmark
+
+Esme Middaugh
+Nele Peshel
+Vivien van Dongen
+
+Times every server side callback through Flask's test client, the way the
+browser calls them, over its whole input grid: every (term, date) of the
+food map, every country subset & date of the country page and every page.
+Each request is made once, so the figure & response caches never hit.
+Reports p50 / p99 latency, response bytes, the time to import index & to
+answer the first request, the time to warm the pages up and the peak
+resident memory.
+
+Run it in a fresh process, as the import is part of what's measured. From
+the dash-app directory:
+    python -m benchmarks.callbacks
+    DATA_DIR=/tmp/data-10x python -m benchmarks.callbacks --json
+"""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import resource
+import time
+
+import numpy as np
+
+MAX_SUBSETS = 15  # country subsets timed when there are too many to try them all
+
+
+def rss_mb():
+    """Peak resident memory of this process so far, in MB."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+
+
+def country_subsets(countries, limit=MAX_SUBSETS, seed=0):
+    """Every non empty subset of countries, or singles, all of them & a fixed random sample when there are too many."""
+    if 2 ** len(countries) - 1 <= limit:
+        return [list(subset) for size in range(1, len(countries) + 1)
+                for subset in itertools.combinations(countries, size)]
+    subsets = [[country] for country in countries[:limit // 3]] + [list(countries)]
+    rng = random.Random(seed)
+    while len(subsets) < limit:
+        subsets.append(sorted(rng.sample(countries, rng.randint(2, len(countries) - 1))))
+    return subsets
+
+
+def request_body(outputs, inputs):
+    """The JSON dash-renderer posts to _dash-update-component."""
+    ids = [f"{component}.{prop}" for component, prop in outputs]
+    return {
+        "output": ids[0] if len(ids) == 1 else '..' + '...'.join(ids) + '..',
+        "outputs": [{"id": component, "property": prop} for component, prop in outputs]
+        if len(outputs) > 1 else {"id": outputs[0][0], "property": outputs[0][1]},
+        "inputs": [{"id": component, "property": prop, "value": value} for (component, prop), value in inputs],
+        "changedPropIds": [f"{component}.{prop}" for (component, prop), _ in inputs],
+    }
+
+
+def grids(food_map, country_map, datastore, sample=1):
+    """(callback name, outputs, list of input lists) for every server side callback."""
+    terms = list(datastore.DISPLAY_TERMS)
+    subsets = country_subsets(datastore.available_countries())
+    yield ("display_page", [("page-content", "children")],
+           [[(("url", "pathname"), path)] for path in ["/", "/food", "/country"]])
+    yield ("update_from_date_slider", [("slider_store", "data")],
+           [[(("map-date-slider", "value"), i)] for i in list(food_map.load().slider_dict)[::sample]])
+    yield ("update_from_store", [("test_map", "figure"), ("food_map_header", "children")],
+           [[(("icon_store", "data"), term), (("slider_store", "data"), date)]
+            for term in terms for date in food_map.load().slider_dates[::sample]])
+    yield ("map_clicked", [("polar-title", "children"), ("joy-graph", "figure")],
+           [[(("country-dropdown", "value"), subset)] for subset in subsets])
+    yield ("update_polar_frame", [("polar-chart", "figure")],
+           [[(("country-dropdown", "value"), subset), (("polar-date-slider", "value"), i)]
+            for subset in subsets for i in range(0, len(country_map.load().polar_dates), sample)])
+
+
+def run(sample=1):
+    os.environ.setdefault("WARM_UP", "lazy")  # warmed up below instead, timed on its own
+    start = time.perf_counter()
+    import index
+    from apps import food_map, country_map
+    import datastore
+    import pages
+    results = {
+        "import_s": time.perf_counter() - start,
+        "import_rss_mb": rss_mb(),
+        "countries": len(datastore.available_countries()),
+        "callbacks": {},
+    }
+
+    # Cold start: the import & the first answer, e.g. to a health check
+    client = index.server.test_client()
+    start = time.perf_counter()
+    client.get("/")
+    results["cold_start_s"] = results["import_s"] + time.perf_counter() - start
+    start = time.perf_counter()
+    pages.warm_up()
+    results["warm_up_s"] = time.perf_counter() - start
+
+    for name, outputs, input_grid in grids(food_map, country_map, datastore, sample):
+        latencies, sizes = [], []
+        for inputs in input_grid:
+            body = request_body(outputs, inputs)
+            start = time.perf_counter()
+            response = client.post("/_dash-update-component", json=body)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                raise RuntimeError(f"{name} answered {response.status_code} to {inputs}")
+            sizes.append(len(response.data))
+        latencies = np.array(latencies) * 1000
+        results["callbacks"][name] = {
+            "calls": len(latencies),
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p99_ms": float(np.percentile(latencies, 99)),
+            "mean_bytes": float(np.mean(sizes)),
+            "max_bytes": int(np.max(sizes)),
+        }
+    results["peak_rss_mb"] = rss_mb()
+    return results
+
+
+def print_results(results):
+    print(f"{results['countries']} countries, import {results['import_s']:.2f}s, cold start {results['cold_start_s']:.2f}s, "
+          f"warm up {results['warm_up_s']:.2f}s, {results['import_rss_mb']:.0f} MB after import, {results['peak_rss_mb']:.0f} MB peak")
+    print(f"{'callback':<24} {'calls':>6} {'p50':>10} {'p99':>10} {'mean size':>12} {'max size':>12}")
+    for name, timing in results["callbacks"].items():
+        print(f"{name:<24} {timing['calls']:>6} {timing['p50_ms']:>8.1f}ms {timing['p99_ms']:>8.1f}ms"
+              f" {timing['mean_bytes'] / 1024:>10.1f}KB {timing['max_bytes'] / 1024:>10.1f}KB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time every callback over its input grid.")
+    parser.add_argument("--sample", type=int, default=1, help="only every n-th date, to run quicker")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args(argv)
+
+    results = run(args.sample)
+    if args.json:
+        print(json.dumps(results))
+    else:
+        print_results(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Enrichment Benchmark
+
+Esme Middaugh
+Nele Peshel
+Vivien van Dongen
+
+Times the vectorized country metadata & sign / magnitude transforms against
+the iterrows versions they replaced, on the real trends data and on copies
+of it scaled 10x and 100x.
+
+Usage, from the dash-app directory:
+    python -m benchmarks.enrichment
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from pipeline import store
+import datastore
+
+SCALES = [1, 10, 100]
+
+
+###########################
+# PREVIOUS IMPLEMENTATIONS
+###########################
+def add_location_iterrows(data):
+    for index, row in data.iterrows():
+        if row['country'] == "ger":
+            data.at[index, 'iso_num'] = 276
+            data.at[index, 'iso_alpha'] = "DEU"
+        elif row['country'] == "nl":
+            data.at[index, 'iso_num'] = 533
+            data.at[index, 'iso_alpha'] = "NLD"
+        elif row['country'] == "uk":
+            data.at[index, 'iso_num'] = 826
+            data.at[index, 'iso_alpha'] = "GBR"
+    return data
+
+
+def transform_data_iterrows(data):
+    for index, row in data.iterrows():
+        if row['score_difference'] >= 0:
+            data.at[index, 'score_diff_positive'] = "positive"
+        else:
+            data.at[index, 'score_diff_positive'] = "negative"
+        data.at[index, 'score_difference'] = abs(data.at[index, 'score_difference'])
+    return data
+
+
+###########################
+# CURRENT IMPLEMENTATIONS
+###########################
+def transform_data_vectorized(data):
+    # same as apps.food_map.transform_data, which can't be imported without registering its callbacks
+    data['score_diff_positive'] = np.where(data['score_difference'] >= 0, "positive", "negative")
+    data['score_difference'] = data['score_difference'].abs()
+    return data
+
+
+def timed(func, data, repeat=3):
+    """Best of repeat wall times in seconds, each on a fresh copy of data."""
+    best = float('inf')
+    for _ in range(repeat):
+        frame = data.copy()
+        start = time.perf_counter()
+        func(frame)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    trends_df = store.read_trends(datastore.STORE_DIR)
+    print(f"{'rows':>8} {'add_location':>14} {'vectorized':>12} {'transform':>12} {'vectorized':>12}")
+    for scale in SCALES:
+        data = pd.concat([trends_df] * scale, ignore_index=True)
+        print(f"{len(data):>8}"
+              f" {timed(add_location_iterrows, data, repeat=1):>13.4f}s"
+              f" {timed(datastore.add_country_metadata, data):>11.4f}s"
+              f" {timed(transform_data_iterrows, data, repeat=1):>11.4f}s"
+              f" {timed(transform_data_vectorized, data):>11.4f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,392 @@
+"""
+Load Test
+
+Esme Middaugh
+Nele Peshel
+Vivien van Dongen
+
+Simulated users driving a running dashboard through the same
+_dash-update-component requests dash-renderer sends, with no browser. Each
+user runs sessions of interactions, one after the other:
+    - food: open /food, then drag the date slider across a stretch of dates,
+      each step being a slider_store request followed by the map request
+      it triggers, now & then picking another term. Like a browser, the
+      next step is sent without waiting for the one before, on up to
+      --drag-connections connections
+    - country: open /country, then add & remove countries in the dropdown &
+      step the polar slider
+What the pages offer (terms, dates, countries) is read off the server's own
+display_page responses, so it runs against any data. Every session numbers
+its requests like a browser tab (assets/request_sequence.js), so workers skip
+the maps a drag has moved past (stale_requests.py), counted as dropped.
+
+Sessions are generated from --seed; --record writes them to a file & --replay
+runs that file again, so a change can be compared on the very same traffic.
+Reports throughput, p50 / p90 / p99 latency and errors per callback and
+per interaction.
+
+Usage, from the dash-app directory, with the dashboard running elsewhere:
+    gunicorn --preload -w 4 --threads 4 -b 127.0.0.1:8050 index:server
+    python -m benchmarks.load --url http://127.0.0.1:8050 --users 20 --duration 60
+    python -m benchmarks.load --users 20 --sessions 200 --record sessions.jsonl
+    python -m benchmarks.load --users 20 --replay sessions.jsonl
+"""
+
+import argparse
+import gzip
+import http.client
+import itertools
+import json
+import random
+import threading
+import time
+import urllib.parse
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks.callbacks import request_body
+from stale_requests import SESSION_HEADER, SEQUENCE_HEADER
+
+SCRUB_STEPS = (5, 40)  # slider positions dragged over in one scrub
+THINK_MS = 30  # between the steps of a drag, about what a browser sends at
+PAUSE_MS = 1000  # between interactions
+DRAG_CONNECTIONS = 4  # a drag's requests in flight at once, per user
+
+
+###########################
+# PROTOCOL
+###########################
+class Tab:
+    """The id & request numbers a browser tab sends with its callbacks, see assets/request_sequence.js."""
+
+    def __init__(self):
+        self.session = uuid.uuid4().hex
+        self._sequence = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def headers(self):
+        with self._lock:
+            return {SESSION_HEADER: self.session, SEQUENCE_HEADER: str(next(self._sequence))}
+
+
+class Client:
+    """One keep-alive connection to the dashboard, posting callbacks the way dash-renderer does."""
+
+    def __init__(self, url):
+        self.url = url
+        parsed = urllib.parse.urlparse(url)
+        self.host = parsed.netloc
+        self.prefix = parsed.path.rstrip('/') + '/'
+        self.connection = None
+
+    def request(self, method, path, body=None, headers=None):
+        """(status, decoded body) of a request, reconnecting once if the server closed the connection."""
+        headers = dict(headers or {}, **{'Accept-Encoding': 'gzip'})
+        if body is not None:
+            body = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+        for attempt in range(2):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, timeout=60)
+            try:
+                self.connection.request(method, self.prefix + path, body, headers)
+                response = self.connection.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, ConnectionError):
+                self.connection.close()
+                self.connection = None
+                if attempt:
+                    raise
+        if response.getheader('Content-Encoding') == 'gzip':
+            data = gzip.decompress(data)
+        return response.status, data
+
+    def callback(self, outputs, inputs, tab=None):
+        """Post a callback, numbered as a request of tab if given, returning its status, response size & the output values."""
+        status, data = self.request('POST', '_dash-update-component', request_body(outputs, inputs),
+                                    tab.headers() if tab is not None else None)
+        values = []
+        if status == 200:
+            response = json.loads(data)['response']
+            values = [response[component][prop] for component, prop in outputs]
+        return status, len(data), values
+
+
+###########################
+# DISCOVERY
+###########################
+def find_components(tree, found=None):
+    """Every component in a serialized layout, by id."""
+    found = {} if found is None else found
+    if isinstance(tree, list):
+        for child in tree:
+            find_components(child, found)
+    elif isinstance(tree, dict) and 'props' in tree:
+        component_id = tree['props'].get('id')
+        if component_id is not None:
+            found[json.dumps(component_id, sort_keys=True) if isinstance(component_id, dict) else component_id] = tree
+        find_components(tree['props'].get('children'), found)
+    return found
+
+
+def discover(client):
+    """Terms, slider positions & countries the pages offer, from their display_page responses."""
+    pages = {}
+    for path in ['/food', '/country']:
+        status, _, values = client.callback([("page-content", "children")], [(("url", "pathname"), path)])
+        if status != 200:
+            raise RuntimeError(f"display_page answered {status} for {path}")
+        pages[path] = find_components(values[0])
+    food, country = pages['/food'], pages['/country']
+    terms = [json.loads(key)['term'] for key in food if key.startswith('{') and '"term-button"' in key]
+    slider = food['map-date-slider']['props']
+    dropdown = country['country-dropdown']['props']
+    return {
+        "terms": terms,
+        "default_term": food['icon_store']['props']['data'],
+        "slider": [slider['min'], slider['max']],
+        "countries": [option['value'] for option in dropdown['options']],
+        "selected": dropdown['value'],
+        "polar_max": country['polar-date-slider']['props']['max'],
+    }
+
+
+###########################
+# SESSIONS
+###########################
+def generate_session(site, rng):
+    """A random food or country session: the page it opens & its interactions."""
+    if rng.random() < 0.6:
+        interactions = []
+        position = site["slider"][0]
+        term = site["default_term"]
+        for _ in range(rng.randint(1, 5)):
+            if rng.random() < 0.3:
+                term = rng.choice(site["terms"])
+                interactions.append({"type": "term", "term": term})
+            steps = rng.randint(*SCRUB_STEPS)
+            direction = rng.choice([-1, 1])
+            positions = [min(max(position + direction * step, site["slider"][0]), site["slider"][1])
+                         for step in range(1, steps + 1)]
+            position = positions[-1]
+            interactions.append({"type": "scrub", "term": term, "positions": positions})
+        return {"page": "/food", "interactions": interactions}
+
+    interactions = []
+    selected = list(site["selected"])
+    position = 0
+    for _ in range(rng.randint(1, 5)):
+        if rng.random() < 0.5:
+            country = rng.choice(site["countries"])
+            if country in selected and len(selected) > 1:
+                selected.remove(country)
+            elif country not in selected:
+                selected.append(country)
+            interactions.append({"type": "countries", "countries": list(selected), "position": position})
+        else:
+            position = rng.randint(0, site["polar_max"])
+            interactions.append({"type": "polar", "countries": list(selected), "position": position})
+    return {"page": "/country", "interactions": interactions}
+
+
+class Recorder:
+    """Latencies, sizes & errors per callback & per interaction, shared by the users."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.sizes = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.dropped = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds, size=0, ok=True, dropped=False):
+        with self._lock:
+            self.latencies[name].append(seconds)
+            self.sizes[name].append(size)
+            if not ok:
+                self.errors[name] += 1
+            if dropped:
+                self.dropped[name] += 1
+
+    def timed_callback(self, client, name, outputs, inputs, tab=None):
+        start = time.perf_counter()
+        try:
+            status, size, values = client.callback(outputs, inputs, tab)
+        except (OSError, http.client.HTTPException):
+            status, size, values = None, 0, []
+        # 204: the worker skipped a request the tab had moved past
+        self.add(name, time.perf_counter() - start, size, status in (200, 204), status == 204)
+        return values
+
+
+_connections = threading.local()
+
+
+def scrub_step(url, recorder, tab, term, position):
+    """One step of a drag, on a connection of the current thread: the slider_store request & the map it triggers."""
+    if getattr(_connections, 'url', None) != url:
+        _connections.url, _connections.client = url, Client(url)
+    client = _connections.client
+    values = recorder.timed_callback(client, "update_from_date_slider", [("slider_store", "data")],
+                                     [(("map-date-slider", "value"), position)], tab)
+    if not values:
+        return None
+    recorder.timed_callback(client, "update_from_store", [("test_map", "figure"), ("food_map_header", "children")],
+                            [(("icon_store", "data"), term), (("slider_store", "data"), values[0])], tab)
+    return values[0]
+
+
+def run_session(client, session, recorder, site, think_ms=THINK_MS, pause_ms=PAUSE_MS, drag_pool=None):
+    """
+    Play one session in a tab of its own, chaining every callback on the outputs of the one before like the browser does.
+
+    The steps of a drag go to drag_pool without waiting for each other, or one after the other without one.
+    """
+    tab = Tab()
+    start = time.perf_counter()
+    recorder.timed_callback(client, "display_page", [("page-content", "children")], [(("url", "pathname"), session["page"])], tab)
+    if session["page"] == "/food":
+        # the page opens on the first date & the default term
+        values = recorder.timed_callback(client, "update_from_date_slider", [("slider_store", "data")],
+                                         [(("map-date-slider", "value"), site["slider"][0])], tab)
+        date = values[0] if values else None
+        recorder.timed_callback(client, "update_from_store", [("test_map", "figure"), ("food_map_header", "children")],
+                                [(("icon_store", "data"), site["default_term"]), (("slider_store", "data"), date)], tab)
+    else:
+        recorder.timed_callback(client, "map_clicked", [("polar-title", "children"), ("joy-graph", "figure")],
+                                [(("country-dropdown", "value"), site["selected"])], tab)
+        recorder.timed_callback(client, "update_polar_frame", [("polar-chart", "figure")],
+                                [(("country-dropdown", "value"), site["selected"]), (("polar-date-slider", "value"), 0)], tab)
+    recorder.add("open " + session["page"], time.perf_counter() - start)
+
+    for interaction in session["interactions"]:
+        time.sleep(pause_ms / 1000)
+        start = time.perf_counter()
+        if interaction["type"] == "term":
+            recorder.timed_callback(client, "update_from_store", [("test_map", "figure"), ("food_map_header", "children")],
+                                    [(("icon_store", "data"), interaction["term"]), (("slider_store", "data"), date)], tab)
+        elif interaction["type"] == "scrub":
+            steps = []
+            for position in interaction["positions"]:
+                if drag_pool is None:
+                    steps.append(scrub_step(client.url, recorder, tab, interaction["term"], position))
+                else:
+                    steps.append(drag_pool.submit(scrub_step, client.url, recorder, tab, interaction["term"], position))
+                time.sleep(think_ms / 1000)
+            steps = [step if drag_pool is None else step.result() for step in steps]
+            date = steps[-1] or date
+        elif interaction["type"] == "countries":
+            recorder.timed_callback(client, "map_clicked", [("polar-title", "children"), ("joy-graph", "figure")],
+                                    [(("country-dropdown", "value"), interaction["countries"])], tab)
+            recorder.timed_callback(client, "update_polar_frame", [("polar-chart", "figure")],
+                                    [(("country-dropdown", "value"), interaction["countries"]),
+                                     (("polar-date-slider", "value"), interaction["position"])], tab)
+        else:
+            recorder.timed_callback(client, "update_polar_frame", [("polar-chart", "figure")],
+                                    [(("country-dropdown", "value"), interaction["countries"]),
+                                     (("polar-date-slider", "value"), interaction["position"])], tab)
+        recorder.add(interaction["type"], time.perf_counter() - start)
+
+
+###########################
+# RUN
+###########################
+def run(url, users, sessions, duration=None, think_ms=THINK_MS, pause_ms=PAUSE_MS, site=None, drag_connections=DRAG_CONNECTIONS):
+    """Play sessions with users threads, until they're all played or duration seconds are up."""
+    site = site or discover(Client(url))
+    recorder = Recorder()
+    queue = list(reversed(sessions))
+    queue_lock = threading.Lock()
+    deadline = time.perf_counter() + duration if duration else None
+
+    def user():
+        client = Client(url)
+        with ThreadPoolExecutor(drag_connections) as drag_pool:
+            while deadline is None or time.perf_counter() < deadline:
+                with queue_lock:
+                    if not queue:
+                        return
+                    session = queue.pop()
+                run_session(client, session, recorder, site, think_ms, pause_ms, drag_pool if drag_connections > 1 else None)
+
+    threads = [threading.Thread(target=user, daemon=True) for _ in range(users)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(recorder, time.perf_counter() - start, users)
+
+
+def summarize(recorder, elapsed, users):
+    results = {"users": users, "seconds": elapsed, "requests": 0, "errors": 0, "dropped": 0, "timings": {}}
+    for name, latencies in recorder.latencies.items():
+        latencies = np.array(latencies) * 1000
+        results["timings"][name] = {
+            "count": len(latencies),
+            "per_s": len(latencies) / elapsed,
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p90_ms": float(np.percentile(latencies, 90)),
+            "p99_ms": float(np.percentile(latencies, 99)),
+            "mean_bytes": float(np.mean(recorder.sizes[name])),
+            "errors": recorder.errors[name],
+            "dropped": recorder.dropped[name],
+        }
+        if not name.startswith("open ") and name not in ("term", "scrub", "countries", "polar"):
+            results["requests"] += len(latencies)
+            results["errors"] += recorder.errors[name]
+            results["dropped"] += recorder.dropped[name]
+    results["requests_per_s"] = results["requests"] / elapsed
+    return results
+
+
+def print_results(results):
+    print(f"{results['users']} users, {results['seconds']:.1f}s, {results['requests']} requests, "
+          f"{results['requests_per_s']:.1f}/s, {results['errors']} errors "
+          f"({results['errors'] / max(results['requests'], 1):.1%}), {results['dropped']} dropped as stale")
+    print(f"{'callback / interaction':<26} {'count':>7} {'per s':>7} {'p50':>9} {'p90':>9} {'p99':>9} {'size':>9} {'errors':>7} {'dropped':>8}")
+    for name, timing in results["timings"].items():
+        print(f"{name:<26} {timing['count']:>7} {timing['per_s']:>7.1f} {timing['p50_ms']:>7.0f}ms"
+              f" {timing['p90_ms']:>7.0f}ms {timing['p99_ms']:>7.0f}ms {timing['mean_bytes'] / 1024:>7.1f}KB"
+              f" {timing['errors']:>7} {timing['dropped']:>8}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test a running dashboard with simulated sessions.")
+    parser.add_argument("--url", default="http://127.0.0.1:8050", help="where the dashboard runs")
+    parser.add_argument("--users", type=int, default=10, help="concurrent users")
+    parser.add_argument("--sessions", type=int, default=100, help="sessions to generate")
+    parser.add_argument("--duration", type=float, help="stop after this many seconds")
+    parser.add_argument("--seed", type=int, default=0, help="seed the sessions are generated from")
+    parser.add_argument("--think-ms", type=float, default=THINK_MS, help="pause between the steps of a drag")
+    parser.add_argument("--pause-ms", type=float, default=PAUSE_MS, help="pause between interactions")
+    parser.add_argument("--drag-connections", type=int, default=DRAG_CONNECTIONS, help="a drag's requests in flight at once, 1 waits for each")
+    parser.add_argument("--record", help="write the generated sessions to this file")
+    parser.add_argument("--replay", help="play the sessions from this file instead")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args(argv)
+
+    site = discover(Client(args.url))
+    if args.replay:
+        with open(args.replay) as f:
+            sessions = [json.loads(line) for line in f if line.strip()]
+    else:
+        rng = random.Random(args.seed)
+        sessions = [generate_session(site, rng) for _ in range(args.sessions)]
+    if args.record:
+        with open(args.record, 'w') as f:
+            f.writelines(json.dumps(session) + '\n' for session in sessions)
+
+    results = run(args.url, args.users, sessions, args.duration, args.think_ms, args.pause_ms, site, args.drag_connections)
+    if args.json:
+        print(json.dumps(results))
+    else:
+        print_results(results)
+
+
+if __name__ == '__main__':
+    main()
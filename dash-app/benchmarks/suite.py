@@ -0,0 +1,144 @@
+"""
+Benchmark Suite
+
+Esme Middaugh
+Nele Peshel
+Vivien van Dongen
+
+Runs offline on the real data (scale 1) and on synthetic copies with every
+country repeated 10x & 100x (see benchmarks/synthetic.py), measuring:
+    - ingestion of the Google Trends exports, from scratch & with nothing changed
+    - the cold start of index (its import & first answer) in a fresh process
+      per scale, against COLD_START_BUDGET_S, & warming its pages up
+    - p50 / p99 latency & response bytes of every callback over its input grid
+    - peak resident memory
+and compares the results with the stored baseline, flagging anything that got
+more than TOLERANCE slower or bigger.
+
+Usage, from the dash-app directory:
+    python -m benchmarks.suite
+    python -m benchmarks.suite --scales 1 --sample 4  # quicker, every 4th date
+    python -m benchmarks.suite --save-baseline  # after a change that's meant to move the numbers
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from pipeline import ingest
+from benchmarks import synthetic
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # dash-app
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+SCALES = [1, 10, 100]
+TOLERANCE = 0.2  # relative change reported as a regression
+COLD_START_BUDGET_S = 1.0  # a fresh worker has to answer within this, however much data there is
+
+
+###########################
+# MEASUREMENTS
+###########################
+def time_ingestion(scale, work_dir):
+    """Seconds to ingest scale copies of the exports from scratch, then again with nothing changed."""
+    export_dir = synthetic.build_exports(scale, os.path.join(work_dir, 'exports'))
+    output_dir = os.path.join(work_dir, 'ingested')
+    os.makedirs(output_dir, exist_ok=True)
+    start = time.perf_counter()
+    ingest.ingest(export_dir, output_dir, full=True)
+    full = time.perf_counter() - start
+    start = time.perf_counter()
+    ingest.ingest(export_dir, output_dir)
+    return {"ingest_full_s": full, "ingest_unchanged_s": time.perf_counter() - start}
+
+
+def time_app(scale, work_dir, sample=1):
+    """Cold import, callback & memory figures of benchmarks/callbacks.py, run on a scale copy of the data."""
+    data_dir = output_dir = os.path.join(work_dir, 'data')
+    if scale == 1:
+        data_dir = synthetic.DATA_DIR
+    else:
+        synthetic.build_data_dir(scale, output_dir)
+    result = subprocess.run([sys.executable, '-m', 'benchmarks.callbacks', '--json', '--sample', str(sample)],
+                            cwd=BASE_DIR, env=dict(os.environ, DATA_DIR=data_dir),
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])  # the pages may print before
+
+
+def run(scales=SCALES, sample=1):
+    results = {}
+    for scale in scales:
+        with tempfile.TemporaryDirectory() as work_dir:
+            print(f"scale {scale}x ...", file=sys.stderr)
+            results[str(scale)] = dict(time_ingestion(scale, work_dir), **time_app(scale, work_dir, sample))
+            results[str(scale)]["sample"] = sample
+    return results
+
+
+###########################
+# BASELINE
+###########################
+def flatten(result):
+    """{'import_s': .., 'update_from_store p50_ms': .., ...} of one scale's result."""
+    metrics = {key: value for key, value in result.items() if key not in ("callbacks", "countries", "sample")}
+    for name, timing in result.get("callbacks", {}).items():
+        for key in ("p50_ms", "p99_ms", "mean_bytes"):
+            metrics[f"{name} {key}"] = timing[key]
+    return metrics
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """Print every metric next to its baseline, returning the ones that regressed by more than tolerance."""
+    regressions = []
+    print(f"{'scale':>5} {'metric':<36} {'baseline':>12} {'now':>12} {'change':>8}")
+    for scale, result in results.items():
+        before = flatten(baseline.get(scale, {}))
+        if baseline.get(scale, {}).get("sample", result["sample"]) != result["sample"]:
+            print(f"{scale:>5}x baseline was run with another --sample, not comparable")
+            before = {}
+        for metric, value in flatten(result).items():
+            if metric not in before or not before[metric]:
+                print(f"{scale:>5} {metric:<36} {'':>12} {value:>12.3f}")
+                continue
+            change = value / before[metric] - 1
+            flag = ""
+            if change > tolerance:
+                flag = "  REGRESSION"
+                regressions.append((scale, metric, change))
+            print(f"{scale:>5} {metric:<36} {before[metric]:>12.3f} {value:>12.3f} {change:>+7.0%}{flag}")
+        if result["cold_start_s"] > COLD_START_BUDGET_S:
+            print(f"{scale:>5}x cold start of {result['cold_start_s']:.2f}s is over the {COLD_START_BUDGET_S}s budget")
+            regressions.append((scale, "cold_start_s", result["cold_start_s"] / COLD_START_BUDGET_S - 1))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ingestion, startup & every callback against the baseline.")
+    parser.add_argument("--scales", type=int, nargs="+", default=SCALES, help="copies of every country to run with")
+    parser.add_argument("--sample", type=int, default=1, help="only every n-th date of the callback grids")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="stored results to compare with")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    args = parser.parse_args(argv)
+
+    results = run(args.scales, args.sample)
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    regressions = compare(results, baseline)
+
+    if args.save_baseline:
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"saved to {args.baseline}")
+    elif regressions:
+        sys.exit(f"{len(regressions)} metrics regressed by more than {TOLERANCE:.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Synthetic Data
+
+Esme Middaugh
+Nele Peshel
+Vivien van Dongen
+
+Scaled copies of the real data for the benchmarks. A copy at scale n holds
+every real country n times over, the extra ones named ger2, nl2, uk2, ...,
+which is the direction the dashboard grows in as countries are added. The
+Google Trends exports are copied the same way, so ingestion can be timed at
+scale too.
+
+Usage, from the dash-app directory, to build a copy to run the dashboard on:
+    python -m benchmarks.synthetic 10 /tmp/data-10x
+    DATA_DIR=/tmp/data-10x python index.py
+"""
+
+import argparse
+import os
+import shutil
+
+import pandas as pd
+
+from pipeline import ingest, store
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # dash-app
+DATA_DIR = os.path.join(BASE_DIR, 'output-data')
+
+
+def clone_code(code, copy):
+    """ger, 3 -> ger3, the first copy keeps the real code."""
+    return code if copy == 1 else f"{code}{copy}"
+
+
+def build_data_dir(scale, data_dir, source_dir=DATA_DIR):
+    """Write a DATA_DIR for the dashboard with every country of source_dir scale times over."""
+    source_store = os.path.join(source_dir, 'store')
+    target_store = os.path.join(data_dir, 'store')
+    os.makedirs(target_store, exist_ok=True)
+    shutil.copy(os.path.join(source_dir, 'terms.csv'), data_dir)
+
+    countries = pd.read_csv(os.path.join(source_dir, 'countries.csv'), keep_default_na=False)
+    copies = []
+    for copy in range(1, scale + 1):
+        clone = countries.copy()
+        clone['country'] = [clone_code(code, copy) for code in countries['country']]
+        if copy > 1:
+            clone['name'] = clone['name'] + f" {copy}"
+            clone['selected'] = 0
+        copies.append(clone)
+    pd.concat(copies, ignore_index=True).to_csv(os.path.join(data_dir, 'countries.csv'), index=False)
+
+    trends = store.read_trends(source_store)
+    trends["country"] = trends["country"].astype(str)
+    store.write_trends(pd.concat([trends.assign(country=[clone_code(code, copy) for code in trends["country"]])
+                                  for copy in range(1, scale + 1)], ignore_index=True), target_store)
+    store.write_table(store.read_who(source_store), store.WHO_FILE, target_store)
+    store.write_version(target_store)
+    return data_dir
+
+
+def build_exports(scale, export_dir, source_dir=ingest.TRENDS_INPUT_DIR):
+    """Copy every Google Trends export scale times into export_dir, renaming the country in the filename."""
+    os.makedirs(export_dir, exist_ok=True)
+    for name in sorted(os.listdir(source_dir)):
+        if not name.endswith('.csv'):
+            continue
+        country, rest = name.split('_', 1)
+        for copy in range(1, scale + 1):
+            shutil.copy(os.path.join(source_dir, name), os.path.join(export_dir, f"{clone_code(country, copy)}_{rest}"))
+    return export_dir
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build a scaled copy of the dashboard's data.")
+    parser.add_argument("scale", type=int, help="number of copies of every country")
+    parser.add_argument("data_dir", help="folder to write the copy to, use it with DATA_DIR")
+    args = parser.parse_args(argv)
+    build_data_dir(args.scale, args.data_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+// Highlights the nav link of the current page. Bundled into bundle/ by static_bundle.py, not loaded from assets/
+(function() {
+    // Set Via URL, eg when the page is refreshed
+    function setCurrentFromUrl() {
+        // only the page links, the term buttons & the play button share their class
+        var navLinks = document.querySelectorAll("#nav_links .nav__link");
+        var currentPage = '/' + location.pathname.replace(/\/+$/, "").split("/").pop();
+
+        if (currentPage != "/") { // If '/' then default and leaving with the set current page from index.py
+            for (var i = 0; i < navLinks.length; i++) {
+                var url = '/' + navLinks[i].href.split('/').pop();
+                navLinks[i].className = url == currentPage ? "nav__link nav__link--current" : "nav__link";
+            }
+        }
+    }
+
+    // Dash renders the layout after this script has run, so wait for #nav_links to be added
+    if (document.getElementById("nav_links")) {
+        setCurrentFromUrl();
+    } else {
+        var observer = new MutationObserver(function() {
+            if (document.getElementById("nav_links")) {
+                observer.disconnect();
+                setCurrentFromUrl();
+            }
+        });
+        observer.observe(document.body, {childList: true, subtree: true});
+    }
+
+    // Set Via Clicking, listening on the document so links rendered later are covered too
+    document.addEventListener("click", function(event) {
+        var link = event.target.closest("#nav_links .nav__link");
+        if (!link) {
+            return;
+        }
+        link.classList.add("nav__link--current");
+        Array.prototype.forEach.call(link.parentNode.children, function(sibling) {
+            if (sibling !== link) {
+                sibling.classList.remove("nav__link--current");
+            }
+        });
+    });
+})();
@@ -0,0 +1,256 @@
+"""
+Data Access
+
+Esme Middaugh
+Nele Peshel
+Vivien van Dongen
+
+Shared data layer for the pages in ./apps/. Each dataset is read once per
+process from the typed store written by the cleaning step (see pipeline/store.py),
+through a memory map so workers forked by `gunicorn --preload` share the
+same pages instead of holding their own copies.
+
+Search terms come from the catalog in terms.csv & countries from the registry
+in countries.csv, with their ISO codes, display names & map extents. Each
+country's trends are loaded the first time that country is asked for, so
+countries nobody looks at cost nothing.
+
+The shared frames are read-only; the get_* accessors return copies that the
+callbacks are free to modify.
+"""
+
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from app import INPUT_DIR
+from pipeline import store
+
+STORE_DIR = os.path.join(INPUT_DIR, 'store')
+COUNTRIES_FILE = os.path.join(INPUT_DIR, 'countries.csv')
+TERMS_FILE = os.path.join(INPUT_DIR, 'terms.csv')
+
+# TERM CATALOG
+# One row per search term, in the order the term picker shows them: the name used in the exports,
+# its display name & its icon in assets/icons/
+TERMS = pd.read_csv(TERMS_FILE, index_col='term', keep_default_na=False)
+DISPLAY_TERMS = TERMS['display_term'].to_dict()
+
+# COUNTRY REGISTRY
+# One row per country code used in the Google Trends exports: display name, ISO 3166 codes
+# used to place it on the maps, its bounding box in degrees & whether the country page starts with it selected
+COUNTRIES = pd.read_csv(COUNTRIES_FILE, index_col='country', keep_default_na=False)
+COUNTRY_NAMES = COUNTRIES['name'].to_dict()
+COUNTRY_ISO = COUNTRIES[['iso_num', 'iso_alpha']]
+
+# Extent of plotly's europe geo scope, which a projection_scale of 1 shows
+EUROPE_LON_RANGE = 90
+EUROPE_LAT_RANGE = 55
+
+_lock = threading.RLock()  # loaders may load other datasets, e.g. trends() loads every country
+_cache = {}
+
+
+###########################
+# LOADING
+###########################
+def _add_display_columns(trends_df):
+    trends_df['date_str'] = trends_df['date'].dt.strftime('%Y-%m-%d')
+    trends_df['display_term'] = trends_df['term'].map(DISPLAY_TERMS)
+    trends_df['display_country'] = trends_df['country'].map(COUNTRY_NAMES)
+    return trends_df
+
+
+def _load_country_trends(country):
+    return _add_display_columns(store.read_trends_partition(country, STORE_DIR))
+
+
+def _load_available_countries():
+    partitions = set(store.trends_partitions(STORE_DIR))
+    return [country for country in COUNTRIES.index if country in partitions]
+
+
+def _load_country_sums(country):
+    # Sum & count of the country's score differences on every (date, term) of the shared grid,
+    # so the mean over any set of countries is their arrays added up, see get_country_means
+    trends_df = country_trends(country)
+    rows = trend_dates().get_indexer(trends_df['date'])
+    columns = TERMS.index.get_indexer(trends_df['term'].astype(str))
+    known = columns >= 0  # terms dropped from the catalog aren't shown
+    sums = np.zeros((len(trend_dates()), len(TERMS)))
+    counts = np.zeros((len(trend_dates()), len(TERMS)), dtype=np.int64)
+    np.add.at(sums, (rows[known], columns[known]), trends_df['score_difference'].to_numpy()[known])
+    np.add.at(counts, (rows[known], columns[known]), 1)
+    return sums, counts
+
+
+def _get(name, loader):
+    """Load a dataset the first time it is asked for, then keep it for the life of the process."""
+    if name not in _cache:
+        with _lock:
+            if name not in _cache:
+                _cache[name] = loader()
+    return _cache[name]
+
+
+def available_countries():
+    """Codes of the registered countries that have trends data, in registry order."""
+    return _get('countries', _load_available_countries)
+
+
+def country_trends(country):
+    """A single country's Google Trends year over year differences, sorted by term & date. Read-only."""
+    return _get(('trends', country), lambda: _load_country_trends(country))
+
+
+def country_sums(country):
+    """(sums, counts) arrays of a country's score differences, indexed [trend_dates(), TERMS]. Read-only."""
+    return _get(('sums', country), lambda: _load_country_sums(country))
+
+
+def trends():
+    """Every country's Google Trends year over year differences, sorted by term, country & date. Read-only."""
+    return _get('trends', lambda: store.concat_partitions([country_trends(country) for country in available_countries()]))
+
+
+def trend_dates():
+    """Every date with Google Trends data, read without loading the countries' partitions."""
+    return _get('trend_dates', lambda: pd.DatetimeIndex(
+        store.read_trends(STORE_DIR, columns=['date'], countries=available_countries())['date'].unique()).sort_values())
+
+
+def data_version():
+    """Version of the store this process reads from, see pipeline/store.py."""
+    return _get('version', lambda: store.read_version(STORE_DIR))
+
+
+_published = {}  # version.txt's mtime & the version it held then
+
+
+def published_version():
+    """The version the store publishes right now, re-reading version.txt only once it was replaced."""
+    try:
+        mtime = os.stat(os.path.join(STORE_DIR, store.VERSION_FILE)).st_mtime_ns
+    except FileNotFoundError:
+        return data_version()  # nothing published, stay with what was loaded
+    if _published.get('mtime') != mtime:
+        _published.update(mtime=mtime, version=store.read_version(STORE_DIR))
+    return _published['version']
+
+
+def who():
+    """World Health Organization Covid data for the mapped countries. Read-only."""
+    return _get('who', lambda: store.read_who(STORE_DIR))
+
+
+def reload():
+    """Forget every loaded dataset, so each is read from the store again when it's next asked for."""
+    with _lock:
+        _cache.clear()
+
+
+def load():
+    """Load everything up front, e.g. before gunicorn forks its workers."""
+    data_version()
+    trends()
+    for country in available_countries():
+        country_sums(country)
+    who()
+
+
+###########################
+# COUNTRY REGISTRY
+###########################
+def country_options():
+    """Dropdown options & the initially selected values for the countries with trends data."""
+    options = [{'label': COUNTRY_NAMES[country][0].upper() + COUNTRY_NAMES[country][1:], 'value': country}
+               for country in available_countries()]
+    selected = [country for country in available_countries() if COUNTRIES.at[country, 'selected']]
+    return options, selected
+
+
+def join_country_names(countries):
+    """Country names listed for a sentence, like "Germany, the Netherlands, and the United Kingdom"."""
+    names = [COUNTRY_NAMES[country] for country in countries]
+    if len(names) < 3:
+        return ' and '.join(names)
+    return f"{', '.join(names[:-1])}, and {names[-1]}"
+
+
+def map_view(countries):
+    """Center & projection_scale of a europe scoped map fitting the bounding boxes of countries."""
+    extent = COUNTRIES.loc[list(countries)]
+    lon_min, lon_max = extent['lon_min'].min(), extent['lon_max'].max()
+    lat_min, lat_max = extent['lat_min'].min(), extent['lat_max'].max()
+    scale = min(EUROPE_LON_RANGE / (lon_max - lon_min), EUROPE_LAT_RANGE / (lat_max - lat_min))
+    return {
+        'center_lon': round((lon_min + lon_max) / 2, 4),
+        'center_lat': round((lat_min + lat_max) / 2, 4),
+        'projection_scale': round(scale, 1),
+    }
+
+
+###########################
+# ENRICHMENT
+###########################
+def add_country_metadata(data):
+    """Add the iso_num & iso_alpha of each row's country, in one lookup however many countries there are."""
+    iso = COUNTRY_ISO.reindex(data['country'].astype(str))
+    return data.assign(iso_num=iso['iso_num'].to_numpy(), iso_alpha=iso['iso_alpha'].to_numpy())
+
+
+###########################
+# ACCESSORS
+###########################
+def get_country_series(countries, start=None):
+    """
+    Every term's time series for the given countries, optionally from a start date on.
+
+    Only these countries' partitions are loaded, no other country's rows are read or scanned.
+    """
+    if isinstance(countries, str):
+        countries = [countries]
+    countries = [country for country in countries if country in available_countries()]
+    if not countries:
+        return country_trends(available_countries()[0]).iloc[0:0].copy()
+    series = store.concat_partitions([country_trends(country) for country in countries])
+    if start is not None:
+        series = series[series['date'] >= pd.Timestamp(start)]
+    return series
+
+
+def get_country_means(countries, start=None):
+    """
+    Every term's mean score difference over the given countries, by date, optionally from a start date on.
+
+    Added up from the per country sums & counts, so it takes the same time however many rows
+    the countries have. Only dates & terms any of the countries has data for are included.
+    """
+    if isinstance(countries, str):
+        countries = [countries]
+    countries = [country for country in countries if country in available_countries()]
+    dates = trend_dates()
+    sums = np.zeros((len(dates), len(TERMS)))
+    counts = np.zeros((len(dates), len(TERMS)), dtype=np.int64)
+    for country in countries:
+        country_sum, country_count = country_sums(country)
+        sums += country_sum
+        counts += country_count
+
+    if start is not None:
+        after = dates >= pd.Timestamp(start)
+        dates, sums, counts = dates[after], sums[after], counts[after]
+    # ordered by date & display name, as a groupby over (date, display_term) would give them
+    rows = counts.any(axis=1)
+    terms = [i for i in np.argsort(TERMS['display_term'].to_numpy(), kind='stable') if counts[:, i].any()]
+    sums, counts = sums[rows][:, terms], counts[rows][:, terms]
+    with np.errstate(invalid='ignore'):
+        means = sums / counts  # NaN where a country set has no data for a term on a date
+    display_terms = TERMS['display_term'].to_numpy()[terms]
+    return pd.DataFrame({
+        'date': np.repeat(dates[rows], len(terms)),
+        'display_term': pd.Categorical(np.tile(display_terms, rows.sum()), categories=display_terms),
+        'score_difference': means.ravel(),
+    })
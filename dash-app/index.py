@@ -13,8 +13,12 @@ import dash_core_components as dcc
 import dash_html_components as html
 from dash.dependencies import Input, Output
 
-from app import app, TITLE
-from apps import food_map, country_map
+from app import app, response_cache, stale_requests, metrics, TITLE, WARM_UP, DATA_VERSION_CHECK_SECONDS
+import datastore
+import pages
+
+# Declare every page's callbacks, their data is only read once they're used, see pages.py
+pages.import_all()
 
 
 def serve_layout():
@@ -89,102 +93,118 @@ def serve_layout():
 
 @app.callback(Output('page-content', 'children'),
               [Input('url', 'pathname')])
+@metrics.timed
 def display_page(pathname):
     """Callback function to render different page-content depending on the url passed."""
-    try:
-        if pathname == "/country":
-            page_content = html.Div(
-                className="",
-                children=[
-                    html.Div(
-                        className="row",
-                        children=[
-                            country_map.layout,
-                        ]
-                    ),
-                    html.H3("ABOUT", className="text-centered nav__link"),
-                    html.Div(
-                        className="nav_container",
-                        children=[
-                            dcc.Markdown(
-                            className="project-explanation flex-one centered",
-                            children='''Searching For The Essentials is an interactive web map experience allowing the user to explore the evolution of 
-                            [Google Trends](https://trends.google.com)  data during the COVID-19 pandemic. We used the 
-                            Google data from January 2019 to November 2020 and calculated the Search Trends differences 
-                            between the first year (1/2019-11/2019) and the second year with COVID-19 impact (1/2020-11/2020). 
-                            The result from this calculation is used for the data visualizations. 
-                            A positive search query value indicates that the search term was searched more often during the 
-                            pandemic than in the previous year, whereas a negative search value indicates a lower search 
-                            frequency during the pandemic compared to the year before.
-                            '''),
-                            dcc.Markdown(
-                            className="project-explanation flex-one centered",
-                            children='''The COVID-19 cases per 100.000 inhabitants per country were calculated from the daily 
-                            reported COVID-19 data available on the website of the [World Health Organization](https://www.who.int/). 
-                            Note, that the countries were having lest testing capacity during the start of the pandemic 
-                            in March 2020 resulting in less accuracy than for the second wave starting in autumn 2020. 
-                            '''),
-                            dcc.Markdown(
-                            className="project-explanation flex-one centered row",
-                            children='''
-                            In contrast to the values shown in the map, the radar chart includes negative and positive 
-                            values indicating a lower or higher search frequency than in the previous year.
-                            ''')
-                            ],
-                    ),
-                ]
-            )
-        elif pathname is None or pathname == "/" or pathname == "/food":
-            page_content = html.Div(
-                className="",
-                children=[
-                    html.Div(
-                        className="row",
-                        children=[
-                            food_map.layout,
-                        ]
-                    ),
-                    html.H3("ABOUT", className="text-centered nav__link"),
-                    html.Div(
-                        className="nav_container",
-                        children=[
-                            dcc.Markdown(
-                            className="project-explanation flex-one centered",
-                            children='''Searching For The Essentials is an interactive web map experience allowing the user to explore the evolution of 
-                            [Google Trends](https://trends.google.com)  data during the COVID-19 pandemic. We used the 
-                            Google data from January 2019 to November 2020 and calculated the Search Trends differences 
-                            between the first year (1/2019-11/2019) and the second year with COVID-19 impact (1/2020-11/2020). 
-                            The result from this calculation is used for the data visualizations. 
-                            A positive search query value indicates that the search term was searched more often during the 
-                            pandemic than in the previous year, whereas a negative search value indicates a lower search 
-                            frequency during the pandemic compared to the year before.
-                            '''),
-                            dcc.Markdown(
-                            className="project-explanation flex-one centered",
-                            children='''The COVID-19 cases per 100.000 inhabitants per country were calculated from the daily 
-                            reported COVID-19 data available on the website of the [World Health Organization](https://www.who.int/). 
-                            Note, that the countries were having lest testing capacity during the start of the pandemic 
-                            in March 2020 resulting in less accuracy than for the second wave starting in autumn 2020. 
-                            '''),
-                            dcc.Markdown(
-                            className="project-explanation flex-one centered row",
-                            children='''
-                            In contrast to the values shown in the map, the radar chart includes negative and positive 
-                            values indicating a lower or higher search frequency than in the previous year.
-                            ''')
-                        ]
-                    ),
-                ]
-            ),
-        else:
-            page_content = html.Div([html.H1('404 Error - Page not found')])
-        return page_content
-    except ImportError:
-        return html.Div("Something went wrong with one of your imported graphs! Please check.")
+    if pathname == "/country":
+        page_content = html.Div(
+            className="",
+            children=[
+                html.Div(
+                    className="row",
+                    children=[
+                        pages.layout(pathname),
+                    ]
+                ),
+                html.H3("ABOUT", className="text-centered nav__link"),
+                html.Div(
+                    className="nav_container",
+                    children=[
+                        dcc.Markdown(
+                        className="project-explanation flex-one centered",
+                        children='''Searching For The Essentials is an interactive web map experience allowing the user to explore the evolution of 
+                        [Google Trends](https://trends.google.com)  data during the COVID-19 pandemic. We used the 
+                        Google data from January 2019 to November 2020 and calculated the Search Trends differences 
+                        between the first year (1/2019-11/2019) and the second year with COVID-19 impact (1/2020-11/2020). 
+                        The result from this calculation is used for the data visualizations. 
+                        A positive search query value indicates that the search term was searched more often during the 
+                        pandemic than in the previous year, whereas a negative search value indicates a lower search 
+                        frequency during the pandemic compared to the year before.
+                        '''),
+                        dcc.Markdown(
+                        className="project-explanation flex-one centered",
+                        children='''The COVID-19 cases per 100.000 inhabitants per country were calculated from the daily 
+                        reported COVID-19 data available on the website of the [World Health Organization](https://www.who.int/). 
+                        Note, that the countries were having lest testing capacity during the start of the pandemic 
+                        in March 2020 resulting in less accuracy than for the second wave starting in autumn 2020. 
+                        '''),
+                        dcc.Markdown(
+                        className="project-explanation flex-one centered row",
+                        children='''
+                        In contrast to the values shown in the map, the radar chart includes negative and positive 
+                        values indicating a lower or higher search frequency than in the previous year.
+                        ''')
+                        ],
+                ),
+            ]
+        )
+    elif pathname is None or pathname == "/" or pathname == "/food":
+        page_content = html.Div(
+            className="",
+            children=[
+                html.Div(
+                    className="row",
+                    children=[
+                        pages.layout(pathname),
+                    ]
+                ),
+                html.H3("ABOUT", className="text-centered nav__link"),
+                html.Div(
+                    className="nav_container",
+                    children=[
+                        dcc.Markdown(
+                        className="project-explanation flex-one centered",
+                        children='''Searching For The Essentials is an interactive web map experience allowing the user to explore the evolution of 
+                        [Google Trends](https://trends.google.com)  data during the COVID-19 pandemic. We used the 
+                        Google data from January 2019 to November 2020 and calculated the Search Trends differences 
+                        between the first year (1/2019-11/2019) and the second year with COVID-19 impact (1/2020-11/2020). 
+                        The result from this calculation is used for the data visualizations. 
+                        A positive search query value indicates that the search term was searched more often during the 
+                        pandemic than in the previous year, whereas a negative search value indicates a lower search 
+                        frequency during the pandemic compared to the year before.
+                        '''),
+                        dcc.Markdown(
+                        className="project-explanation flex-one centered",
+                        children='''The COVID-19 cases per 100.000 inhabitants per country were calculated from the daily 
+                        reported COVID-19 data available on the website of the [World Health Organization](https://www.who.int/). 
+                        Note, that the countries were having lest testing capacity during the start of the pandemic 
+                        in March 2020 resulting in less accuracy than for the second wave starting in autumn 2020. 
+                        '''),
+                        dcc.Markdown(
+                        className="project-explanation flex-one centered row",
+                        children='''
+                        In contrast to the values shown in the map, the radar chart includes negative and positive 
+                        values indicating a lower or higher search frequency than in the previous year.
+                        ''')
+                    ]
+                ),
+            ]
+        ),
+    else:
+        page_content = html.Div([html.H1('404 Error - Page not found')])
+    return page_content
+
+response_cache.cache_callback(Output('page-content', 'children'))
 
 
 app.layout = serve_layout
 server = app.server
 
+# Time every callback request & serve the timings on /metrics, see metrics.py
+# (before the response cache, so the requests it answers are counted too)
+metrics.init_app(server, app.config.requests_pathname_prefix + '_dash-update-component', app.callback_map)
+metrics.register_cache('response', response_cache)
+
+# Skip building figures for slider positions the browser has moved past, see stale_requests.py
+stale_requests.init_app(server, app.config.requests_pathname_prefix + '_dash-update-component')
+
+# Load the pages' data in the background, at startup or on first use, see WARM_UP in app.py
+pages.init_app(server, WARM_UP)
+
+# Answer repeated requests to the cached callbacks from memory, see response_cache.py,
+# reloading the data & pages once the store publishes a new version
+response_cache.init_app(server, datastore.published_version, app.config.requests_pathname_prefix + '_dash-update-component',
+                        check_interval=DATA_VERSION_CHECK_SECONDS, on_change=pages.reload)
+
 if __name__ == '__main__':
     app.run_server(debug=False)
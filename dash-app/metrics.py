@@ -0,0 +1,222 @@
+"""
+Callback Metrics
+
+Esme Middaugh
+Nele Peshel
+Vivien van Dongen
+
+Instrumentation of the Dash callbacks, served in Prometheus' text format on
+/metrics. Every POST to _dash-update-component is timed, split into:
+    - filter: selecting the data, marked with `with metrics.phase("filter")`
+    - figure: building the figure, marked with `with metrics.phase("figure")`
+    - other: the rest of the callback function, wrapped with metrics.timed
+    - serialize: everything after the callback returns, Dash turning its
+      result into JSON & the request handling around it
+together with the response bytes (before the gzip, answers from the
+response cache are already gzipped) and whether the response cache
+answered it. Callbacks slower than slow_ms are logged with their inputs.
+
+Each gunicorn worker counts its own requests, Prometheus adds them up when
+it scrapes every worker.
+"""
+
+import bisect
+import functools
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+import flask
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]  # seconds
+SIZE_BUCKETS = [1024, 4096, 16384, 65536, 262144, 1048576, 4194304]  # bytes
+PHASES = ["filter", "figure", "other", "serialize", "total"]
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, **extra):
+    pairs = list(zip(names, values)) + list(extra.items())
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Histogram:
+    """Prometheus histogram with a fixed set of label names."""
+
+    def __init__(self, name, help, label_names, buckets):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}  # label values -> [count per bucket (+Inf last), sum]
+
+    def observe(self, label_values, value):
+        series = self._series.setdefault(tuple(label_values), [[0] * (len(self.buckets) + 1), 0.0])
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_values, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ["+Inf"], counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, label_values, le=bound)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, label_values)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, label_values)} {cumulative}")
+        return lines
+
+
+class CallbackMetrics:
+    """Per callback latency, size & cache histograms of a Dash app, logging the ones slower than slow_ms."""
+
+    def __init__(self, slow_ms=1000):
+        self.slow_ms = slow_ms
+        self.duration = Histogram("dash_callback_duration_seconds", "Callback time by phase.",
+                                  ["callback", "phase"], DURATION_BUCKETS)
+        self.size = Histogram("dash_callback_response_bytes", "Callback response body size.",
+                              ["callback", "cache"], SIZE_BUCKETS)
+        self.requests = defaultdict(int)  # (callback, cache, status) -> count
+        self.slow = defaultdict(int)  # callback -> count
+        self.caches = {}
+        self.callback_map = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, server, path='/_dash-update-component', callback_map=None, metrics_path='/metrics'):
+        """
+        Time the callback requests to path on the Flask server & serve the metrics on metrics_path.
+
+        Call it before response_cache.init_app, so requests it answers are counted too.
+        callback_map is the Dash app's, to name callbacks after their function.
+        """
+        self.path = path
+        self.callback_map = callback_map if callback_map is not None else {}
+        server.before_request(self._before_request)
+        server.after_request(self._after_request)
+        server.add_url_rule(metrics_path, 'metrics', self.render_response)
+
+    def register_cache(self, name, cache):
+        """Export the hits & misses counters of a FigureCache or ResponseCache."""
+        self.caches[name] = cache
+
+    ###########################
+    # MARKING PHASES
+    ###########################
+    @contextmanager
+    def phase(self, name):
+        """Add the time spent in the with block to the phase of the current callback request."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if flask.has_request_context() and 'callback_phases' in flask.g:
+                flask.g.callback_phases[name] += time.perf_counter() - start
+
+    def timed(self, func):
+        """Time a callback function, so what it does outside its phases is counted as other."""
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.phase('callback'):
+                return func(*args, **kwargs)
+        return wrapper
+
+    ###########################
+    # REQUEST HOOKS
+    ###########################
+    def callback_name(self, output):
+        """The function name of the callback with this output id, or the id itself."""
+        func = self.callback_map.get(output, {}).get('callback')
+        return getattr(getattr(func, '__wrapped__', func), '__name__', output)
+
+    def _before_request(self):
+        request = flask.request
+        if request.method != 'POST' or request.path != self.path:
+            return
+        flask.g.callback_start = time.perf_counter()
+        flask.g.callback_phases = defaultdict(float)
+
+    def _after_request(self, response):
+        start = flask.g.pop('callback_start', None)
+        if start is None:
+            return response
+        total = time.perf_counter() - start
+        phases = flask.g.pop('callback_phases')
+        body = flask.request.get_json(silent=True) or {}
+        name = self.callback_name(body.get('output'))
+
+        if response.status_code == 304:
+            cache = 'not_modified'
+        elif flask.g.get('response_cache_hit'):
+            cache = 'hit'
+        elif 'response_cache_key' in flask.g:
+            cache = 'miss'
+        else:
+            cache = 'uncached'
+        size = 0 if response.direct_passthrough else len(response.get_data())
+
+        callback = phases.pop('callback', 0.0)
+        timings = {
+            'filter': phases['filter'],
+            'figure': phases['figure'],
+            'other': max(callback - phases['filter'] - phases['figure'], 0.0),
+            'serialize': total - callback,
+            'total': total,
+        }
+        with self._lock:
+            for phase in PHASES:
+                self.duration.observe((name, phase), timings[phase])
+            self.size.observe((name, cache), size)
+            self.requests[(name, cache, response.status_code)] += 1
+            if total * 1000 >= self.slow_ms:
+                self.slow[name] += 1
+
+        if total * 1000 >= self.slow_ms:
+            logger.warning("slow callback %s: %.0f ms (%s), %d bytes, cache %s, inputs %s",
+                           name, total * 1000,
+                           ', '.join(f"{phase} {timings[phase] * 1000:.0f} ms" for phase in PHASES[:-1]),
+                           size, cache, json.dumps(body.get('inputs'))[:500])
+        return response
+
+    ###########################
+    # EXPOSITION
+    ###########################
+    def render(self):
+        """Every metric in Prometheus' text format."""
+        with self._lock:
+            lines = self.duration.render() + self.size.render()
+            lines += ["# HELP dash_callback_requests_total Callback requests by cache outcome & status.",
+                      "# TYPE dash_callback_requests_total counter"]
+            for (name, cache, status), count in sorted(self.requests.items()):
+                lines.append(f"dash_callback_requests_total{_labels(['callback', 'cache', 'status'], [name, cache, status])} {count}")
+            lines += [f"# HELP dash_callback_slow_total Callback requests slower than {self.slow_ms} ms.",
+                      "# TYPE dash_callback_slow_total counter"]
+            for name, count in sorted(self.slow.items()):
+                lines.append(f"dash_callback_slow_total{_labels(['callback'], [name])} {count}")
+        lines += ["# HELP dash_cache_hits_total Figure & response cache hits.",
+                  "# TYPE dash_cache_hits_total counter"]
+        lines += [f"dash_cache_hits_total{_labels(['cache'], [name])} {cache.hits}" for name, cache in sorted(self.caches.items())]
+        lines += ["# HELP dash_cache_misses_total Figure & response cache misses.",
+                  "# TYPE dash_cache_misses_total counter"]
+        lines += [f"dash_cache_misses_total{_labels(['cache'], [name])} {cache.misses}" for name, cache in sorted(self.caches.items())]
+        lines += ["# HELP dash_cache_bytes Bytes held by the figure & response caches.",
+                  "# TYPE dash_cache_bytes gauge"]
+        lines += [f"dash_cache_bytes{_labels(['cache'], [name])} {cache.current_bytes}" for name, cache in sorted(self.caches.items())]
+        lines += ["# HELP dash_cache_coalesced_total Response cache misses that waited for the same request being answered already.",
+                  "# TYPE dash_cache_coalesced_total counter"]
+        lines += [f"dash_cache_coalesced_total{_labels(['cache'], [name])} {cache.coalesced}"
+                  for name, cache in sorted(self.caches.items()) if hasattr(cache, 'coalesced')]
+        lines += ["# HELP dash_cache_version_changes_total Times the response cache was emptied for newly published data.",
+                  "# TYPE dash_cache_version_changes_total counter"]
+        lines += [f"dash_cache_version_changes_total{_labels(['cache'], [name])} {cache.version_changes}"
+                  for name, cache in sorted(self.caches.items()) if hasattr(cache, 'version_changes')]
+        return '\n'.join(lines) + '\n'
+
+    def render_response(self):
+        return flask.Response(self.render(), mimetype='text/plain; version=0.0.4')
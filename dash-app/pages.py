@@ -0,0 +1,151 @@
+"""
+Page Registry
+
+Esme Middaugh
+Nele Peshel
+Vivien van Dongen
+
+Which module in ./apps/ renders which URL path, for display_page in index.py.
+
+Importing a page module only declares its callbacks, which is quick. Dash's
+renderer asks for every callback once, when the dashboard opens, so they
+have to be there before the first page is shown. Reading the data & building
+the figures & layout happens in the page's load(), the first time the page
+is shown or one of its callbacks runs, so a fresh worker answers requests
+before any of that is done.
+
+WARM_UP in app.py sets when the pages are loaded otherwise:
+    - background: in a thread of each worker, started with its first request
+    - preload: right away at import, before gunicorn --preload forks the
+      workers, so they all share the loaded pages (the slowest to start)
+    - lazy: only on first use
+"""
+
+import importlib
+import logging
+import sys
+import threading
+import time
+
+import dash_html_components as html
+
+import datastore
+
+logger = logging.getLogger(__name__)
+
+PAGES = {
+    "/food": "apps.food_map",
+    "/country": "apps.country_map",
+}
+DEFAULT_PATH = "/food"  # shown for / too
+
+
+def lazy(build):
+    """
+    A function returning build()'s result, calling build only the first time.
+
+    Callers arriving while build runs wait for it instead of building again.
+    get.reset() forgets the result, so the next call builds it again.
+    """
+    result = []
+    lock = threading.Lock()
+
+    def get():
+        if not result:
+            with lock:
+                if not result:
+                    result.append(build())
+        return result[0]
+
+    def reset():
+        with lock:  # after a build that's running now
+            result.clear()
+    get.reset = reset
+    return get
+
+
+def page(pathname):
+    """The page module for a URL path, or None if there's no such page."""
+    if pathname is None or pathname == "/":
+        pathname = DEFAULT_PATH
+    if pathname not in PAGES:
+        return None
+    return importlib.import_module(PAGES[pathname])
+
+
+def layout(pathname):
+    """The layout of the page at pathname, loading the page the first time it's shown, None if there's no such page."""
+    module = page(pathname)
+    if module is None:
+        return None
+    try:
+        return module.load().layout
+    except Exception:
+        logger.exception("Problem loading %s", module.__name__)
+        return html.H3(f"Problem loading {module.__name__}, please check console for details.")
+
+
+def import_all():
+    """Import every page module, declaring their callbacks."""
+    for name in dict.fromkeys(PAGES.values()):
+        importlib.import_module(name)
+
+
+###########################
+# WARM UP
+###########################
+timings = {}  # seconds each page took to warm up, for the curious
+
+
+def warm_up():
+    """Load every dataset, then every page & its figures if the page prebuilds them, see WARM_FIGURE_CACHE."""
+    start = time.perf_counter()
+    datastore.load()
+    timings["datastore"] = time.perf_counter() - start
+    for name in dict.fromkeys(PAGES.values()):
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name).warm()
+        except Exception:
+            logger.exception("Problem warming up %s", name)  # the page shows its problem once it's opened
+        timings[name] = time.perf_counter() - start
+
+
+def reload():
+    """
+    Forget the loaded data & pages, which load again on first use, e.g. once the store published new data.
+
+    Countries & terms added to the registry or catalog still need a restart, the callbacks are declared with them.
+    """
+    datastore.reload()
+    for name in dict.fromkeys(PAGES.values()):
+        module = sys.modules.get(name)
+        if module is not None and hasattr(module, 'reload'):
+            module.reload()
+
+
+def start_warm_up():
+    """Warm up in a background thread, returning it."""
+    thread = threading.Thread(target=warm_up, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def init_app(server, mode="background"):
+    """Warm the pages up the way mode says, see the module's docstring."""
+    if mode == "preload":
+        warm_up()
+    elif mode == "background":
+        # threads don't survive gunicorn forking its workers, so each worker starts its own
+        server.before_first_request(start_warm_up)
+
+
+###########################
+# SNAPSHOTS
+###########################
+def snapshot_values(**options):
+    """Every value of every callback input, from each page's snapshot_values, see snapshot_site.py."""
+    values = {("url", "pathname"): ["/"] + list(PAGES)}
+    for name in dict.fromkeys(PAGES.values()):
+        values.update(importlib.import_module(name).snapshot_values(**options))
+    return values
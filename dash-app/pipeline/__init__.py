@@ -0,0 +1,10 @@
+"""
+Data Processing Pipeline
+
+Esme Middaugh
+Nele Peshel
+Vivien van Dongen
+
+Importable versions of the steps in data-cleaning.ipynb, so that the notebook,
+the command line and the dashboard all share the same cleaning code.
+"""
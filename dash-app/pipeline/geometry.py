@@ -0,0 +1,239 @@
+"""
+Map Geometry
+
+Esme Middaugh
+Nele Peshel
+Vivien van Dongen
+
+Builds the Europe topology the food map draws, so the browser gets it from
+our own server instead of Plotly's CDN. Plotly's europe_110m.json is clipped
+to the area around the countries in output-data/countries.csv, dropping every
+feature, island & line that can't be on screen, and its arcs are simplified
+below what the map can show at its zoom. Shared arcs are simplified once, so
+neighbouring countries still meet without gaps.
+
+The result goes to static-src/topojson/, from where `python -m static_bundle`
+bundles it. Nothing is committed there yet, so until someone runs this with a
+connection (or a downloaded copy) & rebuilds the bundle, the map keeps loading
+Plotly's full topojson from its CDN. tests/test_geometry.py covers the
+clipping & simplifying on a small made up topology.
+
+Usage, from the dash-app directory:
+    python -m pipeline.geometry  # downloads Plotly's topojson, needs a connection
+    python -m pipeline.geometry --source europe_110m.json  # from a downloaded copy
+"""
+
+import argparse
+import csv
+import json
+import os
+import urllib.request
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # dash-app
+COUNTRIES_FILE = os.path.join(BASE_DIR, 'output-data', 'countries.csv')
+TOPOJSON_DIR = os.path.join(BASE_DIR, 'static-src', 'topojson')
+
+TOPOJSON_NAME = 'europe_110m.json'  # what plotly asks for with geo_scope="europe" at the default resolution
+SOURCE_URL = 'https://cdn.plot.ly/' + TOPOJSON_NAME
+
+TOLERANCE = 0.02  # degrees, below a pixel at the food map's zoom
+MARGIN = 1.0  # keep features within this many times the countries' extent around it
+QUANTIZATION = 10000
+
+
+###########################
+# EXTENT
+###########################
+def read_extent(path=COUNTRIES_FILE, margin=MARGIN):
+    """[lon_min, lat_min, lon_max, lat_max] around every registered country, widened by margin times its size."""
+    with open(path, newline='') as f:
+        rows = list(csv.DictReader(f))
+    lon_min = min(float(row['lon_min']) for row in rows)
+    lon_max = max(float(row['lon_max']) for row in rows)
+    lat_min = min(float(row['lat_min']) for row in rows)
+    lat_max = max(float(row['lat_max']) for row in rows)
+    lon_pad, lat_pad = (lon_max - lon_min) * margin, (lat_max - lat_min) * margin
+    return [lon_min - lon_pad, lat_min - lat_pad, lon_max + lon_pad, lat_max + lat_pad]
+
+
+###########################
+# ARCS
+###########################
+def decode_arcs(topology):
+    """The topology's arcs as lists of absolute [lon, lat] points."""
+    transform = topology.get('transform')
+    if transform is None:
+        return [[list(point[:2]) for point in arc] for arc in topology['arcs']]
+    (sx, sy), (tx, ty) = transform['scale'], transform['translate']
+    arcs = []
+    for arc in topology['arcs']:
+        x = y = 0
+        points = []
+        for dx, dy in arc:
+            x += dx
+            y += dy
+            points.append([x * sx + tx, y * sy + ty])
+        arcs.append(points)
+    return arcs
+
+
+def encode_arcs(arcs, quantization=QUANTIZATION):
+    """Quantized, delta encoded arcs & the transform to decode them."""
+    xs = [x for arc in arcs for x, _ in arc]
+    ys = [y for arc in arcs for _, y in arc]
+    x0, y0 = min(xs), min(ys)
+    sx = (max(xs) - x0) / (quantization - 1) or 1
+    sy = (max(ys) - y0) / (quantization - 1) or 1
+    encoded = []
+    for arc in arcs:
+        previous = None
+        deltas = []
+        for x, y in arc:
+            point = (round((x - x0) / sx), round((y - y0) / sy))
+            if point == previous:
+                continue
+            deltas.append(list(point) if previous is None else [point[0] - previous[0], point[1] - previous[1]])
+            previous = point
+        if len(deltas) == 1:  # arcs need two points, even when they quantize onto one
+            deltas.append([0, 0])
+        encoded.append(deltas)
+    return encoded, {'scale': [sx, sy], 'translate': [x0, y0]}
+
+
+def simplify(points, tolerance=TOLERANCE):
+    """Douglas-Peucker, keeping both ends so arcs still join the arcs they meet."""
+    if len(points) < 3:
+        return points
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        (x1, y1), (x2, y2) = points[start], points[end]
+        dx, dy = x2 - x1, y2 - y1
+        length = (dx * dx + dy * dy) ** 0.5
+        furthest, distance = None, tolerance
+        for i in range(start + 1, end):
+            x, y = points[i]
+            if length:
+                d = abs(dy * (x - x1) - dx * (y - y1)) / length
+            else:
+                d = ((x - x1) ** 2 + (y - y1) ** 2) ** 0.5
+            if d > distance:
+                furthest, distance = i, d
+        if furthest is not None:
+            keep[furthest] = True
+            stack.append((start, furthest))
+            stack.append((furthest, end))
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+###########################
+# CLIP
+###########################
+def _arc_indices(arcs):
+    """Every arc index in a geometry's (nested) arcs, negative ones (~i, reversed) turned back into i."""
+    if isinstance(arcs, int):
+        return [arcs if arcs >= 0 else ~arcs]
+    return [index for part in arcs for index in _arc_indices(part)]
+
+
+def _intersects(arcs, decoded, extent):
+    points = [point for index in _arc_indices(arcs) for point in decoded[index]]
+    if not points:
+        return False
+    lon_min, lat_min, lon_max, lat_max = extent
+    return (min(x for x, _ in points) <= lon_max and max(x for x, _ in points) >= lon_min
+            and min(y for _, y in points) <= lat_max and max(y for _, y in points) >= lat_min)
+
+
+def clip_geometry(geometry, decoded, extent):
+    """The geometry without the polygons & lines outside extent, or None if nothing is left."""
+    kind = geometry['type']
+    if kind in ('MultiPolygon', 'MultiLineString'):
+        parts = [part for part in geometry['arcs'] if _intersects(part, decoded, extent)]
+        return dict(geometry, arcs=parts) if parts else None
+    if kind in ('Polygon', 'LineString'):
+        return geometry if _intersects(geometry['arcs'], decoded, extent) else None
+    if kind == 'GeometryCollection':
+        geometries = [clip_geometry(child, decoded, extent) for child in geometry['geometries']]
+        return dict(geometry, geometries=[child for child in geometries if child is not None])
+    return geometry  # points & empty geometries
+
+
+def _renumber(arcs, mapping):
+    if isinstance(arcs, int):
+        return mapping[arcs] if arcs >= 0 else ~mapping[~arcs]
+    return [_renumber(part, mapping) for part in arcs]
+
+
+def _renumber_geometry(geometry, mapping):
+    if 'arcs' in geometry:
+        geometry = dict(geometry, arcs=_renumber(geometry['arcs'], mapping))
+    if 'geometries' in geometry:
+        geometry = dict(geometry, geometries=[_renumber_geometry(child, mapping) for child in geometry['geometries']])
+    return geometry
+
+
+def _used_arcs(geometry):
+    used = set(_arc_indices(geometry.get('arcs', [])))
+    for child in geometry.get('geometries', []):
+        used |= _used_arcs(child)
+    return used
+
+
+def clip_topology(topology, extent, tolerance=TOLERANCE):
+    """A smaller topology with only what lies within extent, its arcs simplified by tolerance degrees."""
+    decoded = decode_arcs(topology)
+    objects = {}
+    for name, geometry in topology['objects'].items():
+        clipped = clip_geometry(geometry, decoded, extent)
+        objects[name] = clipped if clipped is not None else {'type': 'GeometryCollection', 'geometries': []}
+
+    used = sorted(set().union(*(_used_arcs(geometry) for geometry in objects.values())))
+    mapping = {old: new for new, old in enumerate(used)}
+    objects = {name: _renumber_geometry(geometry, mapping) for name, geometry in objects.items()}
+
+    arcs, transform = encode_arcs([simplify(decoded[index], tolerance) for index in used])
+    clipped = {'type': 'Topology', 'transform': transform, 'objects': objects, 'arcs': arcs}
+    if 'bbox' in topology:
+        clipped['bbox'] = extent
+    return clipped
+
+
+###########################
+# BUILD
+###########################
+def read_topology(source=SOURCE_URL):
+    """A topojson from a URL or a file path."""
+    if source.startswith(('http://', 'https://')):
+        with urllib.request.urlopen(source) as response:
+            return json.load(response)
+    with open(source) as f:
+        return json.load(f)
+
+
+def build_geometry(source=SOURCE_URL, output_dir=TOPOJSON_DIR, tolerance=TOLERANCE, margin=MARGIN):
+    """Write the clipped, simplified topology to output_dir, returning its path."""
+    topology = clip_topology(read_topology(source), read_extent(margin=margin), tolerance)
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, TOPOJSON_NAME)
+    with open(path, 'w') as f:
+        json.dump(topology, f, separators=(',', ':'))
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the food map's clipped & simplified Europe topojson.")
+    parser.add_argument("--source", default=SOURCE_URL, help="URL or path of Plotly's " + TOPOJSON_NAME)
+    parser.add_argument("--output-dir", default=TOPOJSON_DIR, help="folder to write the topojson to")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="simplification tolerance in degrees")
+    parser.add_argument("--margin", type=float, default=MARGIN, help="extent kept around the countries, times their size")
+    args = parser.parse_args(argv)
+
+    path = build_geometry(args.source, args.output_dir, args.tolerance, args.margin)
+    print(f"{path}: {os.path.getsize(path) // 1024} KB, run python -m static_bundle to serve it")
+
+
+if __name__ == '__main__':
+    main()
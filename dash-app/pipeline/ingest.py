@@ -0,0 +1,239 @@
+"""
+Incremental Google Trends Ingestion
+
+Esme Middaugh
+Nele Peshel
+Vivien van Dongen
+
+Command line version of the "Read & Tidy Data" steps in data-cleaning.ipynb.
+Every country & term is kept in its own file under
+output-data/google-trends-difference/, and a manifest next to them keeps the
+content hash of every export. A refresh only re-parses the exports that are
+new or changed, rewrites their partitions & the store files of their
+countries (see pipeline/store.py), and leaves everything else alone.
+
+The combined google-trends-difference.csv & the terms-ordered copy of it,
+read by the notebooks, are only written with --combined, as that means
+going through all the data. The terms-ordered file has ISO dates, its old
+mix of day & month first dates came out of a spreadsheet.
+
+Usage, from the dash-app directory:
+    python -m pipeline.ingest
+    python -m pipeline.ingest --combined  # also write the combined CSVs
+    python -m pipeline.ingest --full  # ignore the manifest and rebuild everything
+"""
+
+import argparse
+import datetime
+import glob
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+from pipeline import store
+from pipeline.year_change import year_change
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # dash-app
+TRENDS_INPUT_DIR = os.path.join(BASE_DIR, 'input-data', 'google-trends')
+OUTPUT_DIR = os.path.join(BASE_DIR, 'output-data')
+
+PARTITION_DIR = 'google-trends-difference'  # <country>_<term>.csv per partition
+DIFFERENCE_FILE = 'google-trends-difference.csv'
+TERMS_ORDERED_FILE = 'google-trends-difference-terms-ordered.csv'
+MANIFEST_FILE = 'google-trends-manifest.json'
+
+START_DATE = datetime.datetime(2018, 11, 1)  # making dates start at same point in time
+COLUMNS = ["date", "score", "country", "term", "translated_term", "score_difference"]
+PARTITION_KEYS = ["country", "term"]
+
+
+###########################
+# READ & TIDY
+###########################
+def parse_filename(filepath):
+    """Split an export named like GER_bananabread_Bananenbrot.csv into (country, term, translated_term)."""
+    name = os.path.splitext(os.path.basename(filepath))[0]
+    country, term, translated_term = name.split("_")
+    return country.lower(), term.lower(), translated_term.lower()
+
+
+def read_export(filepath):
+    """Read a single Google Trends export into the tidy date, score, country, term, translated_term format."""
+    country, term, translated_term = parse_filename(filepath)
+    df = pd.read_csv(filepath,
+                     index_col=False,
+                     skiprows=3,
+                     names=["date", "score"],
+                     dtype={"score": str})
+    df["date"] = pd.to_datetime(df["date"], format="%Y-%m-%d")
+    df = df[df.date >= START_DATE]
+
+    # Trends reports very small values as "<1"
+    df["score"] = df["score"].replace("<1", "1").astype("int64")
+
+    df["country"] = country
+    df["term"] = term
+    df["translated_term"] = translated_term
+    return df
+
+
+def file_hash(filepath):
+    """sha256 of the file contents."""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+###########################
+# MANIFEST
+###########################
+def load_manifest(output_dir):
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, output_dir):
+    with open(os.path.join(output_dir, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+
+def scan_exports(input_dir, manifest):
+    """
+    Describe every export currently in input_dir.
+
+    Files whose size and modification time match the manifest keep their recorded
+    hash; everything else is hashed again.
+    """
+    entries = {}
+    for filepath in sorted(glob.glob(os.path.join(input_dir, "*.csv"))):
+        filename = os.path.basename(filepath)
+        stat = os.stat(filepath)
+        previous = manifest.get(filename, {})
+        if previous.get("size") == stat.st_size and previous.get("mtime_ns") == stat.st_mtime_ns:
+            sha256 = previous["sha256"]
+        else:
+            sha256 = file_hash(filepath)
+        entries[filename] = {
+            "path": filepath,
+            "sha256": sha256,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+        }
+    return entries
+
+
+###########################
+# PARTITIONS
+###########################
+def partition_name(country, term):
+    return f"{country}_{term}.csv"
+
+
+def write_partition(data, output_dir):
+    """Write one country & term's rows, sorted by date."""
+    country, term = data["country"].iloc[0], data["term"].iloc[0]
+    data.sort_values("date")[COLUMNS].to_csv(
+        os.path.join(output_dir, PARTITION_DIR, partition_name(country, term)), index=False, date_format="%Y-%m-%d")
+
+
+def read_partitions(output_dir, countries=None):
+    """The rows of every partition, or only those of countries, sorted by country, term & date."""
+    names = sorted(glob.glob(os.path.join(output_dir, PARTITION_DIR, "*.csv")))
+    if countries is not None:
+        names = [name for name in names if os.path.basename(name).split("_")[0] in countries]
+    if not names:
+        return pd.DataFrame(columns=COLUMNS)
+    return pd.concat([pd.read_csv(name, parse_dates=["date"]) for name in names], ignore_index=True)
+
+
+def write_combined(output_dir):
+    """The combined difference CSV & its terms ordered copy, from every partition."""
+    difference = read_partitions(output_dir)
+    difference.to_csv(os.path.join(output_dir, DIFFERENCE_FILE), index=False, date_format="%Y-%m-%d")
+    terms_ordered = difference.sort_values(["term", "country", "date"])
+    terms_ordered.assign(date_str=terms_ordered["date"].dt.strftime("%Y-%m-%d")).to_csv(
+        os.path.join(output_dir, TERMS_ORDERED_FILE), index=False, date_format="%Y-%m-%d")
+
+
+###########################
+# PIPELINE
+###########################
+def ingest(input_dir=TRENDS_INPUT_DIR, output_dir=OUTPUT_DIR, full=False, combined=False):
+    """
+    Bring the difference partitions in output_dir up to date with the exports in input_dir.
+
+    Returns a dict of the filenames that were added, changed, removed or left unchanged.
+    """
+    partition_dir = os.path.join(output_dir, PARTITION_DIR)
+    os.makedirs(partition_dir, exist_ok=True)
+    manifest = {} if full else load_manifest(output_dir)
+
+    exports = scan_exports(input_dir, manifest)
+    added = [name for name in exports if name not in manifest]
+    changed = [name for name in exports if name in manifest and manifest[name]["sha256"] != exports[name]["sha256"]]
+    removed = [name for name in manifest if name not in exports]
+    unchanged = [name for name in exports if name not in added and name not in changed]
+    summary = {"added": added, "changed": changed, "removed": removed, "unchanged": unchanged}
+
+    # A partition is rebuilt from all of its exports as soon as one of them changed
+    partition_of = {name: tuple(parse_filename(name)[:2]) for name in list(exports) + removed}
+    dirty = {partition_of[name] for name in added + changed + removed}
+    if full:
+        dirty |= set(partition_of.values())
+        for name in glob.glob(os.path.join(partition_dir, "*.csv")):
+            os.remove(name)
+
+    fresh = [read_export(exports[name]["path"]) for name in exports if partition_of[name] in dirty]
+    if fresh:
+        data = year_change(pd.concat(fresh, ignore_index=True))
+        data = data[data.score_difference.notna()]
+        for _, partition in data.groupby(PARTITION_KEYS, sort=False):
+            write_partition(partition, output_dir)
+    rebuilt = set() if not fresh else set(zip(data["country"], data["term"]))
+    for country, term in dirty - rebuilt:  # removed, or no rows a year after another
+        path = os.path.join(partition_dir, partition_name(country, term))
+        if os.path.exists(path):
+            os.remove(path)
+
+    # Only the store files of the countries whose partitions changed
+    countries = None if full else sorted({country for country, _ in dirty})
+    if countries is None or countries:
+        store.write_trends(read_partitions(output_dir, countries), os.path.join(output_dir, 'store'), countries)
+    if combined:
+        write_combined(output_dir)
+
+    save_manifest({name: {
+        "sha256": entry["sha256"],
+        "size": entry["size"],
+        "mtime_ns": entry["mtime_ns"],
+        "country": partition_of[name][0],
+        "term": partition_of[name][1],
+    } for name, entry in exports.items()}, output_dir)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Incrementally ingest Google Trends exports into output-data.")
+    parser.add_argument("--input-dir", default=TRENDS_INPUT_DIR, help="folder of Google Trends csv exports")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR, help="folder the dashboard reads its data from")
+    parser.add_argument("--full", action="store_true", help="ignore the manifest and re-parse every export")
+    parser.add_argument("--combined", action="store_true", help="also write the combined CSVs the notebooks read")
+    args = parser.parse_args(argv)
+
+    summary = ingest(args.input_dir, args.output_dir, full=args.full, combined=args.combined)
+    for status in ["added", "changed", "removed", "unchanged"]:
+        print(f"{status}: {len(summary[status])}")
+        if status != "unchanged":
+            for name in summary[status]:
+                print(f"    {name}")
+
+
+if __name__ == '__main__':
+    main()
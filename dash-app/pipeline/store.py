@@ -0,0 +1,226 @@
+"""
+Columnar Data Store
+
+Esme Middaugh
+Nele Peshel
+Vivien van Dongen
+
+Typed, sorted Feather (Arrow) tables the dashboard loads instead of parsing
+the output CSVs on every import. Countries & terms are categoricals, dates
+are datetime64 and the trends scores are int8, so nothing needs to be
+parsed or cast when a worker starts.
+
+The trends are partitioned into one file per country under trends/, so the
+dashboard only ever maps the countries it is asked about.
+
+Files are written next to their final name & moved over it, so a worker
+that has mapped the previous file keeps reading it unchanged. Every write
+publishes a new data version in version.txt, a hash of all the
+tables, which the dashboard puts into its cached responses' ETags.
+
+Usage, from the dash-app directory, to rebuild the store from the output CSVs:
+    python -m pipeline.store
+"""
+
+import argparse
+import hashlib
+import os
+import tempfile
+
+import pandas as pd
+from pyarrow import feather
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # dash-app
+OUTPUT_DIR = os.path.join(BASE_DIR, 'output-data')
+STORE_DIR = os.path.join(OUTPUT_DIR, 'store')
+
+TRENDS_DIR = 'trends'  # one <country>.feather per country
+WHO_FILE = 'who.feather'
+VERSION_FILE = 'version.txt'
+
+TRENDS_SORT = ["term", "country", "date"]  # also the term order the polar chart draws in
+WHO_SORT = ["Country", "date"]
+
+
+###########################
+# TYPING
+###########################
+def typed_trends(difference):
+    """Cast the google-trends-difference frame to the store's dtypes and sort order."""
+    trends = difference[difference.score_difference.notna()]
+    trends = pd.DataFrame({
+        "date": pd.to_datetime(trends["date"]),
+        "country": trends["country"].astype("category"),
+        "term": trends["term"].astype("category"),
+        "translated_term": trends["translated_term"].astype("category"),
+        "score": trends["score"].astype("int8"),
+        "score_difference": trends["score_difference"].astype("int8"),
+    })
+    return trends.sort_values(TRENDS_SORT, ignore_index=True)
+
+
+def typed_who(who):
+    """Cast the cleaned WHO frame to the store's dtypes and sort order."""
+    if "date" in who:
+        date = pd.to_datetime(who["date"])
+    else:
+        date = pd.to_datetime(who["Date_reported"], format="%d/%m/%Y")
+    who = pd.DataFrame({
+        "date": date,
+        "Country": who["Country"].astype("category"),
+        "New_cases": who["New_cases"].astype("int32"),
+        "Nom_new_cases": who["Nom_new_cases"].astype("float32"),
+        "Inhabitants": who["Inhabitants"].astype("int32"),
+    })
+    return who.sort_values(WHO_SORT, ignore_index=True)
+
+
+###########################
+# READ & WRITE
+###########################
+def replace_file(path, write):
+    """
+    Call write(temporary path) and move the result over path in one step.
+
+    Workers map the tables they read, so a file must never change under them: they
+    keep the old file's contents until they open the new one.
+    """
+    directory, filename = os.path.split(path)
+    fd, temporary = tempfile.mkstemp(prefix=f".{filename}.", suffix=".tmp", dir=directory)
+    os.close(fd)
+    try:
+        write(temporary)
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+
+def write_table(df, filename, store_dir=STORE_DIR):
+    """Write a table uncompressed so readers can memory map it."""
+    os.makedirs(store_dir, exist_ok=True)
+    replace_file(os.path.join(store_dir, filename), lambda path: df.to_feather(path, compression="uncompressed"))
+
+
+def compute_version(store_dir=STORE_DIR):
+    """Hash of every table in the store, their paths & contents."""
+    digest = hashlib.sha256()
+    for folder, folders, files in os.walk(store_dir):
+        folders.sort()
+        for name in sorted(files):
+            if name.endswith('.feather'):
+                path = os.path.join(folder, name)
+                digest.update(os.path.relpath(path, store_dir).replace(os.sep, '/').encode())
+                with open(path, 'rb') as f:
+                    for block in iter(lambda: f.read(1 << 16), b''):
+                        digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def write_version(store_dir=STORE_DIR):
+    """Publish the store's current data version."""
+    version = compute_version(store_dir)
+
+    def write(path):
+        with open(path, 'w') as f:
+            f.write(version + '\n')
+    replace_file(os.path.join(store_dir, VERSION_FILE), write)
+    return version
+
+
+def read_version(store_dir=STORE_DIR):
+    """The published data version, computed from the tables if none was published."""
+    path = os.path.join(store_dir, VERSION_FILE)
+    if not os.path.isfile(path):
+        return compute_version(store_dir)
+    with open(path) as f:
+        return f.read().strip()
+
+
+def write_trends(difference, store_dir=STORE_DIR, countries=None):
+    """
+    Write one trends partition per country, removing partitions of countries no longer in difference.
+
+    With countries, difference only holds those countries' rows and every other partition is left as it is.
+    """
+    trends = typed_trends(difference)
+    partition_dir = os.path.join(store_dir, TRENDS_DIR)
+    written = []
+    for country, partition in trends.groupby("country", observed=True):
+        partition = partition.reset_index(drop=True)
+        partition["country"] = partition["country"].cat.remove_unused_categories()
+        write_table(partition, f"{country}.feather", partition_dir)
+        written.append(country)
+    stale = set(trends_partitions(store_dir)) if countries is None else set(countries) & set(trends_partitions(store_dir))
+    for country in stale - set(written):
+        os.remove(os.path.join(partition_dir, f"{country}.feather"))
+    write_version(store_dir)
+
+
+def write_who(who, store_dir=STORE_DIR):
+    write_table(typed_who(who), WHO_FILE, store_dir)
+    write_version(store_dir)
+
+
+def read_table(filename, store_dir=STORE_DIR, columns=None):
+    """
+    Read a table through a memory map.
+
+    Numeric & date columns come back as read-only views onto the mapped file
+    where Arrow allows it, so forked workers share those pages with the parent.
+    """
+    table = feather.read_table(os.path.join(store_dir, filename), columns=columns, memory_map=True)
+    return table.to_pandas(split_blocks=True)
+
+
+def trends_partitions(store_dir=STORE_DIR):
+    """Countries with a trends partition in the store."""
+    partition_dir = os.path.join(store_dir, TRENDS_DIR)
+    if not os.path.isdir(partition_dir):
+        return []
+    return sorted(os.path.splitext(name)[0] for name in os.listdir(partition_dir) if name.endswith(".feather"))
+
+
+def read_trends_partition(country, store_dir=STORE_DIR, columns=None):
+    """A single country's trends, sorted by term & date."""
+    return read_table(f"{country}.feather", os.path.join(store_dir, TRENDS_DIR), columns)
+
+
+def concat_partitions(partitions, sort=TRENDS_SORT):
+    """Concatenate trends partitions, keeping categorical columns categorical."""
+    trends = pd.concat(partitions, ignore_index=True)
+    for column in partitions[0].select_dtypes("category"):
+        trends[column] = trends[column].astype("category")
+    if sort:
+        trends = trends.sort_values([column for column in sort if column in trends], ignore_index=True)
+    return trends
+
+
+def read_trends(store_dir=STORE_DIR, columns=None, countries=None):
+    """Every country's trends, or only those of countries, as one frame."""
+    if countries is None:
+        countries = trends_partitions(store_dir)
+    return concat_partitions([read_trends_partition(country, store_dir, columns) for country in countries])
+
+
+def read_who(store_dir=STORE_DIR, columns=None):
+    return read_table(WHO_FILE, store_dir, columns)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild the dashboard's data store from the output CSVs.")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR, help="folder with the cleaned CSVs")
+    parser.add_argument("--store-dir", default=STORE_DIR, help="folder to write the store to")
+    args = parser.parse_args(argv)
+
+    from pipeline import ingest
+    if os.path.isdir(os.path.join(args.output_dir, ingest.PARTITION_DIR)):
+        difference = ingest.read_partitions(args.output_dir)
+    else:
+        difference = pd.read_csv(os.path.join(args.output_dir, ingest.DIFFERENCE_FILE))
+    write_trends(difference, args.store_dir)
+    write_who(pd.read_csv(os.path.join(args.output_dir, 'data_who_clean.csv')), args.store_dir)
+
+
+if __name__ == '__main__':
+    main()
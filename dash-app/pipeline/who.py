@@ -0,0 +1,102 @@
+"""
+WHO COVID-19 Ingestion
+
+Esme Middaugh
+Nele Peshel
+Vivien van Dongen
+
+Python replacement for data-cleaning-who.R. Streams the tab separated
+WHO-COVID-19-global-data.csv in chunks, parsing only the columns the dashboard
+uses and keeping only the countries listed in population.csv, so memory stays
+flat however long the global file grows. New cases are normalized per 100.000
+inhabitants and written straight into the data store.
+
+Usage, from the dash-app directory:
+    python -m pipeline.who
+    python -m pipeline.who --countries DE NL  # a subset of population.csv, by WHO country code
+"""
+
+import argparse
+import os
+
+import pandas as pd
+
+from pipeline import store
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # dash-app
+WHO_FILE = os.path.join(BASE_DIR, 'input-data', 'who', 'WHO-COVID-19-global-data.csv')
+POPULATION_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'population.csv')
+
+COLUMNS = ["Date_reported", "Country_code", "New_cases"]
+CHUNKSIZE = 20000
+
+
+def read_population(path=POPULATION_FILE):
+    """Inhabitants per country, indexed by WHO country code."""
+    return pd.read_csv(path, dtype={"Country_code": str, "Country": str, "Inhabitants": "int64"},
+                       keep_default_na=False).set_index("Country_code")
+
+
+def read_who(path=WHO_FILE, country_codes=None, chunksize=CHUNKSIZE):
+    """
+    Daily new cases for the given WHO country codes, by default every country, read chunk by chunk.
+
+    Only the date, country code & new cases columns are parsed; the WHO
+    headers carry leading spaces, which are stripped before matching.
+    """
+    country_codes = None if country_codes is None else set(country_codes)
+    chunks = pd.read_csv(path,
+                         sep="\t",
+                         encoding="latin-1",  # a few country names aren't utf-8
+                         usecols=lambda column: column.strip() in COLUMNS,
+                         dtype=str,
+                         keep_default_na=False,  # Namibia's country code is "NA"
+                         chunksize=chunksize)
+    kept = []
+    for chunk in chunks:
+        chunk.columns = chunk.columns.str.strip()
+        kept.append(chunk if country_codes is None else chunk[chunk["Country_code"].str.strip().isin(country_codes)])
+    who = pd.concat(kept, ignore_index=True) if kept else pd.DataFrame(columns=COLUMNS)
+    return pd.DataFrame({
+        "date": pd.to_datetime(who["Date_reported"].str.strip(), format="%d/%m/%Y"),
+        "Country_code": who["Country_code"].str.strip(),
+        "New_cases": who["New_cases"].astype("int64"),
+    })
+
+
+def normalize(who, population):
+    """Add the WHO country name, Inhabitants & Nom_new_cases, the new cases per 100.000 inhabitants."""
+    who = who.join(population, on="Country_code")
+    who["Nom_new_cases"] = (who["New_cases"] / who["Inhabitants"] * 100000).round()
+    return who
+
+
+def ingest_who(path=WHO_FILE, population_path=POPULATION_FILE, country_codes=None, store_dir=store.STORE_DIR):
+    """Rebuild the store's WHO table for country_codes, by default every country in population.csv."""
+    population = read_population(population_path)
+    if country_codes is None:
+        country_codes = population.index
+    missing = set(country_codes) - set(population.index)
+    if missing:
+        raise ValueError(f"No population for {', '.join(sorted(missing))}, add them to {population_path}")
+
+    who = normalize(read_who(path, country_codes), population)
+    store.write_who(who, store_dir)
+    return who
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load the WHO COVID-19 data into the dashboard's data store.")
+    parser.add_argument("--who-file", default=WHO_FILE, help="WHO-COVID-19-global-data.csv")
+    parser.add_argument("--population-file", default=POPULATION_FILE, help="inhabitants per WHO country code")
+    parser.add_argument("--countries", nargs="+", help="WHO country codes to keep, default all in the population file")
+    parser.add_argument("--store-dir", default=store.STORE_DIR, help="folder of the data store")
+    args = parser.parse_args(argv)
+
+    who = ingest_who(args.who_file, args.population_file, args.countries, args.store_dir)
+    print(f"{len(who)} rows for {who['Country'].nunique()} countries, "
+          f"{who['date'].min():%d/%m/%Y} to {who['date'].max():%d/%m/%Y}")
+
+
+if __name__ == '__main__':
+    main()
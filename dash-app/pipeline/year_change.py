@@ -0,0 +1,57 @@
+"""
+Year over Year Difference
+
+Esme Middaugh
+Nele Peshel
+Vivien van Dongen
+
+Vectorized replacement for the row by row year_change in data-cleaning.ipynb.
+Every country & term series is matched against itself one ISO year earlier
+with a single keyed join on (country, term, ISO year, ISO week).
+"""
+
+import pandas as pd
+
+SERIES_KEYS = ["country", "term"]
+WEEK_KEYS = ["iso_year", "iso_week"]
+
+
+def add_iso_week(data):
+    """Add the ISO year and ISO week of each row's date as integer columns."""
+    iso = data["date"].dt.isocalendar()
+    return data.assign(iso_year=iso["year"].astype("int64"), iso_week=iso["week"].astype("int64"))
+
+
+def year_change(data, week_53="week_52"):
+    """
+    Calculate the change for the same week of the previous year, for every series at once.
+
+    data needs the tidy date, score, country & term columns from the notebook.
+    ISO week 53 only exists in some years; with week_53="week_52" it is compared
+    against the prior year's week 52 when that year has no week 53, with
+    week_53=None it is left empty. Weeks whose prior year week is missing
+    get NaN rather than raising, so callers can drop them with notna().
+    """
+    if week_53 not in ("week_52", None):
+        raise ValueError(f"Unknown week_53 option: {week_53}")
+
+    keyed = add_iso_week(data)
+
+    # The prior year table, shifted forward a year so it joins onto the current week
+    prior = keyed[SERIES_KEYS + WEEK_KEYS + ["score"]].rename(columns={"score": "prior_score"})
+    prior["iso_year"] += 1
+
+    if week_53 == "week_52":
+        # only for the years without a week 53 of their own, so duplicated weeks still fail below
+        has_53 = prior.loc[prior.iso_week == 53, SERIES_KEYS + ["iso_year"]].drop_duplicates()
+        stand_in = prior[prior.iso_week == 52].merge(has_53, how="left", indicator=True)
+        stand_in = stand_in[stand_in._merge == "left_only"].drop(columns="_merge").assign(iso_week=53)
+        prior = pd.concat([prior, stand_in], ignore_index=True)
+
+    # validate makes duplicated weeks in an export fail loudly instead of multiplying rows
+    joined = keyed[SERIES_KEYS + WEEK_KEYS + ["score"]].merge(
+        prior, on=SERIES_KEYS + WEEK_KEYS, how="left", validate="many_to_one"
+    )
+
+    difference = (joined["score"] - joined["prior_score"]).astype("float64")
+    return data.assign(score_difference=difference.to_numpy())
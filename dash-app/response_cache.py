@@ -0,0 +1,217 @@
+"""
+Callback Response Cache
+
+Esme Middaugh
+Nele Peshel
+Vivien van Dongen
+
+HTTP caching for the Dash callbacks whose output only depends on their
+inputs & the data. A POST to _dash-update-component for one of those is
+hashed together with the data version (see pipeline/store.py); a repeat of it
+is answered from memory, already gzipped, and with a 304 if the client
+sends the ETag it got last time. A request arriving while the same one is
+being answered already waits for that response instead of building its own
+(with threaded workers, gunicorn --threads), so a burst of identical
+requests, e.g. from several people dragging the same slider, is built once.
+
+Every check_interval seconds a request looks up the published data version
+(version.txt in the store). Once it changed, the cache is emptied, the data
+reloaded (on_change, see pages.reload) & every key & ETag changes with the
+version, so nothing built from the previous data is served again, without
+restarting the workers.
+
+Only register callbacks that don't read dash.callback_context, as which
+input triggered the callback isn't part of the key.
+"""
+
+import gzip
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import flask
+
+
+def callback_id(outputs):
+    """The output id Dash posts for a callback, e.g. '..test_map.figure...food_map_header.children..'."""
+    if not isinstance(outputs, (list, tuple)):
+        return f"{outputs.component_id}.{outputs.component_property}"
+    return '..' + '...'.join(f"{output.component_id}.{output.component_property}" for output in outputs) + '..'
+
+
+class ResponseCache:
+    """LRU cache of callback responses, capped at max_bytes of uncompressed & gzipped bodies."""
+
+    def __init__(self, max_bytes, wait_seconds=30):
+        self.max_bytes = max_bytes
+        self.wait_seconds = wait_seconds  # longest a request waits for the same one being answered
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.coalesced = 0  # misses that waited for the same request being answered already
+        self.version = None
+        self.version_changes = 0
+        self.callbacks = set()
+        self._entries = OrderedDict()
+        self._building = {}  # key -> Event set once the request answering it is done
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def cache_callback(self, outputs):
+        """Cache the responses of the callback with these outputs."""
+        self.callbacks.add(callback_id(outputs))
+
+    def init_app(self, server, read_version, path='/_dash-update-component', check_interval=5, on_change=None):
+        """
+        Answer repeated callback requests on the Flask server.
+
+        read_version() returns the published data version, checked every check_interval
+        seconds; on_change() is called when it changed, before the new version is used.
+        """
+        self.read_version = read_version
+        self.version = read_version()
+        self.path = path
+        self.check_interval = check_interval
+        self.on_change = on_change
+        self._checked = time.monotonic()
+        self._version_lock = threading.Lock()
+        server.before_request(self._before_request)
+        server.after_request(self._after_request)
+        server.teardown_request(self._teardown_request)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def check_version(self):
+        """Switch to the published data version if it changed, at most every check_interval seconds."""
+        if time.monotonic() - self._checked < self.check_interval:
+            return
+        with self._version_lock:
+            if time.monotonic() - self._checked < self.check_interval:
+                return  # another request just checked
+            version = self.read_version()
+            if version != self.version:
+                self.clear()
+                if self.on_change is not None:
+                    self.on_change()
+                self.version = version  # only now, so keys of the new version are never built from the old data
+                self.version_changes += 1
+            self._checked = time.monotonic()
+
+    ###########################
+    # KEYS & ENTRIES
+    ###########################
+    def key(self, body):
+        """Hash of the callback, its input & state values and the data version."""
+        request = {
+            'output': body.get('output'),
+            'inputs': body.get('inputs'),
+            'state': body.get('state'),
+            'version': self.version,
+        }
+        return hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def wait_or_lead(self, key):
+        """
+        The entry for key once the request being answered for it is done, or None
+        if there's no such request, so the caller answers it & the next ones wait for it.
+        """
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    return entry
+                pending = self._building.get(key)
+                if pending is None:
+                    self._building[key] = threading.Event()
+                    flask.g.response_cache_leading = True
+                    return None
+                self.coalesced += 1
+            if not pending.wait(self.wait_seconds):
+                return None  # answer it alongside
+            # a response that wasn't cached (an error, a 204) leaves the next waiter to answer it
+
+    def put(self, key, body, mimetype):
+        entry = (body, gzip.compress(body), mimetype)
+        size = len(entry[0]) + len(entry[1])
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                old = self._entries.pop(key)
+                self.current_bytes -= len(old[0]) + len(old[1])
+            self._entries[key] = entry
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (evicted_body, evicted_gzip, _) = self._entries.popitem(last=False)
+                self.current_bytes -= len(evicted_body) + len(evicted_gzip)
+
+    ###########################
+    # REQUEST HOOKS
+    ###########################
+    def _before_request(self):
+        request = flask.request
+        if request.method != 'POST' or request.path != self.path:
+            return None
+        self.check_version()
+        body = request.get_json(silent=True)
+        if not body or body.get('output') not in self.callbacks:
+            return None
+
+        key = self.key(body)
+        flask.g.response_cache_key = key
+        etag = key[:32]
+        # newer Flask-Compress versions append the encoding to the ETag, e.g. "<etag>:gzip"
+        if any(tag.split(':')[0] == etag for tag in request.if_none_match.as_set()):
+            with self._lock:
+                self.not_modified += 1
+            response = flask.Response(status=304)
+        else:
+            entry = self.get(key) or self.wait_or_lead(key)
+            if entry is None:
+                return None
+            body, gzipped, mimetype = entry
+            if request.accept_encodings['gzip']:
+                response = flask.Response(gzipped, mimetype=mimetype)
+                response.headers['Content-Encoding'] = 'gzip'  # Flask-Compress leaves it as it is
+            else:
+                response = flask.Response(body, mimetype=mimetype)
+        flask.g.response_cache_hit = True
+        response.set_etag(etag)
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
+    def _after_request(self, response):
+        key = flask.g.get('response_cache_key')  # left on g for metrics.py
+        if key is None or flask.g.get('response_cache_hit', False):
+            return response
+        if response.status_code == 200 and not response.direct_passthrough and 'Content-Encoding' not in response.headers:
+            self.put(key, response.get_data(), response.mimetype)
+            response.set_etag(key[:32])
+        return response
+
+    def _teardown_request(self, exception=None):
+        if not flask.g.get('response_cache_leading', False):
+            return
+        with self._lock:
+            pending = self._building.pop(flask.g.response_cache_key, None)
+        if pending is not None:
+            pending.set()
@@ -0,0 +1,254 @@
+"""
+Static Snapshot Site
+
+Esme Middaugh
+Nele Peshel
+Vivien van Dongen
+
+Prerenders the dashboard into site/, a folder any static file server or CDN
+can serve without a single Python process, for the read-only public version:
+    - the pages, as index.html, food.html & food/index.html and so on, for
+      servers with & without clean URLs
+    - Dash's layout, its list of callbacks & its scripts, assets/ & bundle/
+    - the response of every server side callback to every combination of
+      values its inputs can take, as listed by the pages' snapshot_values
+      (see pages.py)
+
+static-src/snapshot-router.js is added to the pages and answers the
+callback requests from the prerendered responses, which are named after the
+SHA-256 of the callback & its input values (crypto.subtle in the browser,
+which only exists on HTTPS & localhost pages). A request without one, e.g. from a
+future callback whose inputs no page lists, is sent on to the live
+dashboard (gunicorn index:server) at --fallback-url, which then has to allow
+cross origin requests, and leaves the page as it is without one.
+
+Like the dashboard, the site has to be served at the root of its domain.
+
+Usage, from the dash-app directory, after the data, a page or the bundle changed:
+    python -m snapshot_site
+    python -m snapshot_site --max-countries 2 --processes 4
+    python -m snapshot_site --fallback-url https://live.example.org/
+    python -m http.server -d site  # to try it
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+os.environ.setdefault("WARM_UP", "lazy")  # loaded below, before the workers fork
+
+import datastore
+import pages
+import static_bundle
+from index import app, server
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))  # dash-app
+SITE_DIR = os.path.join(BASE_DIR, 'site')
+ROUTER_SOURCE = os.path.join(static_bundle.SOURCE_DIR, 'snapshot-router.js')
+SNAPSHOT_DIR = '_dash-snapshots'
+
+KEY_LENGTH = 32  # hex digits of the SHA-256 kept, 128 bits
+FINGERPRINT = re.compile(r'/_dash-component-suites/([^/"]+)/[^"]*?\.(v[\w-]+m[0-9a-fA-F]+)\.')
+
+
+###########################
+# CALLBACK REQUESTS
+###########################
+def snapshot_key(output, values):
+    """SHA-256 of a callback's output id & input values, as in static-src/snapshot-router.js."""
+    text = output + '|' + json.dumps(values, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:KEY_LENGTH]
+
+
+def output_spec(output):
+    """The outputs dash-renderer posts for an output id like 'a.b' or '..a.b...c.d..'."""
+    if not output.startswith('..'):
+        return dict(zip(['id', 'property'], output.rsplit('.', 1)))
+    return [dict(zip(['id', 'property'], output_id.rsplit('.', 1))) for output_id in output[2:-2].split('...')]
+
+
+def callback_requests(values):
+    """
+    (key, request body) of every server side callback for every combination of its input values.
+
+    Callbacks with an input no page lists values for, or with state, are left to the fallback.
+    """
+    requests = {}
+    skipped = []
+    for output, callback in app.callback_map.items():
+        if 'callback' not in callback:
+            continue  # clientside, runs in the browser anyway
+        inputs = [(spec['id'], spec['property']) for spec in callback['inputs']]
+        if callback['state'] or any(input_id not in values for input_id in inputs):
+            skipped.append(output)
+            continue
+        for combination in itertools.product(*[values[input_id] for input_id in inputs]):
+            requests[snapshot_key(output, list(combination))] = {
+                'output': output,
+                'outputs': output_spec(output),
+                'inputs': [{'id': component, 'property': prop, 'value': value}
+                           for (component, prop), value in zip(inputs, combination)],
+                'changedPropIds': [f'{component}.{prop}' for component, prop in inputs],
+                'state': [],
+            }
+    return list(requests.items()), skipped
+
+
+def prerender(site_dir, requests):
+    """Post each request to the dashboard, writing every response that updates the page, returning the failures."""
+    client = server.test_client()
+    path = app.config.requests_pathname_prefix + '_dash-update-component'
+    errors = []
+    for key, body in requests:
+        response = client.post(path, json=body)
+        if response.status_code == 200:
+            write(site_dir, f'{SNAPSHOT_DIR}/{key}.json', response.get_data())
+        elif response.status_code != 204:  # 204: no update, which is what the router answers without a file
+            errors.append((body['output'], [spec['value'] for spec in body['inputs']], response.status_code))
+    return errors
+
+
+def chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+###########################
+# PAGES & STATIC FILES
+###########################
+def write(site_dir, url, content):
+    path = os.path.join(site_dir, *url.lstrip('/').split('/'))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def get(client, url):
+    response = client.get(url)
+    if response.status_code != 200:
+        raise RuntimeError(f"GET {url} answered {response.status_code}")
+    return response.get_data()
+
+
+def fingerprinted(path, fingerprint):
+    """Dash's name for a component package's file, e.g. dash_core_components.v1_15_0m123.min.js"""
+    directory, _, filename = path.rpartition('/')
+    name, extension = filename.split('.', 1)
+    return f"{directory + '/' if directory else ''}{name}.{fingerprint}.{extension}"
+
+
+def static_urls(html):
+    """URL of every file the pages may load from the dashboard."""
+    urls = set()
+    # every file of the component packages, also the ones they only load once they're used,
+    # by their plain & fingerprinted names, the packages ask for their chunks either way
+    fingerprints = dict(FINGERPRINT.findall(html))
+    for package, paths in app.registered_paths.items():
+        package_dir = os.path.dirname(sys.modules[package].__file__)
+        for path in paths:
+            if not os.path.exists(os.path.join(package_dir, path)):
+                continue  # e.g. a source map that isn't shipped
+            urls.add(f'/_dash-component-suites/{package}/{path}')
+            if package in fingerprints:
+                urls.add(f'/_dash-component-suites/{package}/{fingerprinted(path, fingerprints[package])}')
+
+    assets_folder = app.config.assets_folder
+    for directory, _, filenames in os.walk(assets_folder):
+        for filename in filenames:
+            urls.add('/assets/' + os.path.relpath(os.path.join(directory, filename), assets_folder).replace(os.sep, '/'))
+
+    # the plain files of the bundle, static servers don't pick the precompressed ones
+    for filename in os.listdir(static_bundle.BUNDLE_DIR):
+        if not filename.endswith(('.br', '.gz')) and filename != static_bundle.MANIFEST_FILE:
+            urls.add(static_bundle.URL_PREFIX + filename)
+    return sorted(urls)
+
+
+def page_html(client, fallback_url=None):
+    """Dash's page with the router added, the same for every path."""
+    html = get(client, '/').decode('utf-8')
+    config = {'snapshots': f'/{SNAPSHOT_DIR}/', 'fallback': fallback_url}
+    router = (f'<script id="_dash-snapshot-config" type="application/json">{json.dumps(config)}</script>\n'
+              f'<script src="/{SNAPSHOT_DIR}/router.js"></script>\n')
+    return html.replace('</head>', router + '</head>', 1)
+
+
+###########################
+# BUILD
+###########################
+def build(site_dir=SITE_DIR, fallback_url=None, processes=None, max_countries=3, chunk_size=32):
+    """Prerender the site into site_dir, replacing the previous build, returning a summary."""
+    if app.config.requests_pathname_prefix != '/':
+        raise ValueError("The snapshot site is served at the root, build it without a path prefix")
+    if os.path.isdir(site_dir) and os.listdir(site_dir) and not os.path.isdir(os.path.join(site_dir, SNAPSHOT_DIR)):
+        raise ValueError(f"{site_dir} isn't a snapshot site, not replacing it")
+    shutil.rmtree(site_dir, ignore_errors=True)
+    os.makedirs(site_dir)
+
+    # Pages, Dash's JSON & the static files
+    client = server.test_client()
+    html = page_html(client, fallback_url).encode('utf-8')
+    write(site_dir, 'index.html', html)
+    for path in pages.PAGES:
+        write(site_dir, path + '.html', html)
+        write(site_dir, path + '/index.html', html)
+    write(site_dir, '_dash-layout.json', get(client, '/_dash-layout'))
+    write(site_dir, '_dash-dependencies.json', get(client, '/_dash-dependencies'))
+    with open(ROUTER_SOURCE, 'rb') as f:
+        write(site_dir, f'{SNAPSHOT_DIR}/router.js', f.read())
+    urls = static_urls(html.decode('utf-8'))
+    for url in urls:
+        write(site_dir, url, get(client, url))
+
+    # Callback responses, with the data & pages loaded once, the workers inherit them when they fork
+    datastore.load()
+    requests, skipped = callback_requests(pages.snapshot_values(max_countries=max_countries))
+    errors = []
+    if processes == 0:
+        errors = prerender(site_dir, requests)
+    else:
+        with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context("fork")) as pool:
+            futures = [pool.submit(prerender, site_dir, chunk) for chunk in chunks(requests, chunk_size)]
+            for future in futures:
+                errors += future.result()
+    return {'static': len(urls), 'requests': len(requests), 'skipped': skipped, 'errors': errors}
+
+
+def size(directory):
+    return sum(os.path.getsize(os.path.join(path, filename))
+               for path, _, filenames in os.walk(directory) for filename in filenames)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prerender the dashboard into a static site.")
+    parser.add_argument("--site-dir", default=SITE_DIR, help="folder to build the site in, replaced on every build")
+    parser.add_argument("--fallback-url", default=None, help="live dashboard answering what isn't prerendered, ending in /")
+    parser.add_argument("--processes", type=int, default=None, help="worker processes, all cores by default, 0 renders in this process")
+    parser.add_argument("--max-countries", type=int, default=3, help="prerender selections of up to this many countries")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    try:
+        summary = build(args.site_dir, args.fallback_url, args.processes, args.max_countries)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"static files: {summary['static']}")
+    print(f"callback responses: {summary['requests'] - len(summary['errors'])}")
+    for output in summary['skipped']:
+        print(f"    not prerendered, no values for its inputs: {output}")
+    for output, values, status in summary['errors']:
+        print(f"    failed with {status}: {output} {values}")
+    print(f"{size(args.site_dir) / 1024 / 1024:.1f} MB in {time.perf_counter() - start:.1f}s into {args.site_dir}")
+    if summary['errors']:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Stale Callback Requests
+
+Esme Middaugh
+Nele Peshel
+Vivien van Dongen
+
+Skips work for callback requests the browser has already moved past. While
+the date slider is dragged, the browser sends a request for every date it
+passes, and a worker that's still building the figure for one of them gets
+the next few queued up behind it. Only the last one is shown in the end.
+
+assets/request_sequence.js numbers every callback request of a browser tab,
+in the X-Dash-Session & X-Dash-Sequence headers. The newest number seen per
+tab & callback is kept here; a callback registered with drop_callback can
+call check() before its expensive part, which stops the request with a 204
+(Dash's PreventUpdate, the browser keeps what it shows) when a newer request
+for the same callback has arrived since.
+
+Each gunicorn worker only knows the requests it got itself, so this helps
+the most with threaded workers (--threads in the Procfile), where the newer request
+arrives while the older one is still being worked on.
+"""
+
+import threading
+from collections import OrderedDict
+
+import flask
+from dash.exceptions import PreventUpdate
+
+from response_cache import callback_id
+
+SESSION_HEADER = 'X-Dash-Session'
+SEQUENCE_HEADER = 'X-Dash-Sequence'
+
+
+class StaleRequests:
+    """Newest request number per tab & callback, for up to max_sessions tabs & callbacks."""
+
+    def __init__(self, max_sessions=10000):
+        self.max_sessions = max_sessions
+        self.dropped = 0
+        self.callbacks = set()
+        self._latest = OrderedDict()  # (session, callback) -> newest sequence number
+        self._lock = threading.Lock()
+
+    def drop_callback(self, outputs):
+        """Let check() drop stale requests of the callback with these outputs."""
+        self.callbacks.add(callback_id(outputs))
+
+    def init_app(self, server, path='/_dash-update-component'):
+        """Keep track of the request numbers of the registered callbacks on the Flask server."""
+        self.path = path
+        server.before_request(self._before_request)
+
+    def _before_request(self):
+        request = flask.request
+        if request.method != 'POST' or request.path != self.path:
+            return None
+        session = request.headers.get(SESSION_HEADER)
+        try:
+            sequence = int(request.headers.get(SEQUENCE_HEADER, ''))
+        except ValueError:
+            return None  # an older page or another client, never dropped
+        body = request.get_json(silent=True)
+        if not session or not body or body.get('output') not in self.callbacks:
+            return None
+
+        key = (session, body['output'])
+        with self._lock:
+            if sequence > self._latest.get(key, -1):
+                self._latest[key] = sequence
+            self._latest.move_to_end(key)
+            while len(self._latest) > self.max_sessions:
+                self._latest.popitem(last=False)
+        flask.g.stale_request_key = key
+        flask.g.stale_request_sequence = sequence
+        return None
+
+    def is_stale(self):
+        """Whether a newer request for the current request's callback came in from the same tab."""
+        if not flask.has_request_context() or 'stale_request_key' not in flask.g:
+            return False
+        with self._lock:
+            return self._latest.get(flask.g.stale_request_key, -1) > flask.g.stale_request_sequence
+
+    def check(self):
+        """Stop the current request with a 204 if it's stale, see is_stale."""
+        if self.is_stale():
+            with self._lock:
+                self.dropped += 1
+            raise PreventUpdate
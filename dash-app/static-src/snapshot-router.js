@@ -0,0 +1,59 @@
+// Answers the dashboard's callback requests from the responses snapshot_site.py prerendered,
+// so the snapshot site runs from any static file server. Only included in the snapshot site's pages
+(function() {
+    var config = JSON.parse(document.getElementById("_dash-snapshot-config").textContent);
+    var fetch = window.fetch;
+
+    // SHA-256 of the UTF-8 text as hex, the first 32 digits, as snapshot_key in snapshot_site.py.
+    // crypto.subtle only exists on HTTPS & localhost pages, elsewhere nothing is answered from the snapshots
+    var KEY_LENGTH = 32;
+    function hash(text) {
+        if (!window.crypto || !window.crypto.subtle) {
+            return Promise.reject(new Error("the snapshot site needs HTTPS to hash its requests"));
+        }
+        return window.crypto.subtle.digest("SHA-256", new TextEncoder().encode(text)).then(function(digest) {
+            return Array.prototype.map.call(new Uint8Array(digest), function(byte) {
+                return ("0" + byte.toString(16)).slice(-2);
+            }).join("").slice(0, KEY_LENGTH);
+        });
+    }
+
+    function inputValue(input) {
+        // pages are served from <page>/index.html too, which browsers open as /<page>/
+        if (input.id === "url" && input.property === "pathname" && input.value && input.value.length > 1) {
+            return input.value.replace(/\/+$/, "");
+        }
+        return input.value;
+    }
+
+    window.fetch = function(resource, init) {
+        var url = typeof resource === "string" ? resource : (resource && resource.url) || "";
+        var path = url.split("?")[0];
+
+        // stored as .json, so static servers send them with the content type Dash expects
+        if (/_dash-(layout|dependencies)$/.test(path)) {
+            return fetch.call(this, path + ".json", init);
+        }
+        if (!/_dash-update-component$/.test(path)) {
+            return fetch.apply(this, arguments);
+        }
+
+        var payload = JSON.parse(init.body);
+        var key = payload.output + "|" + JSON.stringify(payload.inputs.map(inputValue));
+        var self = this;
+        return hash(key).then(function(name) {
+            return fetch.call(self, config.snapshots + name + ".json");
+        }).catch(function(error) {
+            console.warn(error);
+            return {ok: false};
+        }).then(function(response) {
+            if (response.ok) {
+                return response;
+            }
+            if (config.fallback) {
+                return fetch.call(window, config.fallback + "_dash-update-component", init);
+            }
+            return new Response(null, {status: 204});  // not prerendered, the page stays as it is
+        });
+    };
+})();
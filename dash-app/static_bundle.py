@@ -0,0 +1,297 @@
+"""
+Static Asset Bundle
+
+Esme Middaugh
+Nele Peshel
+Vivien van Dongen
+
+Builds the self-hosted fonts, a single SVG sprite of the term icons, the nav
+script & the food map's geometry into bundle/, each named after a hash of its contents, and serves
+them from there. As a name only ever points to the same bytes, browsers may
+cache the files for good. Every file is also stored brotli & gzip compressed
+at build time, since Flask-Compress leaves file responses alone.
+
+The fonts are downloaded from Google Fonts once into static-src/fonts/ with
+--fetch-fonts, after which the build needs no connection. Until then the
+page keeps linking the Google Fonts stylesheets.
+
+Usage, from the dash-app directory, after changing static-src/, the icons or output-data/terms.csv:
+    python -m static_bundle
+    python -m static_bundle --fetch-fonts  # download the fonts first, needs a connection
+"""
+
+import argparse
+import csv
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import urllib.request
+import xml.etree.ElementTree as ET
+
+import flask
+
+try:
+    import brotli
+except ImportError:  # only needed to build the bundle, gzip is always written
+    brotli = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))  # dash-app
+SOURCE_DIR = os.path.join(BASE_DIR, 'static-src')
+FONT_SOURCE_DIR = os.path.join(SOURCE_DIR, 'fonts')
+TOPOJSON_SOURCE_DIR = os.path.join(SOURCE_DIR, 'topojson')  # written by pipeline/geometry.py
+ICON_DIR = os.path.join(BASE_DIR, 'assets', 'icons')
+TERMS_FILE = os.path.join(BASE_DIR, 'output-data', 'terms.csv')
+BUNDLE_DIR = os.path.join(BASE_DIR, 'bundle')
+MANIFEST_FILE = 'manifest.json'
+
+URL_PREFIX = '/bundle/'
+CACHE_CONTROL = 'public, max-age=31536000, immutable'  # a year, the name changes with the contents
+
+FONT_STYLESHEETS = [
+    'https://fonts.googleapis.com/css?family=Roboto:300,400,700,900|Roboto+Mono|Economica:300,400,700&display=swap',
+    'https://fonts.googleapis.com/css?family=Monoton&display=swap',
+    'https://fonts.googleapis.com/css?family=Playfair+Display:300,400,700,900&display=swap',
+    'https://fonts.googleapis.com/css2?family=Work+Sans:ital,wght@0,100;0,300;0,900;1,100&display=swap',
+]
+FONT_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/87.0 Safari/537.36'  # gets woff2
+
+SVG_NS = 'http://www.w3.org/2000/svg'
+ICON_SIZE = 512  # each icon gets a square cell of the sprite
+
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]  # in order of preference
+
+ET.register_namespace('', SVG_NS)
+mimetypes.add_type('font/woff2', '.woff2')
+
+
+###########################
+# BUILD
+###########################
+def fingerprint(name, content):
+    """navigation.js -> navigation.<first 10 hex of sha256>.js"""
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{hashlib.sha256(content).hexdigest()[:10]}{ext}"
+
+
+def write_bundle_file(name, content, bundle_dir=BUNDLE_DIR, fingerprinted=True):
+    """Write content under its fingerprinted name with compressed copies next to it, returning that name."""
+    filename = fingerprint(name, content) if fingerprinted else name
+    path = os.path.join(bundle_dir, filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+    if not filename.endswith('.woff2'):  # woff2 is compressed already
+        with open(path + '.gz', 'wb') as f:
+            f.write(gzip.compress(content, compresslevel=9, mtime=0))
+        if brotli is not None:
+            with open(path + '.br', 'wb') as f:
+                f.write(brotli.compress(content, quality=11))
+    return filename
+
+
+def read_terms(path=TERMS_FILE):
+    """(term, icon file) pairs of the term catalog."""
+    with open(path, newline='') as f:
+        return [(row['term'], row['icon']) for row in csv.DictReader(f)]
+
+
+def _clean_svg(element):
+    """Copy of element with only SVG elements & attributes, without ids that would clash between icons."""
+    clean = ET.Element(element.tag, {key: value for key, value in element.attrib.items()
+                                     if not key.startswith('{') and key not in ('id', 'data-name')})
+    for child in element:
+        if child.tag.startswith('{' + SVG_NS + '}') and child.tag != f'{{{SVG_NS}}}metadata':
+            clean.append(_clean_svg(child))
+    return clean
+
+
+def build_sprite(terms, icon_dir=ICON_DIR):
+    """
+    One SVG holding every term's icon, stacked in square cells.
+
+    Each icon has a <view> named after its term, so <img src="icons.svg#pasta">
+    shows just the pasta icon while the browser only fetches the sprite once.
+    """
+    sprite = ET.Element(f'{{{SVG_NS}}}svg', {'viewBox': f"0 0 {ICON_SIZE} {ICON_SIZE * len(terms)}"})
+    for i, (term, icon) in enumerate(terms):
+        root = ET.parse(os.path.join(icon_dir, icon)).getroot()
+        y = i * ICON_SIZE
+        ET.SubElement(sprite, f'{{{SVG_NS}}}view', {'id': term, 'viewBox': f"0 {y} {ICON_SIZE} {ICON_SIZE}"})
+        cell = _clean_svg(root)
+        cell.attrib = {'x': '0', 'y': str(y), 'width': str(ICON_SIZE), 'height': str(ICON_SIZE),
+                       'viewBox': root.get('viewBox')}
+        sprite.append(cell)
+    return ET.tostring(sprite, encoding='utf-8')
+
+
+def fetch_fonts(font_dir=FONT_SOURCE_DIR, stylesheets=FONT_STYLESHEETS):
+    """Download the Google Fonts stylesheets & font files into font_dir, pointing the stylesheet at the local files."""
+    os.makedirs(font_dir, exist_ok=True)
+    css = []
+    for stylesheet in stylesheets:
+        request = urllib.request.Request(stylesheet, headers={'User-Agent': FONT_USER_AGENT})
+        with urllib.request.urlopen(request) as response:
+            css.append(response.read().decode('utf-8'))
+    css = '\n'.join(css)
+
+    def download(match):
+        url = match.group(1)
+        with urllib.request.urlopen(url) as response:
+            content = response.read()
+        name = hashlib.sha256(url.encode()).hexdigest()[:16] + os.path.splitext(url)[1]
+        with open(os.path.join(font_dir, name), 'wb') as f:
+            f.write(content)
+        return f"url({name})"
+
+    css = re.sub(r"url\((https://[^)]+)\)", download, css)
+    with open(os.path.join(font_dir, 'fonts.css'), 'w') as f:
+        f.write(css)
+
+
+def build_fonts(font_dir=FONT_SOURCE_DIR, bundle_dir=BUNDLE_DIR):
+    """Bundle the fetched fonts, or return None if they haven't been fetched."""
+    stylesheet = os.path.join(font_dir, 'fonts.css')
+    if not os.path.isfile(stylesheet):
+        return None
+    with open(stylesheet) as f:
+        css = f.read()
+
+    def bundle_font(match):
+        with open(os.path.join(font_dir, match.group(1)), 'rb') as f:
+            return f"url({write_bundle_file('fonts/' + match.group(1), f.read(), bundle_dir)[len('fonts/'):]})"
+
+    css = re.sub(r"url\(([^)/]+)\)", bundle_font, css)
+    return write_bundle_file('fonts/fonts.css', css.encode('utf-8'), bundle_dir)
+
+
+def build_topojson(topojson_dir=TOPOJSON_SOURCE_DIR, bundle_dir=BUNDLE_DIR):
+    """
+    Bundle the map geometry built by pipeline/geometry.py, or return None if there is none.
+
+    Plotly asks for <topojsonURL><scope>_<resolution>m.json, so the files keep
+    their names & the folder they're in is fingerprinted instead.
+    """
+    if not os.path.isdir(topojson_dir):
+        return None
+    files = {}
+    for name in sorted(os.listdir(topojson_dir)):
+        if name.endswith('.json'):
+            with open(os.path.join(topojson_dir, name), 'rb') as f:
+                files[name] = f.read()
+    if not files:
+        return None
+    folder = fingerprint('topojson', b''.join(files.values()))
+    for name, content in files.items():
+        write_bundle_file(f"{folder}/{name}", content, bundle_dir, fingerprinted=False)
+    return folder + '/'
+
+
+def build(bundle_dir=BUNDLE_DIR):
+    """Rebuild the bundle & its manifest of logical to fingerprinted names, removing files no longer in it."""
+    terms = read_terms()
+    with open(os.path.join(SOURCE_DIR, 'navigation.js'), 'rb') as f:
+        navigation = f.read()
+
+    manifest = {
+        'navigation.js': write_bundle_file('navigation.js', navigation, bundle_dir),
+        'icons.svg': write_bundle_file('icons.svg', build_sprite(terms), bundle_dir),
+        'icons': [term for term, _ in terms],
+    }
+    fonts = build_fonts(bundle_dir=bundle_dir)
+    if fonts is not None:
+        manifest['fonts.css'] = fonts
+    topojson = build_topojson(bundle_dir=bundle_dir)
+    if topojson is not None:
+        manifest['topojson'] = topojson
+
+    with open(os.path.join(bundle_dir, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    # Remove earlier builds
+    keep = {MANIFEST_FILE} | {name + suffix for name in manifest.values() if isinstance(name, str)
+                              for suffix in ('', '.gz', '.br')}
+    if fonts is not None:
+        with open(os.path.join(bundle_dir, fonts), encoding='utf-8') as f:
+            keep |= {'fonts/' + name for name in re.findall(r"url\(([^)/]+)\)", f.read())}
+    for folder, _, files in os.walk(bundle_dir, topdown=False):
+        for name in files:
+            path = os.path.relpath(os.path.join(folder, name), bundle_dir).replace(os.sep, '/')
+            if path not in keep and not (topojson and path.startswith(topojson)):
+                os.remove(os.path.join(folder, name))
+        if folder != bundle_dir and not os.listdir(folder):
+            os.rmdir(folder)
+    return manifest
+
+
+###########################
+# SERVE
+###########################
+def load_manifest(bundle_dir=BUNDLE_DIR):
+    """The manifest of the last build, empty if the bundle hasn't been built."""
+    path = os.path.join(bundle_dir, MANIFEST_FILE)
+    if not os.path.isfile(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+manifest = load_manifest()
+
+
+def url(name):
+    """URL of a bundled file by its logical name, e.g. url('navigation.js'), or None if it isn't bundled."""
+    if name not in manifest:
+        return None
+    return URL_PREFIX + manifest[name]
+
+
+def icon_url(term, icon, asset_url):
+    """The term's view of the icon sprite, or its own file through asset_url if the sprite predates the term."""
+    if term in manifest.get('icons', []):
+        return f"{url('icons.svg')}#{term}"
+    return asset_url(f"icons/{icon}")
+
+
+def send_bundle_file(filename):
+    """A bundled file, precompressed in the best encoding the browser accepts, cached for good."""
+    accepted = flask.request.accept_encodings
+    for encoding, suffix in ENCODINGS:
+        if accepted[encoding] and os.path.isfile(os.path.join(BUNDLE_DIR, filename + suffix)):
+            response = flask.send_from_directory(BUNDLE_DIR, filename + suffix,
+                                                 mimetype=mimetypes.guess_type(filename)[0])
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = flask.send_from_directory(BUNDLE_DIR, filename)
+    response.headers.pop('Content-Disposition', None)  # would name the .br / .gz file
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = CACHE_CONTROL
+    return response
+
+
+def init_app(server):
+    """Serve the bundle from URL_PREFIX on the Flask server."""
+    server.add_url_rule(URL_PREFIX + '<path:filename>', 'bundle', send_bundle_file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the fingerprinted static asset bundle.")
+    parser.add_argument("--fetch-fonts", action="store_true", help="download the Google Fonts into static-src/fonts/ first")
+    args = parser.parse_args(argv)
+
+    if args.fetch_fonts:
+        fetch_fonts()
+    built = build()
+    for name in ['navigation.js', 'icons.svg', 'fonts.css', 'topojson']:
+        print(f"{name}: {built.get(name, 'not built')}")
+    if 'fonts.css' not in built:
+        print("The page still loads its fonts from Google Fonts, run with --fetch-fonts once to host them here.")
+    if 'topojson' not in built:
+        print("The food map still loads its geometry from Plotly's CDN, run python -m pipeline.geometry first to host it here.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+from figure_cache import FigureCache
+
+
+def figure(value):
+    return {'data': [{'type': 'scatter', 'y': [value]}], 'layout': {}}
+
+
+def test_hits_are_copies_of_the_stored_figure():
+    cache = FigureCache(1 << 20)
+    cache.put('a', figure(1))
+    hit = cache.get('a')
+    hit['data'][0]['y'] = [2]
+    assert cache.get('a') == figure(1)
+    assert (cache.hits, cache.misses) == (2, 0)
+
+
+def test_builds_from_before_a_clear_are_not_cached():
+    cache = FigureCache(1 << 20)
+
+    def build():
+        cache.clear()  # the data changed while this was being built
+        return figure(1)
+    assert cache.get_or_build('a', build) == figure(1)
+    assert 'a' not in cache
+
+
+def test_warming_stops_once_cleared():
+    cache = FigureCache(1 << 20)
+    built = []
+
+    def build(key):
+        built.append(key)
+        if key == 'b':
+            cache.clear()
+        return figure(key)
+    cache.warm([('a',), ('b',), ('c',)], build)
+    assert built == ['a', 'b']
+    assert len(cache) == 0
+
+
+def test_least_recently_used_are_evicted_over_the_cap():
+    cache = FigureCache(len('{"data": [{"type": "scatter", "y": [1]}], "layout": {}}') * 2)
+    cache.put('a', figure(1))
+    cache.put('b', figure(2))
+    cache.get('a')
+    cache.put('c', figure(3))
+    assert 'a' in cache and 'b' not in cache and 'c' in cache
@@ -0,0 +1,106 @@
+from pipeline.geometry import clip_topology, decode_arcs, encode_arcs, simplify
+
+EXTENT = [0, 50, 10, 60]  # lon_min, lat_min, lon_max, lat_max
+
+
+def topology():
+    """Two squares inside the extent sharing their middle edge, an island with a part far outside & a line outside."""
+    arcs = [
+        [[5, 50], [5, 55], [5, 60]],                        # 0: shared edge, bottom to top
+        [[5, 60], [0, 60], [0, 50], [5, 50]],               # 1: west square's other edges
+        [[5, 50], [10, 50], [10, 60], [5, 60]],             # 2: east square's other edges
+        [[1, 51], [2, 51], [2, 52], [1, 51]],               # 3: island inside
+        [[40, 10], [41, 10], [41, 11], [40, 10]],           # 4: island part far outside
+        [[-50, -20], [-40, -20]],                           # 5: line outside
+    ]
+    return {
+        'type': 'Topology',
+        'bbox': [-50, -20, 41, 60],
+        'objects': {
+            'countries': {'type': 'GeometryCollection', 'geometries': [
+                {'type': 'Polygon', 'arcs': [[0, 1]], 'id': 'WST'},
+                {'type': 'Polygon', 'arcs': [[~0, 2]], 'id': 'EST'},
+                {'type': 'MultiPolygon', 'arcs': [[[3]], [[4]]], 'id': 'ISL'},
+            ]},
+            'coastlines': {'type': 'MultiLineString', 'arcs': [[5]]},
+        },
+        'arcs': arcs,
+    }
+
+
+def rings(geometry, decoded):
+    """Each ring of a polygon as its points, following reversed arcs the other way."""
+    points = []
+    for ring in geometry['arcs']:
+        ring_points = []
+        for index in ring:
+            arc = decoded[index] if index >= 0 else decoded[~index][::-1]
+            ring_points += arc if not ring_points else arc[1:]
+        points.append(ring_points)
+    return points
+
+
+###########################
+# SIMPLIFY
+###########################
+def test_simplify_drops_points_within_tolerance_keeping_ends():
+    points = [[0, 0], [1, 0.001], [2, -0.001], [3, 0]]
+    assert simplify(points, tolerance=0.01) == [[0, 0], [3, 0]]
+
+
+def test_simplify_keeps_points_beyond_tolerance():
+    points = [[0, 0], [1, 0.501], [2, 1], [3, 0]]  # the first bend is within tolerance, the peak isn't
+    assert simplify(points, tolerance=0.01) == [[0, 0], [2, 1], [3, 0]]
+
+
+def test_simplify_keeps_closed_rings():
+    ring = [[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]
+    assert simplify(ring, tolerance=0.01) == ring
+
+
+def test_simplify_leaves_short_arcs_alone():
+    assert simplify([[0, 0], [1, 1]]) == [[0, 0], [1, 1]]
+
+
+###########################
+# CLIP
+###########################
+def test_clip_drops_what_is_outside():
+    clipped = clip_topology(topology(), EXTENT, tolerance=0.01)
+    countries = clipped['objects']['countries']['geometries']
+    assert [geometry['id'] for geometry in countries] == ['WST', 'EST', 'ISL']
+    assert len(countries[2]['arcs']) == 1  # the part far outside is gone
+    assert clipped['objects']['coastlines'] == {'type': 'GeometryCollection', 'geometries': []}
+    assert len(clipped['arcs']) == 4
+    assert clipped['bbox'] == EXTENT
+
+
+def test_clip_keeps_shared_arcs_shared():
+    clipped = clip_topology(topology(), EXTENT, tolerance=0.01)
+    west, east, _ = clipped['objects']['countries']['geometries']
+    assert west['arcs'][0][0] == ~east['arcs'][0][0]
+
+    # the shared edge's middle point is simplified away once, for both squares
+    decoded = decode_arcs(clipped)
+    assert len(decoded[west['arcs'][0][0]]) == 2
+    for geometry in [west, east]:
+        ring = rings(geometry, decoded)[0]
+        assert ring[0] == ring[-1]
+        assert all(0 <= x <= 10 and 50 <= y <= 60 for x, y in ring)
+
+
+def test_clipped_points_stay_within_quantization():
+    clipped = clip_topology(topology(), EXTENT, tolerance=0.01)
+    decoded = decode_arcs(clipped)
+    island = clipped['objects']['countries']['geometries'][2]
+    island = rings(dict(island, arcs=island['arcs'][0]), decoded)[0]
+    step = 10 / 9999  # the kept arcs' extent over the quantization
+    expected = [[1, 51], [2, 51], [2, 52], [1, 51]]
+    assert all(abs(x - ex) <= step and abs(y - ey) <= step for (x, y), (ex, ey) in zip(island, expected))
+
+
+def test_encode_decode_round_trip():
+    arcs = [[[0.0, 50.0], [10.0, 60.0]], [[5.0, 55.0], [5.0, 55.0]]]
+    encoded, transform = encode_arcs(arcs)
+    assert len(encoded[1]) == 2  # arcs keep two points, even collapsed onto one
+    assert decode_arcs({'arcs': encoded, 'transform': transform})[0] == [[0.0, 50.0], [10.0, 60.0]]
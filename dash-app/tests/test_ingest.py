@@ -0,0 +1,59 @@
+import os
+import shutil
+
+from pipeline import ingest, store
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def exports(tmp_path):
+    input_dir = tmp_path / "exports"
+    input_dir.mkdir()
+    shutil.copy(os.path.join(FIXTURES, 'GER_coffee_Kaffee.csv'), input_dir / 'GER_coffee_Kaffee.csv')
+    shutil.copy(os.path.join(FIXTURES, 'GER_coffee_Kaffee.csv'), input_dir / 'NL_coffee_koffie.csv')
+    return input_dir
+
+
+def modified(paths):
+    return {path: os.stat(path).st_mtime_ns for path in paths}
+
+
+def test_only_changed_partitions_are_rewritten(tmp_path):
+    input_dir = exports(tmp_path)
+    output_dir = tmp_path / "output" / "not-there-yet"
+    summary = ingest.ingest(str(input_dir), str(output_dir))
+    assert sorted(summary["added"]) == ['GER_coffee_Kaffee.csv', 'NL_coffee_koffie.csv']
+
+    ger = [output_dir / ingest.PARTITION_DIR / 'ger_coffee.csv', output_dir / 'store' / store.TRENDS_DIR / 'ger.feather']
+    nl = [output_dir / ingest.PARTITION_DIR / 'nl_coffee.csv', output_dir / 'store' / store.TRENDS_DIR / 'nl.feather']
+    before = modified(ger + nl)
+
+    summary = ingest.ingest(str(input_dir), str(output_dir))
+    assert summary["added"] == summary["changed"] == []
+    assert modified(ger + nl) == before
+
+    with open(input_dir / 'NL_coffee_koffie.csv') as f:
+        lines = f.read().splitlines()
+    lines[-1] = lines[-1].split(",")[0] + ",1"
+    with open(input_dir / 'NL_coffee_koffie.csv', 'w') as f:
+        f.write("\n".join(lines) + "\n")
+    summary = ingest.ingest(str(input_dir), str(output_dir))
+    assert summary["changed"] == ['NL_coffee_koffie.csv']
+    assert modified(ger) == {path: before[path] for path in ger}
+    assert all(modified(nl)[path] != before[path] for path in nl)
+    assert store.read_trends(str(output_dir / 'store'), countries=['nl']).score.iloc[-1] == 1
+
+    os.remove(input_dir / 'NL_coffee_koffie.csv')
+    summary = ingest.ingest(str(input_dir), str(output_dir))
+    assert summary["removed"] == ['NL_coffee_koffie.csv']
+    assert not any(os.path.exists(path) for path in nl)
+    assert store.trends_partitions(str(output_dir / 'store')) == ['ger']
+
+
+def test_combined_csvs_only_on_request(tmp_path):
+    input_dir = exports(tmp_path)
+    ingest.ingest(str(input_dir), str(tmp_path))
+    assert not os.path.exists(tmp_path / ingest.DIFFERENCE_FILE)
+    ingest.ingest(str(input_dir), str(tmp_path), combined=True)
+    with open(tmp_path / ingest.DIFFERENCE_FILE) as f:
+        assert len(f.read().splitlines()) == 1 + 2 * 53
@@ -0,0 +1,126 @@
+import threading
+import time
+
+import flask
+import pytest
+
+from response_cache import ResponseCache
+
+
+def server(cache, version, on_change, answer=None):
+    app = flask.Flask(__name__)
+    calls = []
+
+    @app.route('/_dash-update-component', methods=['POST'])
+    def update():
+        calls.append(flask.request.get_json())
+        if answer is not None:
+            return answer()
+        return flask.jsonify(response={'graph': {'figure': len(calls)}})
+
+    cache.callbacks.add('graph.figure')
+    cache.init_app(app, lambda: version[0], check_interval=0, on_change=on_change)
+    return app.test_client(), calls
+
+
+def post(client, etag=None):
+    headers = {'If-None-Match': f'"{etag}"'} if etag else {}
+    return client.post('/_dash-update-component', json={'output': 'graph.figure', 'inputs': [{'value': 1}]}, headers=headers)
+
+
+def test_repeats_are_answered_from_the_cache():
+    client, calls = server(ResponseCache(1 << 20), ['a'], None)
+    first = post(client)
+    assert post(client).get_data() == first.get_data()
+    assert post(client, first.get_etag()[0]).status_code == 304
+    assert len(calls) == 1
+
+
+def test_new_data_version_empties_the_cache_and_changes_etags():
+    version, reloads = ['a'], []
+    cache = ResponseCache(1 << 20)
+    client, calls = server(cache, version, lambda: reloads.append(cache.version))
+    etag = post(client).get_etag()[0]
+
+    version[0] = 'b'
+    response = post(client, etag)
+    assert response.status_code == 200  # not a 304 for what was built from the old data
+    assert response.get_etag()[0] != etag
+    assert len(calls) == 2
+    assert reloads == ['a']  # reloaded before the new version's keys are used
+    assert cache.version == 'b' and cache.version_changes == 1
+
+    post(client)
+    assert len(calls) == 2 and reloads == ['a']
+
+
+def test_version_is_checked_only_every_interval():
+    version, reloads = ['a'], []
+    cache = ResponseCache(1 << 20)
+    client, calls = server(cache, version, lambda: reloads.append(cache.version))
+    cache.check_interval = 3600
+    post(client)
+    version[0] = 'b'
+    post(client)
+    assert len(calls) == 1 and reloads == []
+
+
+def test_identical_requests_in_flight_are_answered_once():
+    release = threading.Event()
+    cache = ResponseCache(1 << 20)
+
+    def answer():
+        release.wait(5)
+        return flask.jsonify(response={'graph': {'figure': 1}})
+    client, calls = server(cache, ['a'], None, answer)
+
+    responses = []
+    threads = [threading.Thread(target=lambda: responses.append(post(client))) for _ in range(2)]
+    threads[0].start()
+    while not calls:
+        time.sleep(0.01)
+    threads[1].start()
+    while not cache.coalesced:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert [response.status_code for response in responses] == [200, 200]
+    assert responses[0].get_data() == responses[1].get_data()
+
+
+def fail():
+    raise RuntimeError('the callback failed')
+
+
+@pytest.mark.parametrize('failure, status', [
+    (lambda: flask.Response(status=204), 204),  # e.g. dropped as stale
+    (fail, 500),
+])
+def test_waiters_answer_themselves_when_nothing_was_cached(failure, status):
+    release = threading.Event()
+    cache = ResponseCache(1 << 20)
+
+    def answer():
+        if len(calls) == 1:  # the leader
+            release.wait(5)
+            return failure()
+        return flask.jsonify(response={'graph': {'figure': 2}})
+    client, calls = server(cache, ['a'], None, answer)
+
+    responses = []
+    threads = [threading.Thread(target=lambda: responses.append(post(client))) for _ in range(2)]
+    threads[0].start()
+    while not calls:
+        time.sleep(0.01)
+    threads[1].start()
+    while not cache.coalesced:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 2
+    assert sorted(response.status_code for response in responses) == [200, status]
+    assert post(client).get_json() == {'response': {'graph': {'figure': 2}}}  # the waiter's answer was cached
+    assert len(calls) == 2
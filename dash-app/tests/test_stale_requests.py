@@ -0,0 +1,88 @@
+import threading
+import time
+
+import flask
+from dash.exceptions import PreventUpdate
+
+from stale_requests import SEQUENCE_HEADER, SESSION_HEADER, StaleRequests
+
+
+def server(stale):
+    """A server whose callback waits for its release, checking for newer requests before answering."""
+    app = flask.Flask(__name__)
+    calls, release = [], threading.Event()
+
+    @app.route('/_dash-update-component', methods=['POST'])
+    def update():
+        calls.append(flask.request.get_json())
+        release.wait(5)
+        stale.check()
+        return flask.jsonify(response={'graph': {'figure': 1}})
+
+    @app.errorhandler(PreventUpdate)
+    def prevent_update(_):
+        return '', 204  # as Dash answers it
+
+    stale.callbacks.add('graph.figure')
+    stale.init_app(app)
+    return app.test_client(), calls, release
+
+
+def post(client, session='tab', sequence=None, output='graph.figure'):
+    headers = {SESSION_HEADER: session} if session else {}
+    if sequence is not None:
+        headers[SEQUENCE_HEADER] = str(sequence)
+    return client.post('/_dash-update-component', json={'output': output, 'inputs': [{'value': 1}]}, headers=headers)
+
+
+def overtaken(client, calls, release, older, newer):
+    """Status codes of the older request, held in its callback while the newer one arrives, & the newer one."""
+    responses = {}
+    first = threading.Thread(target=lambda: responses.update(older=post(client, **older)))
+    first.start()
+    while not calls:
+        time.sleep(0.01)
+    second = threading.Thread(target=lambda: responses.update(newer=post(client, **newer)))
+    second.start()
+    while len(calls) < 2:
+        time.sleep(0.01)
+    release.set()
+    first.join()
+    second.join()
+    return responses['older'].status_code, responses['newer'].status_code
+
+
+def test_older_requests_are_dropped():
+    stale = StaleRequests()
+    client, calls, release = server(stale)
+    assert overtaken(client, calls, release, dict(sequence=1), dict(sequence=2)) == (204, 200)
+    assert stale.dropped == 1
+
+
+def test_other_tabs_and_callbacks_are_not_dropped():
+    stale = StaleRequests()
+    client, calls, release = server(stale)
+    assert overtaken(client, calls, release, dict(sequence=1), dict(session='other', sequence=2)) == (200, 200)
+    calls.clear()
+    release.clear()
+    assert overtaken(client, calls, release, dict(sequence=3, output='other.figure'), dict(sequence=4)) == (200, 200)
+    assert stale.dropped == 0
+
+
+def test_requests_without_sequence_numbers_are_never_dropped():
+    stale = StaleRequests()
+    client, calls, release = server(stale)
+    for older in [dict(sequence=None), dict(sequence='abc'), dict(session=None, sequence=1)]:
+        calls.clear()
+        release.clear()
+        assert overtaken(client, calls, release, older, dict(sequence=100)) == (200, 200)
+    assert stale.dropped == 0
+
+
+def test_only_the_most_recent_tabs_are_kept():
+    stale = StaleRequests(max_sessions=2)
+    client, calls, release = server(stale)
+    release.set()
+    for session in ['a', 'b', 'a', 'c']:
+        post(client, session=session, sequence=1)
+    assert list(stale._latest) == [('a', 'graph.figure'), ('c', 'graph.figure')]
@@ -0,0 +1,52 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from pipeline import store
+
+
+def test_rewriting_a_table_leaves_mapped_readers_alone(tmp_path):
+    store.write_table(pd.DataFrame({"score": np.arange(5, dtype="int8")}), "table.feather", str(tmp_path))
+    mapped = store.read_table("table.feather", str(tmp_path))
+    store.write_table(pd.DataFrame({"score": np.zeros(2, dtype="int8")}), "table.feather", str(tmp_path))
+
+    assert mapped.score.tolist() == [0, 1, 2, 3, 4]
+    assert store.read_table("table.feather", str(tmp_path)).score.tolist() == [0, 0]
+    assert os.listdir(tmp_path) == ["table.feather"]  # no temporary files left over
+
+
+def test_version_changes_with_the_tables(tmp_path):
+    store.write_table(pd.DataFrame({"score": [1]}), "table.feather", str(tmp_path))
+    first = store.write_version(str(tmp_path))
+    store.write_table(pd.DataFrame({"score": [2]}), "table.feather", str(tmp_path))
+    assert store.write_version(str(tmp_path)) != first
+    assert store.read_version(str(tmp_path)) == store.compute_version(str(tmp_path))
+
+
+def test_country_means_match_the_series_means(tmp_path, monkeypatch):
+    import datastore
+
+    rows = [  # the 8th only ger has data for, coffee only nl
+        ("2020-03-01", "ger", "toiletpaper", 10), ("2020-03-01", "nl", "toiletpaper", -3),
+        ("2020-03-01", "ger", "baking", 7), ("2020-03-01", "nl", "baking", 4),
+        ("2020-03-01", "nl", "coffee", 5),
+        ("2020-03-08", "ger", "toiletpaper", 2), ("2020-03-08", "ger", "baking", -9),
+        ("2020-03-15", "ger", "baking", 1), ("2020-03-15", "nl", "baking", 2),
+        ("2020-03-15", "nl", "coffee", -6),
+    ]
+    difference = pd.DataFrame(rows, columns=["date", "country", "term", "score_difference"])
+    store.write_trends(difference.assign(translated_term=difference.term, score=50), str(tmp_path))
+    monkeypatch.setattr(datastore, "STORE_DIR", str(tmp_path))
+    monkeypatch.setattr(datastore, "_cache", {})
+
+    for start in [None, "2020-03-08"]:
+        series = datastore.get_country_series(["ger", "nl"], start=start)
+        expected = series.groupby(["date", "term"], observed=True).score_difference.mean().reset_index()
+        expected = expected.assign(display_term=expected.term.astype(str).map(datastore.DISPLAY_TERMS))
+
+        means = datastore.get_country_means(["ger", "nl"], start=start).dropna()
+        means = means.assign(display_term=means.display_term.astype(str))
+        columns = ["date", "display_term", "score_difference"]
+        pd.testing.assert_frame_equal(means[columns].sort_values(columns[:2], ignore_index=True),
+                                      expected[columns].sort_values(columns[:2], ignore_index=True))
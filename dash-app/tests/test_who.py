@@ -0,0 +1,43 @@
+import os
+
+import pandas as pd
+import pytest
+
+from pipeline import store, who
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+WHO_FILE = os.path.join(FIXTURES, 'WHO-COVID-19-global-data.csv')  # tab separated & latin-1, like the WHO's
+
+
+def population(tmp_path):
+    path = tmp_path / "population.csv"
+    path.write_text("Country_code,Country,Inhabitants\nDE,Germany,83902745\nNA,Namibia,2540905\n")
+    return str(path)
+
+
+def test_reads_every_country_by_default():
+    data = who.read_who(WHO_FILE, chunksize=2)
+    assert list(data.columns) == ["date", "Country_code", "New_cases"]
+    assert sorted(data["Country_code"].unique()) == ["CW", "DE", "NA", "NL"]
+    assert len(data) == 7
+
+
+def test_keeps_namibia_and_strips_headers():
+    data = who.read_who(WHO_FILE, ["NA", "DE"], chunksize=3)  # chunks splitting the countries
+    assert data["Country_code"].tolist() == ["DE", "DE", "NA", "NA"]
+    assert data["date"].tolist() == [pd.Timestamp("2020-01-03"), pd.Timestamp("2020-01-04")] * 2
+    assert data["New_cases"].tolist() == [0, 16781, 0, 250]
+
+
+def test_normalizes_per_100k(tmp_path):
+    stored = who.ingest_who(WHO_FILE, population(tmp_path), store_dir=str(tmp_path / "store"))
+    namibia = stored[stored["Country_code"] == "NA"]
+    assert namibia["Country"].tolist() == ["Namibia", "Namibia"]
+    assert namibia["Nom_new_cases"].tolist() == [0.0, round(250 / 2540905 * 100000)]
+    assert stored.loc[stored["Country_code"] == "DE", "Nom_new_cases"].tolist() == [0.0, 20.0]
+    assert len(store.read_who(str(tmp_path / "store"))) == 4
+
+
+def test_unknown_country_raises(tmp_path):
+    with pytest.raises(ValueError, match="NL"):
+        who.ingest_who(WHO_FILE, population(tmp_path), ["NL"], store_dir=str(tmp_path / "store"))
@@ -0,0 +1,62 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pipeline.ingest import read_export
+from pipeline.year_change import year_change
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def weekly(dates, scores, country="ger", term="coffee"):
+    return pd.DataFrame({"date": pd.to_datetime(dates), "score": scores, "country": country, "term": term})
+
+
+def test_week_53_compares_with_prior_week_52():
+    # Sundays, as Google Trends reports them: 2020 has an ISO week 53, 2019 doesn't
+    data = weekly(["2019-12-29", "2021-01-03"], [40, 60])
+    assert year_change(data).score_difference[1] == 20.0
+
+
+def test_real_week_53_isnt_taken_for_a_duplicate():
+    # 2020 weeks 52 & 53, both a year before 2021, which has no week 53 to compare
+    data = weekly(["2020-12-27", "2021-01-03", "2022-01-02"], [30, 40, 55])
+    assert year_change(data).score_difference[2] == 25.0
+
+
+def test_week_53_left_empty_without_fallback():
+    data = weekly(["2019-12-29", "2021-01-03"], [40, 60])
+    assert year_change(data, week_53=None).score_difference.isna().all()
+
+
+def test_missing_prior_week_gives_nan():
+    data = weekly(["2019-03-03", "2020-03-01", "2020-03-08"], [10, 15, 20])
+    result = year_change(data)
+    assert result.score_difference[1] == 5.0
+    assert np.isnan(result.score_difference[2])  # no 2019 week 10
+
+
+def test_series_are_matched_separately():
+    data = pd.concat([weekly(["2019-03-03", "2020-03-01"], [10, 15]),
+                      weekly(["2019-03-03", "2020-03-01"], [30, 20], country="nl")], ignore_index=True)
+    assert year_change(data).score_difference.tolist()[1::2] == [5.0, -10.0]
+
+
+def test_duplicated_weeks_raise():
+    data = weekly(["2019-03-03", "2019-03-03", "2020-03-01"], [10, 11, 15])
+    with pytest.raises(pd.errors.MergeError):
+        year_change(data)
+
+
+def test_unknown_week_53_option_raises():
+    with pytest.raises(ValueError):
+        year_change(weekly(["2020-03-01"], [1]), week_53="week_1")
+
+
+def test_matches_difference_csv():
+    data = year_change(read_export(os.path.join(FIXTURES, 'GER_coffee_Kaffee.csv')))
+    data = data[data.score_difference.notna()].reset_index(drop=True)
+    expected = pd.read_csv(os.path.join(FIXTURES, 'ger-coffee-difference.csv'), parse_dates=["date"])
+    pd.testing.assert_frame_equal(data[expected.columns], expected, check_dtype=False)